@@ -0,0 +1,224 @@
+import argparse
+import json
+import sqlite3
+import time
+
+from export_io import ExportReader
+
+ARCHIVE_BATCH_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dialogs (
+    dialog_id INTEGER PRIMARY KEY,
+    name TEXT,
+    username TEXT,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    rowid INTEGER PRIMARY KEY,
+    dialog_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    date TEXT,
+    date_timestamp REAL,
+    from_me INTEGER,
+    sender_name TEXT,
+    text TEXT,
+    media_type TEXT,
+    media_caption TEXT,
+    reply_to INTEGER,
+    forward_from TEXT,
+    edit_date TEXT,
+    file_name TEXT,
+    file_size INTEGER,
+    UNIQUE (dialog_id, id)
+);
+
+CREATE INDEX IF NOT EXISTS messages_dialog_date ON messages (dialog_id, date_timestamp);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, media_caption, file_name,
+    content='messages', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text, media_caption, file_name)
+    VALUES (new.rowid, new.text, new.media_caption, new.file_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text, media_caption, file_name)
+    VALUES ('delete', old.rowid, old.text, old.media_caption, old.file_name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text, media_caption, file_name)
+    VALUES ('delete', old.rowid, old.text, old.media_caption, old.file_name);
+    INSERT INTO messages_fts (rowid, text, media_caption, file_name)
+    VALUES (new.rowid, new.text, new.media_caption, new.file_name);
+END;
+"""
+
+# re-exported messages replace the stored row, so archiving the same
+# dialog twice (or resuming from a checkpoint) never duplicates anything
+UPSERT_MESSAGE = """
+INSERT INTO messages (dialog_id, id, date, date_timestamp, from_me, sender_name, text, media_type,
+                      media_caption, reply_to, forward_from, edit_date, file_name, file_size)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (dialog_id, id) DO UPDATE SET
+    date = excluded.date, date_timestamp = excluded.date_timestamp, from_me = excluded.from_me,
+    sender_name = excluded.sender_name, text = excluded.text, media_type = excluded.media_type,
+    media_caption = excluded.media_caption, reply_to = excluded.reply_to,
+    forward_from = excluded.forward_from, edit_date = excluded.edit_date,
+    file_name = excluded.file_name, file_size = excluded.file_size
+"""
+
+
+class MessageArchive:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add_dialog(self, export_info):
+        other_user = next(p for p in export_info['dialog_participants'] if not p['is_me'])
+        with self.conn:
+            self.conn.execute(
+                'INSERT INTO dialogs (dialog_id, name, username, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (dialog_id) DO UPDATE SET name = excluded.name, '
+                'username = excluded.username, updated_at = excluded.updated_at',
+                (other_user['user_id'], other_user['name'], other_user['username'], export_info['exported_at'])
+            )
+        return other_user['user_id']
+
+    def add_messages(self, dialog_id, records):
+        rows = [_message_row(dialog_id, record) for record in records]
+        with self.conn:
+            self.conn.executemany(UPSERT_MESSAGE, rows)
+        return len(rows)
+
+    def sink(self, export_info, batch_size=ARCHIVE_BATCH_SIZE):
+        return ArchiveSink(self, self.add_dialog(export_info), batch_size)
+
+    def import_export(self, filename, batch_size=ARCHIVE_BATCH_SIZE):
+        reader = ExportReader(filename)
+        sink = self.sink(reader.header(), batch_size)
+        for message in reader.iter_messages():
+            sink.write_message(message)
+        return sink.close()
+
+    def search(self, query, dialog_id=None, limit=50):
+        sql = (
+            "SELECT m.dialog_id, d.name, m.id, m.date, m.sender_name, "
+            "snippet(messages_fts, -1, '[', ']', '…', 12) "
+            "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid "
+            "LEFT JOIN dialogs d ON d.dialog_id = m.dialog_id "
+            "WHERE messages_fts MATCH ?"
+        )
+        params = [query]
+        if dialog_id is not None:
+            sql += " AND m.dialog_id = ?"
+            params.append(dialog_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def stats(self):
+        dialogs = self.conn.execute('SELECT COUNT(*) FROM dialogs').fetchone()[0]
+        messages = self.conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        return {'dialogs': dialogs, 'messages': messages}
+
+
+class ArchiveSink:
+    # collects records from the export loop and writes them in batched transactions
+    def __init__(self, archive, dialog_id, batch_size=ARCHIVE_BATCH_SIZE):
+        self.archive = archive
+        self.dialog_id = dialog_id
+        self.batch_size = batch_size
+        self.count = 0
+        self._pending = []
+
+    def write_message(self, record):
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.count += self.archive.add_messages(self.dialog_id, self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        return self.count
+
+
+def _message_row(dialog_id, record):
+    forward_from = record.get('forward_from')
+    return (
+        dialog_id,
+        record['id'],
+        record.get('date'),
+        record.get('date_timestamp'),
+        1 if record.get('from_me') else 0,
+        record.get('sender_name'),
+        record.get('text') or '',
+        record.get('media_type'),
+        record.get('media_caption') or '',
+        record.get('reply_to'),
+        json.dumps(forward_from, ensure_ascii=False) if forward_from else None,
+        record.get('edit_date'),
+        record.get('file_name') or '',
+        record.get('file_size')
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Архив диалогов в SQLite с полнотекстовым поиском')
+    parser.add_argument('--db', default='archive.sqlite3', help='файл базы архива')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='загрузить JSON/NDJSON экспорты в архив')
+    import_parser.add_argument('files', nargs='+')
+
+    search_parser = subparsers.add_parser('search', help='поиск по всем диалогам (синтаксис FTS5)')
+    search_parser.add_argument('query')
+    search_parser.add_argument('--dialog', type=int, help='искать только в диалоге с этим user_id')
+    search_parser.add_argument('--limit', type=int, default=50)
+
+    subparsers.add_parser('stats', help='размер архива')
+
+    args = parser.parse_args(argv)
+    archive = MessageArchive(args.db)
+    try:
+        if args.command == 'import':
+            for filename in args.files:
+                started = time.perf_counter()
+                count = archive.import_export(filename)
+                print(f"✅ {filename}: {count} сообщений за {time.perf_counter() - started:.1f} сек")
+        elif args.command == 'search':
+            started = time.perf_counter()
+            try:
+                rows = archive.search(args.query, args.dialog, args.limit)
+            except sqlite3.OperationalError as e:
+                print(f"❌ Ошибка в запросе: {e}")
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            for dialog_id, name, message_id, date, sender_name, snippet in rows:
+                print(f"{date} | {name or dialog_id} | #{message_id} {sender_name}: {snippet}")
+            print(f"🔍 Найдено: {len(rows)} ({elapsed_ms:.1f} мс)")
+        else:
+            stats = archive.stats()
+            print(f"📚 Диалогов: {stats['dialogs']}, сообщений: {stats['messages']}")
+    finally:
+        archive.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import main
+from export_io import COMPRESSIONS, ExportReader, export_extension
+from fake_client import FakeTelegramClient
+from html_render import output_files
+from metrics import current_rss, files_size, peak_rss, reset_peak_rss
+
+# Offline throughput benchmark: exports one synthetic dialog from
+# FakeTelegramClient and times each stage separately. Results are written as
+# JSON so runs of different versions can be compared with --compare.
+# --startup instead times the cold start of the offline subcommands of
+# main.py against STARTUP_BUDGET_MS, --rate-limit the streaming export
+# against a server that allows that many requests per second.
+
+# python main.py <command> --help imports everything the command needs and
+# exits before doing any work
+STARTUP_COMMANDS = ('render', 'stats', 'search', 'archive', 'merge', 'serve', 'columns')
+STARTUP_BUDGET_MS = 150
+# imported by one of these commands at startup is a regression whatever the time
+STARTUP_FORBIDDEN_MODULES = ('telethon', 'numpy')
+
+
+class StageTimer:
+    def __init__(self, messages, verbose=False):
+        self.messages = messages
+        self.verbose = verbose
+        self.results = {}
+        self.devnull = open(os.devnull, 'w')
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        gc.collect()
+        result = {'rss_start_bytes': current_rss(), 'peak_rss_reset': reset_peak_rss()}
+        output = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(self.devnull)
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        with output:
+            yield result
+        elapsed = time.perf_counter() - started
+        result.update({
+            'seconds': round(elapsed, 4),
+            'cpu_seconds': round(time.process_time() - cpu_started, 4),
+            'messages': self.messages,
+            'messages_per_second': round(self.messages / elapsed, 1) if elapsed else None,
+            'peak_rss_bytes': peak_rss()
+        })
+        # bytes_written / bytes_read are set by the stage itself
+        size = result.get('bytes_written') or result.get('bytes_read')
+        if size and elapsed:
+            result['megabytes_per_second'] = round(size / 2**20 / elapsed, 1)
+        self.results[name] = result
+        line = (f"⏱ {name:<24} {elapsed:8.2f} сек  {result['messages_per_second'] or 0:>12,.0f} сообщ/сек  "
+                f"пик RSS {(result['peak_rss_bytes'] or 0) / 2**20:8.1f} МБ")
+        if size:
+            line += f"  {size / 2**20:8.1f} МБ ({result.get('megabytes_per_second', 0):.1f} МБ/сек)"
+        print(line)
+
+
+async def run_benchmark(args):
+    client = FakeTelegramClient(
+        dialogs=1, messages_per_dialog=args.messages, latency=args.latency, chunk_size=args.chunk_size,
+        seed=args.seed, text_words=(args.min_words, args.max_words), media_rate=args.media_rate,
+        forward_rate=args.forward_rate, edit_rate=args.edit_rate, reply_rate=args.reply_rate
+    )
+    workdir = tempfile.mkdtemp(prefix='dialog_bench_')
+    os.chdir(workdir)
+    main.CHECKPOINT_FILE = os.path.join(workdir, 'export_checkpoints.json')
+    main.DIALOG_CACHE_FILE = os.path.join(workdir, 'dialogs_cache.json')
+    main.DOWNLOAD_MEDIA = False
+    main.ARCHIVE_DB = None
+    main.COLUMNAR_EXPORT = False
+    main.COMPACT_JSON = args.compact
+    main.EXPORT_COMPRESSION = args.compression
+    main.EXPORT_COMPRESSION_LEVEL = args.level
+    main.FAST_JSON_ENCODER = not args.no_fast_json
+
+    exporter = main.TelegramDialogExporter(client=client)
+    timer = StageTimer(args.messages, args.verbose)
+    with contextlib.redirect_stdout(timer.devnull):
+        await exporter.authenticate()
+    entity = client.users[0]
+
+    # the streaming path first, before the buffered stages hold a whole
+    # dialog in memory
+    if 'export_dialog_stream' in args.stages:
+        extension = export_extension(args.format, args.compression)
+        with timer.stage('export_dialog_stream') as result:
+            stream = await exporter.export_dialog_stream(entity, filename=f'stream.{extension}',
+                                                         fmt=args.format, incremental=False)
+            result['bytes_written'] = files_size([stream['filename']]) if stream else None
+        if 'read_export' in args.stages and stream:
+            # decompress and parse every record, the cost of each later pass over the file
+            with timer.stage('read_export') as result:
+                count = sum(1 for _ in ExportReader(stream['filename']).iter_messages())
+                result['bytes_read'] = files_size([stream['filename']])
+            result['records_read'] = count
+        if 'create_html_from_export' in args.stages and stream:
+            with timer.stage('create_html_from_export') as result:
+                html_filename = exporter.create_html_from_export(stream['filename'])
+                result['bytes_written'] = files_size(output_files(html_filename)) if html_filename else None
+
+    data = None
+    if {'export_dialog', 'save_to_json', 'create_html_page'} & set(args.stages):
+        with timer.stage('export_dialog'):
+            data = await exporter.export_dialog(entity)
+    if data and 'save_to_json' in args.stages:
+        with timer.stage('save_to_json') as result:
+            json_filename = exporter.save_to_json(data, f"buffered.{export_extension('json', args.compression)}")
+            result['bytes_written'] = files_size([json_filename]) if json_filename else None
+    if data and 'create_html_page' in args.stages:
+        with timer.stage('create_html_page') as result:
+            html_filename = exporter.create_html_page(data, 'buffered.json')
+            result['bytes_written'] = files_size(output_files(html_filename)) if html_filename else None
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return timer.results, exporter.metrics.totals()
+
+
+async def run_rate_limit_benchmark(args):
+    # the same dialog and server in each scenario; the *_learned ones start
+    # from the rate profile the run before them left behind. Short and long
+    # dialogs are both measured: learning costs a short run what it saves a
+    # long one, and a profile must not make either slower
+    scenarios = (
+        ('default', False, False),
+        ('bulk', True, False),
+        ('bulk_learned', True, False),
+        ('takeout', True, True),
+        ('takeout_learned', True, True)
+    )
+    workdir = tempfile.mkdtemp(prefix='dialog_bench_')
+    os.chdir(workdir)
+    main.CHECKPOINT_FILE = os.path.join(workdir, 'export_checkpoints.json')
+    main.DIALOG_CACHE_FILE = os.path.join(workdir, 'dialogs_cache.json')
+    main.DOWNLOAD_MEDIA = False
+    main.ARCHIVE_DB = None
+    main.COLUMNAR_EXPORT = False
+    main.EXPORT_STATISTICS = False
+
+    results = {}
+    for messages in sorted({args.short_messages, args.messages}):
+        print(f"📏 Диалог из {messages} сообщений")
+        # every length learns from scratch
+        main.RATE_PROFILE_FILE = os.path.join(workdir, f'rate_profile_{messages}.json')
+        timer = StageTimer(messages, args.verbose)
+        seconds = {}
+        for name, bulk, takeout in scenarios:
+            client = FakeTelegramClient(
+                dialogs=1, messages_per_dialog=messages, latency=args.latency, seed=args.seed,
+                text_words=(args.min_words, args.max_words), max_requests_per_second=args.rate_limit,
+                flood_seconds=args.flood_seconds, takeout_requests_per_second=args.takeout_rate_limit
+            )
+            main.BULK_DOWNLOAD = bulk
+            main.TAKEOUT_EXPORT = takeout
+            exporter = main.TelegramDialogExporter(client=client)
+            with contextlib.redirect_stdout(timer.devnull):
+                await exporter.authenticate()
+            with timer.stage(name) as result:
+                await exporter.export_dialog_stream(client.users[0], filename=f'{name}_{messages}.json',
+                                                    incremental=False)
+            with contextlib.redirect_stdout(timer.devnull):
+                await exporter.close()
+            result.update({'requests': client.requests, 'flood_waits': client.floods})
+            if exporter.bulk_limiter:
+                result['pace'] = exporter.bulk_limiter.state()
+            results[f'{name}_{messages}'] = result
+            seconds[name] = result['seconds']
+            print(f"   {'':<24} запросов {client.requests}, FloodWait {client.floods}")
+        for learned, baseline in (('bulk_learned', 'bulk'), ('bulk_learned', 'default'),
+                                  ('takeout_learned', 'takeout')):
+            if seconds[learned] > seconds[baseline]:
+                print(f"⚠️ {learned} медленнее {baseline}: {seconds[learned]:.2f} сек против "
+                      f"{seconds[baseline]:.2f} сек")
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_milliseconds(command):
+    started = time.perf_counter()
+    subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def measure_startup(commands, runs, budget_ms):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    interpreter_ms = min(_run_milliseconds([sys.executable, '-c', 'pass']) for _ in range(runs))
+    print(f"⏱ {'python -c pass':<24} {interpreter_ms:8.1f} мс")
+    results = {}
+    for command in commands:
+        # the best of several runs, the rest is scheduling noise
+        milliseconds = min(_run_milliseconds([sys.executable, script, command, '--help']) for _ in range(runs))
+        trace = subprocess.run([sys.executable, '-X', 'importtime', script, command, '--help'],
+                               capture_output=True, text=True, check=True).stderr
+        modules = {line.rsplit('|', 1)[-1].strip() for line in trace.splitlines() if line.startswith('import time:')}
+        forbidden = [name for name in STARTUP_FORBIDDEN_MODULES if name in modules]
+        results[command] = {
+            'milliseconds': round(milliseconds, 1),
+            'imports_milliseconds': round(milliseconds - interpreter_ms, 1),
+            'modules': len(modules),
+            'forbidden_modules': forbidden,
+            'within_budget': milliseconds <= budget_ms and not forbidden
+        }
+        marker = '  ' if results[command]['within_budget'] else '⚠️'
+        line = f"{marker} {'main.py ' + command:<23} {milliseconds:8.1f} мс  модулей {len(modules):4d}"
+        if forbidden:
+            line += f"  импортирует {', '.join(forbidden)}"
+        print(line)
+    return {'interpreter_milliseconds': round(interpreter_ms, 1), 'budget_milliseconds': budget_ms,
+            'commands': results}
+
+
+def compare(results, baseline_filename, tolerance):
+    with open(baseline_filename, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)['stages']
+    regressions = []
+    print(f"\n📊 Сравнение с {baseline_filename}:")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get('messages_per_second') or not result['messages_per_second']:
+            continue
+        change = result['messages_per_second'] / before['messages_per_second'] - 1
+        marker = '⚠️' if change < -tolerance else '  '
+        print(f"{marker} {name:<24} {before['messages_per_second']:>12,.0f} -> "
+              f"{result['messages_per_second']:>12,.0f} сообщ/сек ({change:+.1%})")
+        if change < -tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main_cli():
+    stages = ('export_dialog_stream', 'read_export', 'create_html_from_export', 'export_dialog', 'save_to_json',
+              'create_html_page')
+    parser = argparse.ArgumentParser(description='Офлайн-бенчмарк экспорта на синтетическом диалоге')
+    parser.add_argument('--messages', type=int, default=100000, help='сообщений в диалоге')
+    parser.add_argument('--min-words', type=int, default=1)
+    parser.add_argument('--max-words', type=int, default=40)
+    parser.add_argument('--media-rate', type=float, default=0.05, help='доля сообщений с медиа')
+    parser.add_argument('--forward-rate', type=float, default=0.05, help='доля пересланных')
+    parser.add_argument('--edit-rate', type=float, default=0.05, help='доля отредактированных')
+    parser.add_argument('--reply-rate', type=float, default=0.1, help='доля ответов')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка запроса, сек')
+    parser.add_argument('--chunk-size', type=int, default=100, help='сообщений на запрос')
+    parser.add_argument('--format', choices=('json', 'ndjson'), default='json')
+    parser.add_argument('--compact', action='store_true', help='JSON без отступов')
+    parser.add_argument('--compression', choices=tuple(COMPRESSIONS), help='сжатие экспорта')
+    parser.add_argument('--level', type=int, help='уровень сжатия')
+    parser.add_argument('--no-fast-json', action='store_true', help='не использовать orjson')
+    parser.add_argument('--stages', nargs='+', choices=stages, default=list(stages))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='записать результаты в JSON файл')
+    parser.add_argument('--compare', help='JSON с результатами предыдущего запуска')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='допустимое падение сообщ/сек при сравнении (0.1 = 10%%)')
+    parser.add_argument('--keep', action='store_true', help='не удалять рабочий каталог')
+    parser.add_argument('--verbose', action='store_true', help='показывать вывод экспортера')
+    parser.add_argument('--startup', nargs='*', choices=STARTUP_COMMANDS, metavar='КОМАНДА',
+                        help='вместо экспорта замерить холодный старт офлайн-команд main.py (по умолчанию всех)')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_MS,
+                        help='допустимое время холодного старта, мс')
+    parser.add_argument('--startup-runs', type=int, default=5, help='запусков каждой команды (берется лучший)')
+    parser.add_argument('--rate-limit', type=float,
+                        help='вместо этапов сравнить потоковый экспорт с пакетной загрузкой и takeout '
+                             'на сервере, допускающем столько запросов в секунду')
+    parser.add_argument('--takeout-rate-limit', type=float, help='запросов в секунду для takeout-сессии '
+                                                                 '(по умолчанию втрое больше --rate-limit)')
+    parser.add_argument('--flood-seconds', type=int, default=3, help='FloodWait сервера, сек')
+    parser.add_argument('--short-messages', type=int, default=5000,
+                        help='с --rate-limit: длина короткого диалога, длинный задает --messages')
+    args = parser.parse_args()
+
+    if args.startup is not None:
+        startup_cli(args)
+        return
+
+    started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cwd = os.getcwd()
+    if args.rate_limit:
+        if args.takeout_rate_limit is None:
+            args.takeout_rate_limit = args.rate_limit * 3
+        results, metrics = asyncio.run(run_rate_limit_benchmark(args)), None
+    else:
+        results, metrics = asyncio.run(run_benchmark(args))
+    os.chdir(cwd)
+
+    report = {
+        'benchmark': 'telegram-dialog-export',
+        'started_at': started_at,
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'compare', 'keep', 'verbose')},
+        'stages': results,
+        'metrics': metrics
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты: {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+def startup_cli(args):
+    report = {
+        'benchmark': 'offline-cold-start',
+        'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        **measure_startup(args.startup or STARTUP_COMMANDS, args.startup_runs, args.startup_budget)
+    }
+    over_budget = [command for command, result in report['commands'].items() if not result['within_budget']]
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты: {args.output}")
+    if over_budget:
+        print(f"❌ Вне бюджета {args.startup_budget:.0f} мс: {', '.join(over_budget)}")
+        sys.exit(1)
+    print(f"✅ Все команды укладываются в {args.startup_budget:.0f} мс")
+
+
+if __name__ == '__main__':
+    main_cli()
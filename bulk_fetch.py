@@ -0,0 +1,214 @@
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+from telethon.errors import FloodWaitError
+
+from scheduler import RateLimiter
+
+# GetHistory returns at most 100 messages per request
+MAX_REQUEST_SIZE = 100
+MIN_REQUEST_SIZE = 20
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    # A RateLimiter whose floor follows the server. Telegram counts history
+    # requests per account, so one limiter paces every dialog of a run:
+    # a FloodWait raises the floor above the interval that caused it, and
+    # every successful request lowers it a little, so a limit that got
+    # looser is found again. Once a pace has held for a run of requests
+    # (proven), a FloodWait below it only steps back to just above it
+    # instead of doubling the interval, and the rate profile keeps it as
+    # the next run's floor. Responses slower than target_latency shrink
+    # the request size, fast ones grow it back to the maximum.
+    def __init__(self, interval=0.0, floor=0.0, request_size=MAX_REQUEST_SIZE, max_interval=30.0,
+                 target_latency=5.0, floor_decay=0.9999):
+        super().__init__(min_interval=floor, max_interval=max_interval)
+        self.min_interval = min(max_interval, max(interval, floor))
+        self.request_size = max(MIN_REQUEST_SIZE, min(MAX_REQUEST_SIZE, int(request_size)))
+        self.target_latency = target_latency
+        self.floor_decay = floor_decay
+        self.latency = None
+        # start times of the latest requests: the pace the server actually saw
+        self._recent = deque(maxlen=20)
+        # smallest interval that served a full _recent of requests in a row
+        # without a FloodWait; a learned floor held through the last run
+        self.proven = floor or None
+        self._streak = self._recent.maxlen if floor else 0
+        self.responses = 0
+        self.messages = 0
+        self._raising = 0
+        self._flood_sleep_threshold = None
+
+    async def acquire(self):
+        await super().acquire()
+        self._recent.append(time.monotonic())
+        self._streak += 1
+        if self._streak >= self._recent.maxlen:
+            self.proven = self.min_interval if self.proven is None else min(self.proven, self.min_interval)
+
+    def pace(self):
+        # average seconds between the latest requests
+        recent = self._recent
+        return (recent[-1] - recent[0]) / (len(recent) - 1) if len(recent) > 1 else None
+
+    def report_flood(self, seconds):
+        step_back = None
+        if time.monotonic() >= self._resume_at:
+            # the pace of the requests that just flooded is too fast
+            flooded_at = self.pace() or 0.0
+            if self.proven is not None and self._streak >= self._recent.maxlen and flooded_at < self.proven * 1.1:
+                # probing around a pace that held: the limit is just above it.
+                # Two floods in a short while are handled as a new limit below
+                step_back = self.base_interval = self.proven = min(self.max_interval,
+                                                                   max(self.proven, flooded_at) * 1.1)
+            else:
+                self.proven = None
+                self.base_interval = min(self.max_interval, max(self.base_interval, flooded_at or 0.04) * 1.5)
+            # the pause is not part of the pace
+            self._recent.clear()
+            self._streak = 0
+        super().report_flood(seconds)
+        if step_back is not None:
+            self.min_interval = step_back
+
+    def report_response(self, seconds, count):
+        self.responses += 1
+        self.messages += count
+        self.latency = seconds if self.latency is None else self.latency * 0.8 + seconds * 0.2
+        self.base_interval *= self.floor_decay
+        if self.latency > self.target_latency:
+            self.request_size = max(MIN_REQUEST_SIZE, int(self.request_size * 0.7))
+        elif self.latency < self.target_latency / 2:
+            self.request_size = min(MAX_REQUEST_SIZE, self.request_size + 10)
+
+    def raise_floods(self, client):
+        # history requests must raise FloodWait to be counted here instead of
+        # Telethon sleeping through them; of the dialogs fetched at once the
+        # first saves the client's threshold and the last one restores it
+        if not self._raising:
+            self._flood_sleep_threshold = client.flood_sleep_threshold
+            client.flood_sleep_threshold = 0
+        self._raising += 1
+
+    def restore_floods(self, client):
+        self._raising -= 1
+        if not self._raising:
+            client.flood_sleep_threshold = self._flood_sleep_threshold
+
+    def state(self):
+        # the next run starts at the pace that held instead of probing down
+        # to a floor below it again
+        floor = max(self.base_interval, self.proven or 0.0)
+        return {
+            'interval': round(max(self.min_interval, floor), 4),
+            'floor': round(floor, 4),
+            'request_size': self.request_size
+        }
+
+    def summary(self):
+        return {
+            **self.state(),
+            'requests': self.requests,
+            'messages': self.messages,
+            'latency_seconds': round(self.latency, 3) if self.latency is not None else None,
+            'flood_wait_events': self.flood_events,
+            'flood_wait_seconds': self.flood_wait_total
+        }
+
+
+class RateProfile:
+    # learned AdaptiveRateLimiter parameters per session and mode ('session'
+    # or 'takeout'), so the next run starts at the pace this one ended with
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Не удалось прочитать профиль скорости {path}: {e}")
+
+    def limiter(self, key, **kwargs):
+        learned = self.data.get(key) or {}
+        return AdaptiveRateLimiter(interval=learned.get('interval', 0.0), floor=learned.get('floor', 0.0),
+                                   request_size=learned.get('request_size', MAX_REQUEST_SIZE), **kwargs)
+
+    def update(self, key, limiter):
+        entry = self.data.setdefault(key, {})
+        entry.update(limiter.state())
+        # counters of the last run, for reference
+        entry['requests'] = limiter.requests
+        entry['flood_wait_events'] = limiter.flood_events
+        if limiter.latency is not None:
+            entry['latency_seconds'] = round(limiter.latency, 3)
+        entry['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class BulkFetcher:
+    # Fetches one dialog oldest first with one GetHistory request per
+    # request_size messages, paced by the shared AdaptiveRateLimiter instead
+    # of Telethon's fixed wait_time. FloodWait is waited out by the limiter
+    # and the request repeated from the same id.
+    parallel = False
+
+    def __init__(self, client, entity, rate_limiter, max_retries=5):
+        self.client = client
+        self.entity = entity
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.requests = 0
+        self.retries = 0
+        self._raising = False
+
+    async def messages(self, min_id=0):
+        self.rate_limiter.raise_floods(self.client)
+        self._raising = True
+        try:
+            cursor = min_id
+            while True:
+                size = self.rate_limiter.request_size
+                chunk = await self._request(cursor, size)
+                for message in chunk:
+                    yield message
+                # a short page is the end of the history, like in iter_messages
+                if len(chunk) < size:
+                    return
+                cursor = chunk[-1].id
+        finally:
+            await self.close()
+
+    async def _request(self, min_id, size):
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                chunk = [message async for message in self.client.iter_messages(
+                    self.entity, limit=size, reverse=True, min_id=min_id, wait_time=0)]
+            except FloodWaitError as e:
+                self.retries += 1
+                self.rate_limiter.report_flood(e.seconds)
+                continue
+            self.requests += 1
+            self.rate_limiter.report_response(time.monotonic() - started, len(chunk))
+            return chunk
+        raise RuntimeError(f"превышено число попыток ({self.max_retries}) для сообщений "
+                           f"после #{min_id} из-за FloodWait")
+
+    async def close(self):
+        if self._raising:
+            self._raising = False
+            self.rate_limiter.restore_floods(self.client)
+
+    def summary(self):
+        return {
+            'requests': self.requests,
+            'retries': self.retries
+        }
@@ -0,0 +1,41 @@
+import json
+import os
+from datetime import datetime
+
+
+class CheckpointStore:
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать файл контрольных точек {self.path}: {e}")
+            self.data = {}
+
+    def get(self, dialog_id):
+        return self.data.get(str(dialog_id))
+
+    def update(self, dialog_id, **fields):
+        checkpoint = self.data.setdefault(str(dialog_id), {})
+        checkpoint.update(fields)
+        checkpoint['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.save()
+        return checkpoint
+
+    def remove(self, dialog_id):
+        if self.data.pop(str(dialog_id), None) is not None:
+            self.save()
+
+    def save(self):
+        # write to a temp file first so a crash never leaves a truncated store
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import struct
+import sys
+from array import array
+from datetime import datetime, timezone
+
+from export_io import ExportReader, export_stem
+
+COLUMNAR_BATCH_SIZE = 65536
+
+# Every column is a plain .npy file, so downstream code can np.load(...,
+# mmap_mode='r') it without parsing. Strings are stored Arrow-style as
+# <name>.offsets.npy (int64, rows + 1) and <name>.data.npy (utf-8 bytes);
+# low-cardinality strings as int32 codes plus a dictionary in meta.json.
+# Files are written with the array module, numpy is only needed to read them.
+
+_NPY_HEADER_SIZE = 128
+
+FIXED_COLUMNS = {
+    # name: (array typecode, npy descr, null value)
+    'id': ('q', '<i8', -1),
+    'date_timestamp': ('d', '<f8', float('nan')),
+    'from_me': ('B', '|b1', 0),
+    'reply_to': ('q', '<i8', -1),
+    'file_size': ('q', '<i8', -1),
+    'edit_timestamp': ('d', '<f8', float('nan')),
+    'forwarded': ('B', '|b1', 0)
+}
+DICTIONARY_COLUMNS = ('sender_name', 'media_type')
+STRING_COLUMNS = ('text', 'media_caption', 'file_name')
+
+
+class _NpyColumn:
+    # raw values appended after a fixed-size header; the header is rewritten
+    # with each row group, so the file is a valid .npy of at least the rows
+    # meta.json counts
+    def __init__(self, filename, typecode, descr, resume_rows=None):
+        self.filename = filename
+        self.typecode = typecode
+        self.descr = descr
+        self.itemsize = array(typecode).itemsize
+        if resume_rows is None:
+            self.file = open(filename, 'wb')
+            self.file.write(b'\0' * _NPY_HEADER_SIZE)
+            self.rows = 0
+        else:
+            self.file = open(filename, 'r+b')
+            self.file.truncate(_NPY_HEADER_SIZE + resume_rows * self.itemsize)
+            self.file.seek(0, os.SEEK_END)
+            self.rows = resume_rows
+
+    def append(self, values):
+        if sys.byteorder == 'big' and self.itemsize > 1:
+            values.byteswap()
+        values.tofile(self.file)
+        self.rows += len(values)
+
+    def read_last(self):
+        self.file.flush()
+        with open(self.filename, 'rb') as f:
+            f.seek(_NPY_HEADER_SIZE + (self.rows - 1) * self.itemsize)
+            value = array(self.typecode, f.read(self.itemsize))
+        if sys.byteorder == 'big' and self.itemsize > 1:
+            value.byteswap()
+        return value[0]
+
+    def flush(self):
+        self.file.flush()
+
+    def write_header(self):
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (self.descr, self.rows)
+        header = header.ljust(_NPY_HEADER_SIZE - 10 - 1) + '\n'
+        self.file.seek(0)
+        self.file.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+
+    def close(self):
+        self.write_header()
+        self.file.close()
+
+
+class ColumnarWriter:
+    # Rows go to the column files in row groups of batch_size, each followed
+    # by new .npy headers and meta.json. The export checkpoints in between
+    # (flush()) only append the pending rows and one line to progress.jsonl
+    # with the row count and the dictionary values added since, so their
+    # cost does not grow with the columns or dictionaries; resume() replays
+    # the lines on top of meta.json.
+    def __init__(self, path, batch_size=COLUMNAR_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = 0
+        self.dictionaries = {name: [] for name in DICTIONARY_COLUMNS}
+        self.export_info = None
+        self._codes = {name: {} for name in DICTIONARY_COLUMNS}
+        self._columns = {}
+        self._pending = []
+        # dictionary values already in meta.json or progress.jsonl, and the
+        # rows meta.json has
+        self._saved_values = {name: 0 for name in DICTIONARY_COLUMNS}
+        self._group_start = 0
+        self._progress_path = os.path.join(path, 'progress.jsonl')
+
+    def _column_files(self):
+        files = {name: (f'{name}.npy', typecode, descr) for name, (typecode, descr, _) in FIXED_COLUMNS.items()}
+        for name in DICTIONARY_COLUMNS:
+            files[name] = (f'{name}.codes.npy', 'i', '<i4')
+        for name in STRING_COLUMNS:
+            files[f'{name}.offsets'] = (f'{name}.offsets.npy', 'q', '<i8')
+            files[f'{name}.data'] = (f'{name}.data.npy', 'B', '|u1')
+        return files
+
+    def open(self, export_info):
+        os.makedirs(self.path, exist_ok=True)
+        self.export_info = export_info
+        for key, (filename, typecode, descr) in self._column_files().items():
+            self._columns[key] = _NpyColumn(os.path.join(self.path, filename), typecode, descr)
+        for name in STRING_COLUMNS:
+            self._columns[f'{name}.offsets'].append(array('q', [0]))
+        self._write_row_group()
+        return self
+
+    def resume(self, rows):
+        # drop anything written after the export checkpoint that is being resumed
+        with open(os.path.join(self.path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.export_info = meta['export_info']
+        self.dictionaries = meta['dictionaries']
+        saved_rows = meta['rows']
+        if os.path.exists(self._progress_path):
+            with open(self._progress_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        progress = json.loads(line)
+                    except ValueError:
+                        # a line cut off by a crash, the checkpoint is older
+                        break
+                    if progress['group'] != meta['rows']:
+                        # left over from before the last row group
+                        break
+                    saved_rows = progress['rows']
+                    for name, values in progress['dictionaries'].items():
+                        self.dictionaries[name].extend(values)
+        self._codes = {name: {value: code for code, value in enumerate(values)}
+                       for name, values in self.dictionaries.items()}
+        if saved_rows < rows:
+            # the rows in between are in the export but would never reach the columns
+            raise ValueError(f"{self.path}: {saved_rows} строк, а сохранено уже {rows} сообщений")
+
+        for key, (filename, typecode, descr) in self._column_files().items():
+            if key.endswith('.data'):
+                continue
+            resume_rows = rows + 1 if key.endswith('.offsets') else rows
+            self._columns[key] = _NpyColumn(os.path.join(self.path, filename), typecode, descr, resume_rows)
+        for name in STRING_COLUMNS:
+            data_size = self._columns[f'{name}.offsets'].read_last()
+            self._columns[f'{name}.data'] = _NpyColumn(
+                os.path.join(self.path, f'{name}.data.npy'), 'B', '|u1', data_size)
+        self.rows = rows
+        # meta.json and the headers may count rows that were just cut off
+        self._write_row_group()
+        return self
+
+    def write_message(self, record):
+        self._pending.append(record)
+        if self.rows + len(self._pending) - self._group_start >= self.batch_size:
+            self._write_batch(self._pending)
+            self._pending = []
+            self._write_row_group()
+
+    def flush(self):
+        # everything written so far survives a crash, for the export checkpoint
+        if self._pending:
+            self._write_batch(self._pending)
+            self._pending = []
+        for column in self._columns.values():
+            column.flush()
+        new_values = {name: values[self._saved_values[name]:] for name, values in self.dictionaries.items()}
+        with open(self._progress_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'group': self._group_start, 'rows': self.rows, 'dictionaries': new_values},
+                               ensure_ascii=False) + '\n')
+        self._saved_values = {name: len(values) for name, values in self.dictionaries.items()}
+
+    def close(self):
+        if self._pending:
+            self._write_batch(self._pending)
+            self._pending = []
+        self._write_row_group()
+        for column in self._columns.values():
+            column.close()
+        self._columns = {}
+        return self.rows
+
+    def _write_row_group(self):
+        for column in self._columns.values():
+            column.write_header()
+        self._write_meta()
+        self._saved_values = {name: len(values) for name, values in self.dictionaries.items()}
+        self._group_start = self.rows
+        # meta.json now holds everything the progress lines did
+        if os.path.exists(self._progress_path):
+            os.remove(self._progress_path)
+
+    def _encode(self, name, value):
+        if value is None:
+            return -1
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.dictionaries[name])
+            self.dictionaries[name].append(value)
+        return code
+
+    def _write_batch(self, records):
+        for name, (typecode, _, null) in FIXED_COLUMNS.items():
+            if name == 'edit_timestamp':
+                # MessageRecords carry it, records read back from JSON only have the string
+                values = (r.get('edit_timestamp') or _parse_utc(r.get('edit_date')) for r in records)
+            elif name == 'forwarded':
+                values = (1 if r.get('forward_from') else 0 for r in records)
+            elif name == 'from_me':
+                values = (1 if r.get('from_me') else 0 for r in records)
+            else:
+                values = (r.get(name) for r in records)
+            self._columns[name].append(array(typecode, (null if v is None else v for v in values)))
+
+        for name in DICTIONARY_COLUMNS:
+            self._columns[name].append(array('i', (self._encode(name, r.get(name)) for r in records)))
+
+        for name in STRING_COLUMNS:
+            offsets_column = self._columns[f'{name}.offsets']
+            data_column = self._columns[f'{name}.data']
+            offset = data_column.rows
+            offsets = array('q')
+            chunks = []
+            for r in records:
+                encoded = (r.get(name) or '').encode('utf-8')
+                chunks.append(encoded)
+                offset += len(encoded)
+                offsets.append(offset)
+            offsets_column.append(offsets)
+            data_column.append(array('B', b''.join(chunks)))
+
+        self.rows += len(records)
+
+    def _write_meta(self):
+        meta = {
+            'format': 'telegram-dialog-columns',
+            'version': 1,
+            'rows': self.rows,
+            'export_info': self.export_info,
+            'fixed_columns': {name: descr for name, (_, descr, _) in FIXED_COLUMNS.items()},
+            'dictionary_columns': list(DICTIONARY_COLUMNS),
+            'string_columns': list(STRING_COLUMNS),
+            'dictionaries': self.dictionaries
+        }
+        tmp_path = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, 'meta.json'))
+
+
+class StringColumn:
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+
+def load_columns(path, mmap=True):
+    # returns {'id': ndarray, ..., 'media_type': (codes, categories), 'text': StringColumn, ...}
+    import numpy as np
+
+    with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    mmap_mode = 'r' if mmap else None
+    rows = meta['rows']
+
+    def load(filename, length):
+        return np.load(os.path.join(path, filename), mmap_mode=mmap_mode)[:length]
+
+    columns = {'_meta': meta}
+    for name in meta['fixed_columns']:
+        columns[name] = load(f'{name}.npy', rows)
+    for name in meta['dictionary_columns']:
+        columns[name] = (load(f'{name}.codes.npy', rows), meta['dictionaries'][name])
+    for name in meta['string_columns']:
+        offsets = load(f'{name}.offsets.npy', rows + 1)
+        columns[name] = StringColumn(offsets, load(f'{name}.data.npy', int(offsets[-1]) if rows else 0))
+    return columns
+
+
+def _parse_utc(value):
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+def export_to_columns(export_filename, path=None, batch_size=COLUMNAR_BATCH_SIZE):
+    reader = ExportReader(export_filename)
+    path = path or export_stem(export_filename) + '.columns'
+    writer = ColumnarWriter(path, batch_size).open(reader.header())
+    for message in reader.iter_messages():
+        writer.write_message(message)
+    return path, writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Колоночные .npy файлы из готовых экспортов')
+    parser.add_argument('files', nargs='+', help='файлы экспорта')
+    args = parser.parse_args(argv)
+    for filename in args.files:
+        path, rows = export_to_columns(filename)
+        print(f"✅ {filename} -> {path} ({rows} строк)")
+
+
+if __name__ == '__main__':
+    main()
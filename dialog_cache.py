@@ -0,0 +1,130 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from telethon.tl.types import Channel, Chat, ChatPhotoEmpty, User
+from telethon.utils import get_peer_id
+
+# entries are keyed by marked peer id since groups and channels are cached too
+_CACHE_VERSION = 2
+
+
+class DialogCache:
+    # dialogs of one account, most recently active first
+    def __init__(self, path, ttl=300, full_refresh_interval=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.full_refresh_interval = full_refresh_interval
+        self.account_id = None
+        self.fetched_at = 0
+        self.full_refresh_at = 0
+        self.dialogs = []
+        self._index = None
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать кэш диалогов {self.path}: {e}")
+            return
+        if data.get('version') != _CACHE_VERSION:
+            return
+        self.account_id = data.get('account_id')
+        self.fetched_at = data.get('fetched_at', 0)
+        self.full_refresh_at = data.get('full_refresh_at', 0)
+        self.dialogs = data.get('dialogs', [])
+        self._index = None
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': _CACHE_VERSION,
+                'account_id': self.account_id,
+                'fetched_at': self.fetched_at,
+                'full_refresh_at': self.full_refresh_at,
+                'dialogs': self.dialogs
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def bind(self, account_id):
+        # a cache written for another account is useless
+        if self.account_id != account_id:
+            self.account_id = account_id
+            self.fetched_at = 0
+            self.full_refresh_at = 0
+            self.dialogs = []
+            self._index = None
+
+    def is_fresh(self):
+        return bool(self.dialogs) and time.time() - self.fetched_at < self.ttl
+
+    def needs_full_refresh(self):
+        return not self.dialogs or time.time() - self.full_refresh_at >= self.full_refresh_interval
+
+    def is_unchanged(self, dialog):
+        cached = self._by_id().get(get_peer_id(dialog.entity))
+        return cached is not None and cached['date'] == dialog.date.isoformat()
+
+    def merge(self, updated, full):
+        # updated: entries seen on this pass, newest first; on an incremental
+        # pass everything after them is still valid from the previous run
+        if full:
+            self.dialogs = updated
+            self.full_refresh_at = time.time()
+        else:
+            seen = {entry['peer_id'] for entry in updated}
+            self.dialogs = updated + [entry for entry in self.dialogs if entry['peer_id'] not in seen]
+        self.fetched_at = time.time()
+        self._index = None
+
+    def _by_id(self):
+        if self._index is None:
+            self._index = {entry['peer_id']: entry for entry in self.dialogs}
+        return self._index
+
+    @staticmethod
+    def entry_from_dialog(dialog):
+        entity = dialog.entity
+        return {
+            'peer_id': get_peer_id(entity),
+            'id': entity.id,
+            'kind': type(entity).__name__.lower(),
+            'access_hash': getattr(entity, 'access_hash', None),
+            'first_name': getattr(entity, 'first_name', None),
+            'last_name': getattr(entity, 'last_name', None),
+            'title': getattr(entity, 'title', None),
+            'megagroup': bool(getattr(entity, 'megagroup', False)),
+            'username': getattr(entity, 'username', None),
+            'date': dialog.date.isoformat(),
+            'unread_count': dialog.unread_count,
+            'pinned': bool(getattr(dialog, 'pinned', False))
+        }
+
+    @staticmethod
+    def entity_from_entry(entry):
+        # enough of the entity for display names, file names and as an input peer
+        if entry['kind'] == 'channel':
+            return Channel(id=entry['id'], title=entry['title'], photo=ChatPhotoEmpty(), date=None,
+                           access_hash=entry['access_hash'], username=entry['username'],
+                           megagroup=entry['megagroup'])
+        if entry['kind'] == 'chat':
+            return Chat(id=entry['id'], title=entry['title'], photo=ChatPhotoEmpty(), participants_count=0,
+                        date=None, version=0)
+        return User(
+            id=entry['id'],
+            access_hash=entry['access_hash'],
+            first_name=entry['first_name'],
+            last_name=entry['last_name'],
+            username=entry['username'],
+            bot=False
+        )
+
+    @staticmethod
+    def entry_date(entry):
+        return datetime.fromisoformat(entry['date'])
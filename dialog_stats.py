@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import sys
+from array import array
+from datetime import datetime, timezone
+
+# numpy is imported on first use, so exports and renders that never compute
+# statistics do not pay for it at startup
+np = None
+
+# Conversation statistics: activity by hour, weekday and month, response
+# times between the sides, daily streaks and media per side. A pass over the
+# messages only appends three numbers per message to flat arrays; everything
+# else is computed on NumPy views of them, about half a second for five million
+# messages. Hours and days are UTC, like the message dates.
+
+# response time buckets, upper bounds in seconds
+RESPONSE_BUCKETS = (60, 300, 3600, 86400)
+# 1970-01-01 was a Thursday, weekday 0 is Monday
+_EPOCH_WEEKDAY = 3
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+
+class StatsCollector:
+    def __init__(self):
+        self.timestamps = array('d')
+        self.from_me = array('B')
+        # 0 is a message without media, n the n-th name in media_types
+        self.media_codes = array('H')
+        self.media_types = []
+        self._media_index = {None: 0, 'NoneType': 0}
+
+    def add(self, message):
+        timestamp = message.get('date_timestamp')
+        if timestamp is None:
+            # exports written before date_timestamp existed
+            timestamp = datetime.strptime(message['date'], '%Y-%m-%d %H:%M:%S').replace(
+                tzinfo=timezone.utc).timestamp()
+        self.timestamps.append(timestamp)
+        self.from_me.append(1 if message['from_me'] else 0)
+        media_type = message['media_type']
+        code = self._media_index.get(media_type)
+        if code is None:
+            self.media_types.append(media_type)
+            code = self._media_index[media_type] = len(self.media_types)
+        self.media_codes.append(code)
+
+    def collect(self, messages):
+        # pass-through, for loops that consume the messages anyway
+        for message in messages:
+            self.add(message)
+            yield message
+
+    def compute(self):
+        if not self.timestamps or not _load_numpy():
+            return None
+        return statistics_from_arrays(
+            np.frombuffer(self.timestamps, dtype=np.float64),
+            np.frombuffer(self.from_me, dtype=np.uint8),
+            np.frombuffer(self.media_codes, dtype=np.uint16),
+            [None] + self.media_types
+        )
+
+
+def compute_statistics(messages):
+    collector = StatsCollector()
+    for message in messages:
+        collector.add(message)
+    return collector.compute()
+
+
+def columns_statistics(path):
+    # straight from the memory-mapped .npy files of a columnar export
+    from columnar import load_columns
+
+    _load_numpy()
+    columns = load_columns(path)
+    codes, categories = columns['media_type']
+    # dictionary code -1 is a null, shifted to 0 like "no media"
+    names = [None] + [None if name == 'NoneType' else name for name in categories]
+    return statistics_from_arrays(columns['date_timestamp'], columns['from_me'],
+                                  np.asarray(codes) + 1, names)
+
+
+def statistics_from_arrays(timestamps, from_me, media_codes, media_names):
+    _load_numpy()
+    valid = ~np.isnan(timestamps)
+    if not valid.all():
+        timestamps, from_me, media_codes = timestamps[valid], from_me[valid], media_codes[valid]
+    if not len(timestamps):
+        return None
+    # id order is date order in practice; sort only if an archive disagrees
+    if (np.diff(timestamps) < 0).any():
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, from_me, media_codes = timestamps[order], from_me[order], media_codes[order]
+
+    seconds = timestamps.astype(np.int64)
+    from_me = from_me.astype(np.int64)
+    days = seconds // 86400
+    hours = seconds % 86400 // 3600
+    weekdays = (days + _EPOCH_WEEKDAY) % 7
+    months = seconds.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    first_month = int(months[0])
+    month_count = int(months[-1]) - first_month + 1
+    messages_from_me = int(from_me.sum())
+
+    return {
+        'total_messages': len(timestamps),
+        'messages_from_me': messages_from_me,
+        'messages_from_other': len(timestamps) - messages_from_me,
+        'first_date': _day(days[0]),
+        'last_date': _day(days[-1]),
+        'by_hour': _by_side(hours, from_me, 24),
+        'by_weekday': _by_side(weekdays, from_me, 7),
+        'by_month': {
+            'months': np.arange(first_month, first_month + month_count).astype('datetime64[M]').astype(str).tolist(),
+            **_by_side(months - first_month, from_me, month_count)
+        },
+        'response_times': _response_times(timestamps, from_me),
+        'streaks': _streaks(days),
+        'media': _media(media_codes, from_me, media_names)
+    }
+
+
+def _day(day_number):
+    return str(np.datetime64(int(day_number), 'D'))
+
+
+def _side_counts(values, from_me, length):
+    # one bincount over value * 2 + side instead of masking every array per side
+    counts = np.bincount(values * 2 + from_me, minlength=length * 2).reshape(length, 2)
+    return counts[:, 1], counts[:, 0]
+
+
+def _by_side(values, from_me, length):
+    me, other = _side_counts(values, from_me, length)
+    return {'me': me.tolist(), 'other': other.tolist()}
+
+
+def _response_times(timestamps, from_me):
+    # a response is the first message after the other side's message; its
+    # time is the gap to that message
+    switches = np.flatnonzero(from_me[1:] != from_me[:-1]) + 1
+    gaps = timestamps[switches] - timestamps[switches - 1]
+    responders = from_me[switches].astype(bool)
+    result = {}
+    for side, side_gaps in (('me', gaps[responders]), ('other', gaps[~responders])):
+        if not len(side_gaps):
+            result[side] = {'count': 0}
+            continue
+        median, p90 = np.percentile(side_gaps, (50, 90))
+        buckets = np.searchsorted(RESPONSE_BUCKETS, side_gaps, side='right')
+        result[side] = {
+            'count': len(side_gaps),
+            'median_seconds': round(float(median), 1),
+            'p90_seconds': round(float(p90), 1),
+            'mean_seconds': round(float(side_gaps.mean()), 1),
+            'buckets': np.bincount(buckets, minlength=len(RESPONSE_BUCKETS) + 1).tolist()
+        }
+    return result
+
+
+def _streaks(days):
+    # days are sorted, so the distinct ones are where the value changes
+    active_days = days[np.concatenate(([True], days[1:] != days[:-1]))]
+    steps = np.diff(active_days)
+    # runs of consecutive active days are split where the step is not one day
+    breaks = np.flatnonzero(steps != 1)
+    starts = np.concatenate(([0], breaks + 1))
+    ends = np.concatenate((breaks, [len(active_days) - 1]))
+    longest = int(np.argmax(ends - starts))
+    streaks = {
+        'active_days': len(active_days),
+        'longest_streak_days': int(ends[longest] - starts[longest] + 1),
+        'longest_streak_start': _day(active_days[starts[longest]]),
+        'longest_streak_end': _day(active_days[ends[longest]]),
+        'longest_silence_days': 0
+    }
+    if len(steps) and steps.max() > 1:
+        gap = int(np.argmax(steps))
+        streaks['longest_silence_days'] = int(steps[gap] - 1)
+        streaks['longest_silence_start'] = _day(active_days[gap] + 1)
+        streaks['longest_silence_end'] = _day(active_days[gap + 1] - 1)
+    return streaks
+
+
+def _media(media_codes, from_me, media_names):
+    me_counts, other_counts = _side_counts(media_codes.astype(np.int64), from_me, len(media_names))
+    media = {}
+    for code, name in enumerate(media_names):
+        if name is None or not (me_counts[code] or other_counts[code]):
+            continue
+        counts = media.setdefault(name, {'me': 0, 'other': 0})
+        counts['me'] += int(me_counts[code])
+        counts['other'] += int(other_counts[code])
+    return media
+
+
+def main(argv=None):
+    from export_io import ExportReader
+
+    parser = argparse.ArgumentParser(description='Статистика переписки по готовым экспортам')
+    parser.add_argument('paths', nargs='+', help='файлы экспорта или каталоги .columns')
+    args = parser.parse_args(argv)
+    if not _load_numpy():
+        print("❌ Для статистики нужен numpy: pip install numpy")
+        sys.exit(1)
+    for path in args.paths:
+        if os.path.isdir(path):
+            statistics = columns_statistics(path)
+        else:
+            statistics = compute_statistics(ExportReader(path).iter_messages())
+        print(json.dumps({path: statistics}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,590 @@
+import gzip
+import io
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+
+from records import as_dict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXPORT_FORMATS = ('json', 'ndjson')
+# compression: (file suffix, default level)
+COMPRESSIONS = {'gzip': ('.gz', 6), 'zstd': ('.zst', 3)}
+_MAGIC = {'gzip': b'\x1f\x8b\x08', 'zstd': b'\x28\xb5\x2f\xfd'}
+_DECOMPRESS_ERRORS = (zlib.error, zstandard.ZstdError) if zstandard else (zlib.error,)
+
+# total_messages is unknown until the dialog is fully fetched, so the JSON
+# header reserves a fixed-width slot that is overwritten in place on close
+_TOTAL_SLOT_WIDTH = 20
+_TOTAL_MARK = '__total_messages__'
+
+
+def json_encoder(compact=False, fast=True):
+    # obj -> utf-8 bytes. orjson only writes compact JSON, so the default
+    # layout with spaces after separators always goes through the json module
+    if compact and fast and orjson is not None:
+        return orjson.dumps
+    separators = (',', ':') if compact else None
+    return lambda obj: json.dumps(obj, ensure_ascii=False, separators=separators).encode('utf-8')
+
+
+def export_extension(fmt, compression=None):
+    return fmt + COMPRESSIONS[compression][0] if compression else fmt
+
+
+def _strip_compression_suffix(filename):
+    for suffix, _ in COMPRESSIONS.values():
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+def export_stem(filename):
+    # dialog_x.ndjson.zst -> dialog_x, for the .html and .columns next to it
+    return os.path.splitext(_strip_compression_suffix(filename))[0]
+
+
+def _check_compression(compression):
+    if compression not in (None, *COMPRESSIONS):
+        raise ValueError(f"Неизвестный метод сжатия: {compression}")
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError("Для сжатия zstd нужен пакет zstandard (pip install zstandard)")
+
+
+def _compressobj(compression, level):
+    if level is None:
+        level = COMPRESSIONS[compression][1]
+    if compression == 'gzip':
+        # wbits=31: deflate with a gzip header and trailer
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+def detect_compression(filename):
+    with open(filename, 'rb') as f:
+        magic = f.read(4)
+    for compression, prefix in _MAGIC.items():
+        if magic.startswith(prefix):
+            _check_compression(compression)
+            return compression
+    return None
+
+
+def open_export(filename):
+    # text stream over a plain, gzip or zstd export, decompressed as it is read
+    compression = detect_compression(filename)
+    if compression == 'gzip':
+        return gzip.open(filename, 'rt', encoding='utf-8')
+    if compression == 'zstd':
+        reader = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), read_across_frames=True,
+                                                            closefd=True)
+        return io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8')
+    return open(filename, 'r', encoding='utf-8')
+
+
+def write_json_document(filename, data, compact=False, compression=None, level=None, fast=True):
+    # whole-document counterpart of StreamingExportWriter for buffered exports
+    _check_compression(compression)
+    with open(filename, 'wb') as raw:
+        if compression == 'gzip':
+            f = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=level or COMPRESSIONS['gzip'][1])
+        elif compression == 'zstd':
+            f = zstandard.ZstdCompressor(level=level or COMPRESSIONS['zstd'][1]).stream_writer(raw, closefd=False)
+        else:
+            f = raw
+        with f:
+            if compact and fast and orjson is not None:
+                f.write(orjson.dumps(data))
+                return
+            text = io.TextIOWrapper(f, encoding='utf-8')
+            if compact:
+                json.dump(data, text, ensure_ascii=False, separators=(',', ':'))
+            else:
+                json.dump(data, text, ensure_ascii=False, indent=2)
+            text.flush()
+            text.detach()
+
+
+class _MemberWriter:
+    # Compressed output as a series of gzip members / zstd frames, one per
+    # flush. Concatenated members are a valid file, so every checkpoint
+    # offset is a member boundary where resume() can truncate and append.
+    def __init__(self, file, compression, level):
+        self.file = file
+        self.compression = compression
+        self.level = level
+        self._member = None
+
+    def write(self, data):
+        if self._member is None:
+            self._member = _compressobj(self.compression, self.level)
+        self.file.write(self._member.compress(data))
+
+    def flush(self):
+        if self._member is not None:
+            self.file.write(self._member.flush())
+            self._member = None
+        self.file.flush()
+
+
+class StreamingExportWriter:
+    def __init__(self, filename, fmt='json', flush_every=500, on_flush=None, compact=False, compression=None,
+                 level=None, fast=True):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+        _check_compression(compression)
+        self.filename = filename
+        self.fmt = fmt
+        self.compact = compact
+        self.compression = compression
+        self.level = level
+        self._encode = json_encoder(compact, fast)
+        self.flush_every = flush_every
+        self.on_flush = on_flush
+        self.count = 0
+        self.from_me_count = 0
+        self.first_id = None
+        self.last_id = None
+        self.max_edit_date = None
+        # time spent encoding records vs handing bytes to the file
+        self.serialize_seconds = 0.0
+        self.write_seconds = 0.0
+        self._file = None
+        self._out = None
+        self._total_offset = None
+        # resume() offset that has not been cut at yet
+        self._append_at = None
+
+    def _open_file(self, mode):
+        self._file = open(self.filename, mode)
+        self._out = _MemberWriter(self._file, self.compression, self.level) if self.compression else self._file
+
+    def open(self, export_info):
+        self._open_file('wb')
+        if self.fmt == 'ndjson':
+            self._write_line({'export_info': export_info})
+            return self
+
+        if self.compression:
+            # compressed bytes cannot be patched in place: like NDJSON, the
+            # header keeps the count it was opened with and the footer has the total
+            header = self._encode({'export_info': export_info}) if self.compact else \
+                json.dumps({'export_info': export_info}, ensure_ascii=False, indent=2).encode('utf-8')
+            self._out.write(header[:header.rstrip().rfind(b'}')].rstrip())
+        else:
+            info = dict(export_info)
+            info['total_messages'] = _TOTAL_MARK
+            header = self._encode({'export_info': info}) if self.compact else \
+                json.dumps({'export_info': info}, ensure_ascii=False, indent=2).encode('utf-8')
+            # drop the closing brace, the object continues with "messages"
+            header = header[:header.rstrip().rfind(b'}')].rstrip()
+            before, after = header.split(json.dumps(_TOTAL_MARK).encode('ascii'), 1)
+            self._file.write(before)
+            self._total_offset = self._file.tell()
+            self._file.write(b'0'.rjust(_TOTAL_SLOT_WIDTH))
+            self._file.write(after)
+        self._out.write(b',"messages":[' if self.compact else b',\n  "messages": [')
+        return self
+
+    def resume(self, state):
+        # state is what on_flush received: everything past state['offset']
+        # (unflushed records or an old footer) is cut off and rewritten, but
+        # only once something is written, so a top-up that fails before its
+        # first record leaves the finished file as it was
+        self._open_file('r+b')
+        self._append_at = state['offset']
+        self._total_offset = state.get('total_offset')
+        self.count = state['count']
+        self.from_me_count = state['from_me_count']
+        self.first_id = state['first_id']
+        self.last_id = state['last_id']
+        self.max_edit_date = state.get('max_edit_date')
+        return self
+
+    def state(self):
+        return {
+            'filename': self.filename,
+            'format': self.fmt,
+            'compact': self.compact,
+            'compression': self.compression,
+            'offset': self._file.tell() if self._append_at is None else self._append_at,
+            'total_offset': self._total_offset,
+            'count': self.count,
+            'from_me_count': self.from_me_count,
+            'first_id': self.first_id,
+            'last_id': self.last_id,
+            'max_edit_date': self.max_edit_date
+        }
+
+    def _start_append(self):
+        if self._append_at is not None:
+            self._file.truncate(self._append_at)
+            self._file.seek(self._append_at)
+            self._append_at = None
+
+    def write_message(self, record):
+        self._start_append()
+        started = time.perf_counter()
+        record = as_dict(record)
+        if self.fmt == 'ndjson':
+            data = self._encode(record) + b'\n'
+        elif self.compact:
+            data = self._encode(record) if self.count == 0 else b',' + self._encode(record)
+        else:
+            prefix = b'\n    ' if self.count == 0 else b',\n    '
+            data = prefix + self._encode(record)
+        serialized = time.perf_counter()
+        # compression happens here and counts as writing
+        self._out.write(data)
+        self.serialize_seconds += serialized - started
+        self.write_seconds += time.perf_counter() - serialized
+
+        self.count += 1
+        if record.get('from_me'):
+            self.from_me_count += 1
+        if self.first_id is None:
+            self.first_id = record['id']
+        self.last_id = record['id']
+        edit_date = record.get('edit_date')
+        if edit_date and (self.max_edit_date is None or edit_date > self.max_edit_date):
+            self.max_edit_date = edit_date
+
+        if self.count % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        started = time.perf_counter()
+        self._out.flush()
+        self.write_seconds += time.perf_counter() - started
+        if self.on_flush:
+            self.on_flush(self.state())
+
+    def footer(self):
+        return {
+            'completed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'total_messages': self.count,
+            'messages_from_me': self.from_me_count,
+            'messages_from_other': self.count - self.from_me_count,
+            'first_message_id': self.first_id,
+            'last_message_id': self.last_id
+        }
+
+    def close(self, extra_footer=None):
+        self._start_append()
+        self.flush()
+        footer = self.footer()
+        if extra_footer:
+            footer.update(extra_footer)
+        if self.fmt == 'ndjson':
+            self._write_line({'export_footer': footer})
+        elif self.compact:
+            self._out.write(b'],"export_footer":' + self._encode(footer) + b'}\n')
+        else:
+            self._out.write(b'\n  ],\n  "export_footer": ')
+            footer_json = json.dumps(footer, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            self._out.write(footer_json.encode('utf-8'))
+            self._out.write(b'\n}\n')
+        # the footer is a member of its own, so ExportReader.footer() can
+        # decompress just the tail
+        self._out.flush()
+        if self._total_offset is not None:
+            self._file.seek(self._total_offset)
+            self._file.write(str(self.count).rjust(_TOTAL_SLOT_WIDTH).encode('ascii'))
+        self._file.close()
+        self._file = self._out = None
+        return footer
+
+    def abort(self):
+        # an unfinished member past the last checkpoint is cut off on resume;
+        # a resumed file nothing was written to yet is left untouched
+        if self._file:
+            self._file.close()
+            self._file = self._out = None
+
+    def _write_line(self, obj):
+        self._out.write(self._encode(obj) + b'\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        return False
+
+
+class ExportReader:
+    def __init__(self, filename, chunk_size=1 << 20):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.compression = detect_compression(filename)
+        self.fmt = self._detect_format()
+
+    def _detect_format(self):
+        if _strip_compression_suffix(self.filename).endswith('.ndjson'):
+            return 'ndjson'
+        # NDJSON starts with a line holding only the header; a small compact
+        # JSON export is one line that parses too, so the shape decides
+        with open_export(self.filename) as f:
+            first_line = f.readline(1 << 16)
+        try:
+            obj = json.loads(first_line)
+        except ValueError:
+            return 'json'
+        if isinstance(obj, dict) and len(obj) == 1 and 'export_info' in obj:
+            return 'ndjson'
+        return 'json'
+
+    def sections(self):
+        # yields ('export_info', dict), ('message', dict) per message and
+        # ('export_footer', dict) without ever holding the whole file
+        with open_export(self.filename) as f:
+            if self.fmt == 'ndjson':
+                for line in f:
+                    if not line.strip():
+                        continue
+                    obj = json.loads(line)
+                    if len(obj) == 1 and ('export_info' in obj or 'export_footer' in obj):
+                        key, value = next(iter(obj.items()))
+                        yield key, value
+                    else:
+                        yield 'message', obj
+            else:
+                yield from _JsonStreamParser(f, self.chunk_size, self.filename).sections()
+
+    def iter_messages(self):
+        for key, value in self.sections():
+            if key == 'message':
+                yield value
+
+    def message_offsets(self):
+        # (start, end, id, date_timestamp, from_me) per message, start/end
+        # being byte offsets into the file, for random access to single
+        # messages. Only uncompressed exports can be addressed this way
+        if self.compression:
+            raise ValueError(f"{self.filename}: сжатый экспорт не поддерживает доступ по смещению")
+        if self.fmt == 'ndjson':
+            with open(self.filename, 'rb') as f:
+                offset = 0
+                for line in f:
+                    start = offset
+                    offset += len(line)
+                    if not line.strip():
+                        continue
+                    obj = json.loads(line)
+                    if len(obj) == 1 and ('export_info' in obj or 'export_footer' in obj):
+                        continue
+                    yield start, start + len(line.rstrip()), obj['id'], _message_timestamp(obj), bool(obj['from_me'])
+            return
+        # latin-1 turns every byte into one character, so the parser's string
+        # positions are byte offsets; only the ASCII fields below are used
+        with open(self.filename, 'r', encoding='latin-1', newline='') as f:
+            parser = _JsonStreamParser(f, self.chunk_size, self.filename)
+            for key, value in parser.sections():
+                if key == 'message':
+                    yield (*parser.value_span, value['id'], _message_timestamp(value), bool(value['from_me']))
+
+    def header(self):
+        for key, value in self.sections():
+            if key == 'export_info':
+                return value
+            if key == 'message':
+                break
+        return None
+
+    def footer(self):
+        # the footer is written last, so only the tail of the file is read:
+        # 64 KiB first, four times more while the footer may start before it
+        # (media_paths of thousands of files do not fit)
+        with open(self.filename, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            window = 65536
+            while True:
+                f.seek(max(0, size - window))
+                decided, footer = self._parse_footer(f.read())
+                if decided or window >= size:
+                    return footer
+                window *= 4
+
+    def _parse_footer(self, tail):
+        # (decided, footer), not decided while the tail may start inside the footer
+        if self.compression:
+            decided, tail = self._decompress_tail(tail)
+            if tail is None:
+                return decided, None
+        else:
+            tail = tail.decode('utf-8', errors='ignore')
+
+        if self.fmt == 'ndjson':
+            lines = tail.rstrip().rsplit('\n', 1)
+            if len(lines) == 1 and not self.compression:
+                # no line break: the last line may start before the tail
+                return False, None
+            try:
+                obj = json.loads(lines[-1])
+            except ValueError:
+                return True, None
+            return True, obj.get('export_footer') if isinstance(obj, dict) else None
+
+        start = tail.rfind('"export_footer"')
+        if start == -1:
+            # without a footer the tail ends in message records, every one
+            # of them with a from_me key; a decompressed tail is a whole member
+            return '"from_me"' in tail or bool(self.compression), None
+        start = tail.index(':', start) + 1
+        try:
+            footer, _ = json.JSONDecoder().raw_decode(tail[start:].lstrip())
+        except ValueError:
+            return True, None
+        return True, footer
+
+    def _decompress_tail(self, tail):
+        # the footer is the last gzip member / zstd frame: try the magic
+        # bytes from the end until one decompresses a whole member that ends
+        # at EOF. Returns (decided, text) like _parse_footer
+        magic = _MAGIC[self.compression]
+        start = len(tail)
+        while True:
+            start = tail.rfind(magic, 0, start)
+            if start == -1:
+                # the last member starts before the tail
+                return False, None
+            member = zlib.decompressobj(31) if self.compression == 'gzip' else \
+                zstandard.ZstdDecompressor().decompressobj()
+            try:
+                data = member.decompress(tail[start:])
+            except _DECOMPRESS_ERRORS:
+                # the magic bytes were part of compressed data, not a member start
+                continue
+            if not member.eof:
+                continue
+            if member.unused_data:
+                # a member after it was cut off: an interrupted export
+                return True, None
+            try:
+                text = data.decode('utf-8')
+            except UnicodeDecodeError:
+                return True, None
+            return True, text if 'export_footer' in text else None
+
+    def summary(self):
+        footer = self.footer()
+        if footer:
+            return footer
+        total = from_me = 0
+        for message in self.iter_messages():
+            total += 1
+            if message.get('from_me'):
+                from_me += 1
+        return {
+            'total_messages': total,
+            'messages_from_me': from_me,
+            'messages_from_other': total - from_me
+        }
+
+
+def _message_timestamp(message):
+    timestamp = message.get('date_timestamp')
+    if timestamp is None:
+        # exports written before date_timestamp existed
+        timestamp = datetime.strptime(message['date'], '%Y-%m-%d %H:%M:%S').replace(
+            tzinfo=timezone.utc).timestamp()
+    return timestamp
+
+
+class _JsonStreamParser:
+    # incremental parser for {"key": value, "messages": [...], ...} documents:
+    # every value except the messages array is small and decoded whole,
+    # messages are decoded one element at a time from a sliding buffer
+    _WHITESPACE = ' \t\r\n'
+
+    def __init__(self, f, chunk_size, name):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.name = name
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+        # characters dropped from the front of buf, and where in the stream
+        # the last decoded value started and ended
+        self.consumed = 0
+        self.value_span = None
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.consumed += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self._WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                raise ValueError(f"Неожиданный конец файла {self.name}")
+            self._fill()
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Ожидался '{char}' в позиции {self.pos} файла {self.name}")
+        self.pos += 1
+
+    def _value(self):
+        while True:
+            self._peek()
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # a number ending exactly at the buffer edge may be cut short
+            if end == len(self.buf) and not self.eof:
+                self._fill()
+                continue
+            self.value_span = (self.consumed + self.pos, self.consumed + end)
+            self.pos = end
+            return value
+
+    def sections(self):
+        self._expect('{')
+        while True:
+            char = self._peek()
+            if char == '}':
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            key = self._value()
+            self._expect(':')
+            if key == 'messages' and self._peek() == '[':
+                self.pos += 1
+                while True:
+                    char = self._peek()
+                    if char == ']':
+                        self.pos += 1
+                        break
+                    if char == ',':
+                        self.pos += 1
+                        continue
+                    yield 'message', self._value()
+            else:
+                yield key, self._value()
@@ -0,0 +1,369 @@
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from telethon.errors import FloodWaitError, TakeoutInitDelayError
+from telethon.tl.types import (Channel, ChatPhotoEmpty, DocumentAttributeFilename, Document,
+                               MessageMediaDocument, MessageMediaPhoto, PeerUser, Photo,
+                               PhotoSize, User)
+from telethon.utils import get_peer_id
+
+# Offline stand-in for TelegramClient: serves synthetic dialogs with
+# configurable per-request latency and server-side flood limits
+
+# same logger and message as Telethon, so flood sleeps show up in metrics
+_log = logging.getLogger('telethon.client.users')
+
+
+class FakeMessage:
+    __slots__ = ('id', 'date', 'from_id', 'text', 'media', 'reply_to',
+                 'reply_to_msg_id', 'edit_date', 'forward', 'out', 'sender', 'sender_id',
+                 'chat_id', 'post_author')
+
+    def __init__(self, id, date, from_id, text, media=None, reply_to_msg_id=None,
+                 edit_date=None, forward=None, out=False, sender=None, sender_id=None,
+                 chat_id=None, post_author=None):
+        self.id = id
+        self.date = date
+        self.from_id = from_id
+        self.text = text
+        self.media = media
+        self.reply_to = object() if reply_to_msg_id else None
+        self.reply_to_msg_id = reply_to_msg_id
+        self.edit_date = edit_date
+        self.forward = forward
+        # what Telethon fills in from the users and chats sent with each chunk
+        self.out = out
+        self.sender = sender
+        self.sender_id = sender_id
+        self.chat_id = chat_id
+        self.post_author = post_author
+
+
+class FakeForward:
+    __slots__ = ('from_name', 'date')
+
+    def __init__(self, from_name, date):
+        self.from_name = from_name
+        self.date = date
+
+
+class FakeTotalList(list):
+    # what get_messages returns: a page of messages plus the dialog size
+    total = 0
+
+
+class FakeSession:
+    # the takeout id survives in the session file until the takeout is finished
+    takeout_id = None
+
+
+class FakeTakeoutClient:
+    # Like Telethon's takeout proxy: client methods run with the proxy as
+    # self, so the requests they make are counted against the takeout limit
+    def __init__(self, client):
+        object.__setattr__(self, '_client', client)
+
+    async def __aenter__(self):
+        client = self._client
+        if client.takeout_delay:
+            raise TakeoutInitDelayError(request=None, capture=client.takeout_delay)
+        client.session.takeout_id = 1
+        client.takeouts += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self._client.session.takeout_id = None
+
+    async def _request(self):
+        await self._client._request(takeout=True)
+
+    def __getattr__(self, name):
+        value = getattr(self._client, name)
+        if inspect.ismethod(value):
+            return functools.partial(getattr(type(self._client), name), self)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
+
+
+class FakeDialog:
+    def __init__(self, entity, date, unread_count=0, pinned=False):
+        self.entity = entity
+        self.date = date
+        self.unread_count = unread_count
+        self.pinned = pinned
+
+
+class FakeTelegramClient:
+    def __init__(self, dialogs=10, messages_per_dialog=1000, latency=0.0, flood_rate=0.0,
+                 max_requests_per_second=None, flood_seconds=1, chunk_size=100, seed=0,
+                 media_rate=0.0, media_pool=50, media_size=64 * 1024, text_words=(1, 40),
+                 forward_rate=0.0, edit_rate=0.0, reply_rate=0.0, id_stride=1, groups=0, channels=0,
+                 group_members=50, takeout_requests_per_second=None, takeout_delay=0):
+        self.dialog_count = dialogs
+        self.messages_per_dialog = messages_per_dialog
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.max_requests_per_second = max_requests_per_second
+        self.flood_seconds = flood_seconds
+        # requests through takeout() have their own, usually higher, limit;
+        # takeout_delay > 0 refuses the takeout like TakeoutInitDelayError
+        self.takeout_requests_per_second = takeout_requests_per_second
+        self.takeout_delay = takeout_delay
+        self.session = FakeSession()
+        self.takeouts = 0
+        self.chunk_size = chunk_size
+        self.seed = seed
+        # media_rate of the messages carry a photo or document picked from a
+        # pool of media_pool files, so the same file shows up many times
+        self.media_rate = media_rate
+        self.media_pool = media_pool
+        self.media_size = media_size
+        # message shape: text length in words and how often a message is
+        # forwarded, edited later or a reply to an earlier one
+        self.text_words = text_words
+        self.forward_rate = forward_rate
+        self.edit_rate = edit_rate
+        self.reply_rate = reply_rate
+        # private chat ids come from one per-account counter: with id_stride=k
+        # only every k-th id belongs to a dialog
+        self.id_stride = id_stride
+        self.flood_sleep_threshold = 60
+        self.requests = 0
+        self.floods = 0
+        self._random = random.Random(seed)
+        self._request_times = []
+        self._takeout_request_times = []
+        self._epoch = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.me = User(id=1, first_name='Я', last_name=None, username='me', bot=False)
+        self.users = [
+            User(id=1000 + i, first_name=f'Контакт {i}', last_name=None,
+                 username=f'contact{i}' if i % 3 else None, bot=False)
+            for i in range(dialogs)
+        ]
+        # supergroups share one pool of group_members senders; channel posts
+        # are sent by the channel itself
+        self.members = [
+            User(id=100000 + i, first_name=f'Участник {i}', last_name=None,
+                 username=f'member{i}' if i % 2 else None, bot=False)
+            for i in range(group_members)
+        ]
+        self.chats = [
+            Channel(id=5000 + i, title=f'Группа {i}', photo=ChatPhotoEmpty(), date=None, access_hash=0,
+                    megagroup=True, username=f'group{i}' if i % 2 else None)
+            for i in range(groups)
+        ] + [
+            Channel(id=6000 + i, title=f'Канал {i}', photo=ChatPhotoEmpty(), date=None, access_hash=0,
+                    broadcast=True, signatures=bool(i % 2), username=f'channel{i}')
+            for i in range(channels)
+        ]
+
+    async def start(self):
+        return self
+
+    async def connect(self):
+        pass
+
+    async def is_user_authorized(self):
+        return True
+
+    async def get_me(self):
+        return self.me
+
+    async def disconnect(self):
+        pass
+
+    def takeout(self, finalize=True, **kwargs):
+        return FakeTakeoutClient(self)
+
+    async def get_dialogs(self):
+        return [dialog async for dialog in self.iter_dialogs()]
+
+    async def iter_dialogs(self, limit=None):
+        # newest first, like Telegram, fetched in pages of 100
+        dialogs = [
+            FakeDialog(entity, self._epoch + timedelta(days=i), unread_count=i % 4)
+            for i, entity in enumerate(self.users + self.chats)
+        ]
+        dialogs.reverse()
+        for start in range(0, len(dialogs), 100):
+            await self._request()
+            for dialog in dialogs[start:start + 100]:
+                yield dialog
+
+    async def iter_messages(self, entity, limit=None, *, offset_id=0, max_id=0, min_id=0,
+                            reverse=False, wait_time=None, **kwargs):
+        stride = self.id_stride
+        lower = max(min_id, 0)
+        upper = self.messages_per_dialog * stride + 1
+        if max_id:
+            upper = min(upper, max_id)
+        if offset_id:
+            if reverse:
+                lower = max(lower, offset_id)
+            else:
+                upper = min(upper, offset_id)
+
+        if reverse:
+            ids = range(lower // stride * stride + stride, upper, stride)
+        else:
+            ids = range((upper - 1) // stride * stride, lower, -stride)
+        if limit is not None:
+            ids = ids[:int(limit)]
+
+        for start in range(0, len(ids), self.chunk_size):
+            await self._request()
+            for message_id in ids[start:start + self.chunk_size]:
+                yield self.make_message(entity, message_id)
+
+    async def get_messages(self, entity, limit=None, **kwargs):
+        messages = FakeTotalList([message async for message in self.iter_messages(entity, limit, **kwargs)])
+        messages.total = self.messages_per_dialog
+        return messages
+
+    async def get_participants(self, entity, limit=None, **kwargs):
+        participants = FakeTotalList([user async for user in self.iter_participants(entity, limit)])
+        participants.total = len(self.members)
+        return participants
+
+    async def iter_participants(self, entity, limit=None, **kwargs):
+        # pages of 200, like GetParticipantsRequest; limit=0 is one request
+        # for the count only
+        members = self.members[:limit] if limit is not None else self.members
+        if not members:
+            await self._request()
+        for start in range(0, len(members), 200):
+            await self._request()
+            for user in members[start:start + 200]:
+                yield user
+
+    def make_message(self, entity, message_id):
+        peer_id = entity.id
+        rnd = random.Random(hash((self.seed, peer_id, message_id)))
+        from_me = rnd.random() < 0.5
+        words = rnd.randint(*self.text_words)
+        date = self._epoch + timedelta(seconds=message_id * 97)
+        media = None
+        if self.media_rate and rnd.random() < self.media_rate:
+            media = self.make_media(rnd.randrange(self.media_pool))
+        forward = None
+        if self.forward_rate and rnd.random() < self.forward_rate:
+            forward = FakeForward(f'Канал {rnd.randrange(20)}', date - timedelta(days=rnd.randint(1, 30)))
+        edit_date = None
+        if self.edit_rate and rnd.random() < self.edit_rate:
+            edit_date = date + timedelta(minutes=rnd.randint(1, 600))
+        reply_to_msg_id = None
+        if self.reply_rate and message_id > 1 and rnd.random() < self.reply_rate:
+            reply_to_msg_id = rnd.randint(max(1, message_id - 50), message_id - 1)
+        text = ' '.join(rnd.choice(_WORDS) for _ in range(words))
+        chat_id = get_peer_id(entity)
+        if isinstance(entity, Channel) and not entity.megagroup:
+            return FakeMessage(
+                id=message_id, date=date, from_id=None, text=text, media=media,
+                reply_to_msg_id=reply_to_msg_id, edit_date=edit_date, forward=forward,
+                sender=entity, sender_id=chat_id, chat_id=chat_id,
+                post_author=f'Автор {message_id % 3}' if entity.signatures else None
+            )
+        if isinstance(entity, Channel):
+            sender = self.me if from_me else self.members[rnd.randrange(len(self.members))]
+        else:
+            sender = self.me if from_me else entity
+        return FakeMessage(
+            id=message_id,
+            date=date,
+            from_id=PeerUser(sender.id),
+            text=text,
+            media=media,
+            reply_to_msg_id=reply_to_msg_id,
+            edit_date=edit_date,
+            forward=forward,
+            out=from_me,
+            sender=sender,
+            sender_id=sender.id,
+            chat_id=chat_id
+        )
+
+    def make_media(self, media_id):
+        size = self.media_size + media_id % 10 * 1000
+        if media_id % 2:
+            return MessageMediaPhoto(photo=Photo(
+                id=media_id, access_hash=0, file_reference=b'', date=self._epoch, dc_id=2,
+                sizes=[PhotoSize(type='y', w=1280, h=720, size=size)]
+            ))
+        return MessageMediaDocument(document=Document(
+            id=media_id, access_hash=0, file_reference=b'', date=self._epoch, dc_id=2,
+            mime_type='application/pdf', size=size,
+            attributes=[DocumentAttributeFilename(file_name=f'file_{media_id}.pdf')]
+        ))
+
+    async def iter_download(self, file, *, offset=0, request_size=512 * 1024, **kwargs):
+        size = file.size if isinstance(file, Document) else file.sizes[-1].size
+        # ids equal modulo 10 share content (and media kind), to exercise
+        # deduplication by hash on top of deduplication by id
+        content = random.Random(file.id % 10).randbytes(size)
+        for start in range(offset, size, request_size):
+            await self._request()
+            yield content[start:start + request_size]
+
+    async def _request(self, takeout=False):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        flooded = False
+        now = time.monotonic()
+        limit = self.takeout_requests_per_second if takeout else self.max_requests_per_second
+        if limit:
+            # requests of the last second, including the ones that flooded
+            attr = '_takeout_request_times' if takeout else '_request_times'
+            times = [t for t in getattr(self, attr) if now - t < 1.0]
+            flooded = len(times) >= limit
+            times.append(now)
+            setattr(self, attr, times)
+
+        if self.flood_rate and self._random.random() < self.flood_rate:
+            flooded = True
+
+        if flooded:
+            self.floods += 1
+            # like Telethon, short waits are slept through instead of raised
+            if self.flood_seconds <= self.flood_sleep_threshold:
+                _log.info('Sleeping%s for %ds (%s) on %s flood wait', '', self.flood_seconds,
+                          timedelta(seconds=self.flood_seconds), 'GetHistoryRequest')
+                await asyncio.sleep(self.flood_seconds)
+            else:
+                raise FloodWaitError(request=None, capture=self.flood_seconds)
+
+
+_WORDS = ('привет', 'как', 'дела', 'хорошо', 'спасибо', 'завтра', 'встреча', 'код',
+          'релиз', 'тест', 'hello', 'ok', 'да', 'нет', 'файл', 'ссылка', 'фото', 'позже')
+
+
+async def _demo():
+    import os
+    import tempfile
+
+    import main
+
+    client = FakeTelegramClient(dialogs=20, messages_per_dialog=2000, latency=0.01, flood_rate=0.02,
+                                media_rate=0.02)
+    os.chdir(tempfile.mkdtemp(prefix='fake_export_'))
+    main.CHECKPOINT_FILE = os.path.abspath('export_checkpoints.json')
+    main.DOWNLOAD_MEDIA = True
+    exporter = main.TelegramDialogExporter(client=client)
+    await exporter.authenticate()
+    dialogs = await exporter.get_dialogs()
+    await exporter.export_dialogs_batch(dialogs, concurrency=8)
+    await exporter.media.close()
+    print(f"🖼 Медиа: {exporter.media.summary()}")
+    print(f"📁 Файлы: {os.getcwd()}")
+
+
+if __name__ == '__main__':
+    asyncio.run(_demo())
@@ -0,0 +1,218 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+
+import main
+
+# Unattended archiving for cron or a service: no prompts, dialogs picked by
+# include/exclude filters, one connection reused across periodic incremental
+# sweeps. The config is a JSON object: UPPERCASE keys override the settings
+# at the top of main.py, lowercase keys are the options below.
+#
+#   {"API_ID": 12345, "API_HASH": "...", "EXPORT_FORMAT": "ndjson",
+#    "EXPORT_COMPRESSION": "zstd", "directory": "archive",
+#    "include": ["@alice", "Иван*", 777000], "exclude": ["*бот*"],
+#    "interval": 86400, "concurrency": 8, "report": "sweeps.jsonl"}
+
+DEFAULT_OPTIONS = {
+    # where exports, checkpoints and caches go, relative to the config file
+    'directory': '.',
+    # patterns: a number is a dialog id (the user id, -100… for supergroups
+    # and channels), '@name' matches the username, anything else the display
+    # name; * and ? wildcards, case-insensitive
+    'include': [],
+    'exclude': [],
+    # seconds between sweep starts; 0 runs a single sweep
+    'interval': 0,
+    # None: BATCH_CONCURRENCY, read once the config's settings are applied
+    'concurrency': None,
+    # dialogs whose last message is older than their finished export are not
+    # requested at all
+    'skip_unchanged': True,
+    # re-render the HTML viewer of every dialog that got new messages, in
+    # worker processes while the next dialogs are fetched
+    'html': False,
+    # one JSON line per sweep is appended here
+    'report': 'sweeps.jsonl'
+}
+
+# a message that arrived while the export was being finished would otherwise
+# wait for the next message in that dialog
+_SKIP_MARGIN = timedelta(minutes=1)
+
+
+def load_config(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    settings = {}
+    options = dict(DEFAULT_OPTIONS)
+    for key, value in config.items():
+        if key.isupper() and hasattr(main, key):
+            settings[key] = value
+        elif key in DEFAULT_OPTIONS:
+            options[key] = value
+        else:
+            raise ValueError(f"Неизвестный параметр в {path}: {key}")
+    return settings, options
+
+
+def dialog_matches(dialog, pattern):
+    if isinstance(pattern, int) or str(pattern).lstrip('-').isdigit():
+        return dialog['dialog_id'] == int(pattern)
+    pattern = pattern.lower()
+    if pattern.startswith('@'):
+        return fnmatchcase((dialog['username'] or '').lower(), pattern[1:])
+    return fnmatchcase(dialog['name'].lower(), pattern)
+
+
+def select_dialogs(dialogs, include=(), exclude=()):
+    selected = [dialog for dialog in dialogs
+                if not include or any(dialog_matches(dialog, pattern) for pattern in include)]
+    return [dialog for dialog in selected if not any(dialog_matches(dialog, pattern) for pattern in exclude)]
+
+
+class HeadlessArchiver:
+    def __init__(self, exporter, options):
+        self.exporter = exporter
+        self.options = options
+        self.sweeps = 0
+        self._stop = asyncio.Event()
+        self._sweep_task = None
+
+    def stop(self):
+        # checkpoints are saved as the export goes, so an interrupted sweep
+        # loses nothing: the next run continues where it stopped
+        self._stop.set()
+        if self._sweep_task:
+            self._sweep_task.cancel()
+
+    def is_unchanged(self, dialog):
+        checkpoint = self.exporter.usable_checkpoint(dialog['dialog_id'], main.EXPORT_FORMAT)
+        if not checkpoint or checkpoint.get('status') != 'complete' or not checkpoint.get('completed_at'):
+            return False
+        completed_at = datetime.strptime(checkpoint['completed_at'], '%Y-%m-%d %H:%M:%S').astimezone()
+        return dialog['last_message_date'] < completed_at - _SKIP_MARGIN
+
+    async def sweep(self):
+        self.sweeps += 1
+        started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        dialogs = await self.exporter.get_dialogs()
+        selected = select_dialogs(dialogs, self.options['include'], self.options['exclude'])
+        queued = [dialog for dialog in selected
+                  if not (self.options['skip_unchanged'] and self.is_unchanged(dialog))]
+        print(f"\n🌙 Проход #{self.sweeps}: диалогов {len(dialogs)}, выбрано {len(selected)}, "
+              f"без изменений {len(selected) - len(queued)}")
+
+        summary = {}
+        if queued:
+            concurrency = self.options['concurrency'] or main.BATCH_CONCURRENCY
+            summary = await self.exporter.export_dialogs_batch(
+                queued, concurrency=concurrency, fmt=main.EXPORT_FORMAT, render_html=self.options['html'])
+
+        report = {
+            'sweep': self.sweeps,
+            'started_at': started_at,
+            'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'dialogs_listed': len(dialogs),
+            'dialogs_selected': len(selected),
+            'dialogs_unchanged': len(selected) - len(queued),
+            **summary
+        }
+        if self.options['report']:
+            with open(self.options['report'], 'a', encoding='utf-8') as f:
+                f.write(json.dumps(report, ensure_ascii=False) + '\n')
+        return report
+
+    async def run(self, once=False):
+        await self.exporter.authenticate(interactive=False)
+        failed = False
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self._sweep_task = asyncio.ensure_future(self.sweep())
+            try:
+                report = await self._sweep_task
+                failed = bool(report.get('dialogs_failed'))
+            except asyncio.CancelledError:
+                print("\n⏹ Проход прерван")
+                break
+            except Exception as e:
+                # a lost connection must not end the service, the next sweep retries
+                print(f"❌ Проход #{self.sweeps} не удался: {e}")
+                failed = True
+            finally:
+                self._sweep_task = None
+
+            interval = self.options['interval']
+            if once or not interval:
+                break
+            delay = max(0.0, interval - (time.monotonic() - started))
+            next_at = (datetime.now() + timedelta(seconds=delay)).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"💤 Следующий проход в {next_at}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        return not failed
+
+
+def apply_settings(settings, base_dir):
+    for key, value in settings.items():
+        setattr(main, key, value)
+    # the session stays next to the config, not in the archive directory
+    main.SESSION_NAME = os.path.join(base_dir, main.SESSION_NAME)
+
+
+async def run_headless(args):
+    settings, options = load_config(args.config)
+    base_dir = os.path.dirname(os.path.abspath(args.config))
+    apply_settings(settings, base_dir)
+    if main.API_ID == 'YOUR_API_ID' or main.API_HASH == 'YOUR_API_HASH':
+        print(f"❌ ОШИБКА: укажите API_ID и API_HASH в {args.config}")
+        return False
+
+    directory = os.path.join(base_dir, options['directory'])
+    os.makedirs(directory, exist_ok=True)
+    os.chdir(directory)
+
+    exporter = main.TelegramDialogExporter()
+    if args.dry_run:
+        try:
+            await exporter.authenticate(interactive=False)
+            selected = select_dialogs(await exporter.get_dialogs(), options['include'], options['exclude'])
+            exporter.display_dialogs(selected)
+        finally:
+            await exporter.close()
+        return True
+
+    archiver = HeadlessArchiver(exporter, options)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, archiver.stop)
+    try:
+        return await archiver.run(once=args.once)
+    except Exception as e:
+        print(f"❌ Неожиданная ошибка: {e}")
+        return False
+    finally:
+        await exporter.close()
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description='Неинтерактивный архиватор диалогов (cron, сервис)')
+    parser.add_argument('config', help='JSON файл настроек')
+    parser.add_argument('--once', action='store_true', help='один проход, даже если задан interval')
+    parser.add_argument('--dry-run', action='store_true', help='только показать выбранные диалоги')
+    args = parser.parse_args(argv)
+    # a failed dialog makes the exit code non-zero, for cron mail and alerting
+    if not asyncio.run(run_headless(args)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_cli()
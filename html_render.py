@@ -0,0 +1,1134 @@
+import heapq
+import html
+import json
+import os
+import re
+import tempfile
+import time
+from array import array
+from functools import lru_cache
+from urllib.parse import quote
+
+from dialog_stats import StatsCollector, compute_statistics
+from export_io import ExportReader
+
+MONTHS_RU = ('января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+             'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря')
+
+MEDIA_TYPE_NAMES = {
+    'MessageMediaPhoto': '📷 Фото',
+    'MessageMediaDocument': '📎 Файл',
+    'MessageMediaVideo': '🎥 Видео',
+    'MessageMediaAudio': '🎵 Аудио',
+    'MessageMediaVoice': '🎤 Голосовое сообщение',
+    'MessageMediaSticker': '🏷 Стикер',
+    'MessageMediaGif': '🎬 GIF'
+}
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Диалог с {other_name}</title>
+    <style>
+        * {{
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }}
+        
+        body {{
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            min-height: 100vh;
+            padding: 20px;
+        }}
+        
+        .container {{
+            max-width: 800px;
+            margin: 0 auto;
+            background: white;
+            border-radius: 20px;
+            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
+            overflow: hidden;
+        }}
+        
+        .header {{
+            background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
+            color: white;
+            padding: 25px;
+            text-align: center;
+        }}
+        
+        .header h1 {{
+            font-size: 28px;
+            margin-bottom: 10px;
+        }}
+        
+        .header .info {{
+            opacity: 0.9;
+            font-size: 14px;
+        }}
+        
+        .stats {{
+            background: #f8f9fa;
+            padding: 20px;
+            border-bottom: 1px solid #e9ecef;
+            display: flex;
+            justify-content: space-around;
+            text-align: center;
+        }}
+        
+        .stat-item {{
+            flex: 1;
+        }}
+        
+        .stat-number {{
+            font-size: 24px;
+            font-weight: bold;
+            color: #4facfe;
+        }}
+        
+        .stat-label {{
+            font-size: 12px;
+            color: #6c757d;
+            text-transform: uppercase;
+        }}
+        
+        .messages {{
+            height: 60vh;
+            overflow-y: auto;
+            padding: 20px;
+            background: #f8f9fa;
+        }}
+        
+        .message {{
+            margin-bottom: 15px;
+            display: flex;
+            animation: fadeIn 0.3s ease-in;
+        }}
+        
+        @keyframes fadeIn {{
+            from {{ opacity: 0; transform: translateY(10px); }}
+            to {{ opacity: 1; transform: translateY(0); }}
+        }}
+        
+        .message.from-me {{
+            justify-content: flex-end;
+        }}
+        
+        .message.from-other {{
+            justify-content: flex-start;
+        }}
+        
+        .message-bubble {{
+            max-width: 70%;
+            padding: 12px 16px;
+            border-radius: 18px;
+            word-wrap: break-word;
+            position: relative;
+        }}
+        
+        .message.from-me .message-bubble {{
+            background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
+            color: white;
+            border-bottom-right-radius: 4px;
+        }}
+        
+        .message.from-other .message-bubble {{
+            background: white;
+            color: #333;
+            border: 1px solid #e9ecef;
+            border-bottom-left-radius: 4px;
+        }}
+        
+        .message-text {{
+            line-height: 1.4;
+            margin-bottom: 5px;
+        }}
+        
+        .message-meta {{
+            font-size: 11px;
+            opacity: 0.7;
+            text-align: right;
+        }}
+        
+        .message.from-other .message-meta {{
+            color: #6c757d;
+        }}
+        
+        .media-info {{
+            font-style: italic;
+            color: #6c757d;
+            font-size: 12px;
+            margin-bottom: 5px;
+        }}
+        
+        .media-info a {{
+            color: inherit;
+        }}
+        
+        .media-photo {{
+            display: block;
+            max-width: 100%;
+            max-height: 320px;
+            border-radius: 12px;
+            margin-top: 5px;
+        }}
+        
+        .forward-info {{
+            font-size: 12px;
+            opacity: 0.8;
+            margin-bottom: 5px;
+            padding: 5px;
+            background: rgba(255,255,255,0.1);
+            border-radius: 5px;
+        }}
+        
+        .sender-name {{
+            font-size: 13px;
+            font-weight: 600;
+            color: #4a76a8;
+            margin-bottom: 3px;
+        }}
+        
+        .date-separator {{
+            text-align: center;
+            margin: 30px 0 20px 0;
+            position: relative;
+        }}
+        
+        .date-separator::before {{
+            content: '';
+            position: absolute;
+            top: 50%;
+            left: 0;
+            right: 0;
+            height: 1px;
+            background: #dee2e6;
+        }}
+        
+        .date-separator span {{
+            background: #f8f9fa;
+            padding: 5px 15px;
+            color: #6c757d;
+            font-size: 12px;
+            font-weight: bold;
+        }}
+        
+        .search-box {{
+            padding: 15px 20px;
+            border-bottom: 1px solid #e9ecef;
+            background: white;
+        }}
+        
+        .search-input {{
+            width: 100%;
+            padding: 10px 15px;
+            border: 2px solid #e9ecef;
+            border-radius: 25px;
+            font-size: 14px;
+            outline: none;
+            transition: border-color 0.3s;
+        }}
+        
+        .search-input:focus {{
+            border-color: #4facfe;
+        }}
+        
+        .highlight {{
+            background: yellow;
+            padding: 2px 4px;
+            border-radius: 3px;
+        }}
+        
+        .messages.searching .message:not(.match),
+        .messages.searching .date-separator,
+        .chunk.no-match {{
+            display: none;
+        }}
+        
+        ::-webkit-scrollbar {{
+            width: 6px;
+        }}
+        
+        ::-webkit-scrollbar-track {{
+            background: #f1f1f1;
+        }}
+        
+        ::-webkit-scrollbar-thumb {{
+            background: #4facfe;
+            border-radius: 3px;
+        }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>💬 Диалог с {other_name}</h1>
+            <div class="info">
+                Экспортировано: {exported_at} | 
+                Участники: {me_name} ↔ {other_name}
+            </div>
+        </div>
+        
+        <div class="stats">
+            <div class="stat-item">
+                <div class="stat-number">{total_messages}</div>
+                <div class="stat-label">Сообщений</div>
+            </div>
+            <div class="stat-item">
+                <div class="stat-number">{messages_from_me}</div>
+                <div class="stat-label">От меня</div>
+            </div>
+            <div class="stat-item">
+                <div class="stat-number">{messages_from_other}</div>
+                <div class="stat-label">От собеседника</div>
+            </div>
+        </div>
+        
+        <details class="stats-details" id="statsDetails" hidden>
+            <summary>📈 Статистика переписки</summary>
+            <div id="statsPanel"></div>
+        </details>
+        
+        {toolbar}
+        
+        <div class="messages" id="messagesContainer">
+"""
+
+SEARCH_BOX = """<div class="search-box">
+            <input type="text" class="search-input" placeholder="🔍 Поиск по сообщениям..." id="searchInput">
+        </div>"""
+
+DATE_SEPARATOR = """
+            <div class="date-separator">
+                <span>{date}</span>
+            </div>
+"""
+
+MESSAGE = """
+            <div class="message {message_class}" data-n="{n}">
+                <div class="message-bubble">
+                    {sender_info}{forward_info}
+                    {media_info}
+                    <div class="message-text">{text}</div>
+                    <div class="message-meta">{time}</div>
+                </div>
+            </div>
+"""
+
+FORWARD_INFO = '<div class="forward-info">📤 Переслано</div>'
+
+PAGE_FOOT = """
+        </div>
+    </div>
+"""
+
+# Search runs against the inverted index written next to the page in shards
+# split by token (SEARCH_SHARDS holds the first token of each): a query loads
+# only the shards its terms fall into, tokens are looked up by prefix,
+# matching messages get the .match class and are highlighted only once they
+# scroll into view
+SEARCH_SCRIPT = r"""
+        const searchInput = document.getElementById('searchInput');
+        const messagesContainer = document.getElementById('messagesContainer');
+        const searchShards = new Map();
+        const searchShardsLoading = new Set();
+        let currentMatches = null;
+        let currentHighlight = null;
+        let markedMessages = [];
+        let searchTimer = null;
+
+        window.dialogSearchShardLoaded = function(number, shard) {
+            shard.decoded = new Map();
+            searchShards.set(number, shard);
+            searchShardsLoading.delete(number);
+            applySearch();
+        };
+
+        function shardsFor(term) {
+            // the shard that would hold the term, and the following ones
+            // while their tokens may still start with it
+            if (!SEARCH_SHARDS.length) return [];
+            let lo = 0;
+            let hi = SEARCH_SHARDS.length;
+            while (lo < hi) {
+                const mid = (lo + hi) >> 1;
+                if (SEARCH_SHARDS[mid] <= term) lo = mid + 1; else hi = mid;
+            }
+            const shards = [Math.max(0, lo - 1)];
+            for (let i = lo; i < SEARCH_SHARDS.length && SEARCH_SHARDS[i].startsWith(term); i++) shards.push(i);
+            return shards;
+        }
+
+        function loadShards(shards) {
+            // true once all of them are loaded
+            let loaded = true;
+            for (const number of shards) {
+                if (searchShards.has(number)) continue;
+                loaded = false;
+                if (searchShardsLoading.has(number)) continue;
+                searchShardsLoading.add(number);
+                const script = document.createElement('script');
+                script.src = SEARCH_DIR + '/shard_' + String(number).padStart(6, '0') + '.js';
+                document.head.appendChild(script);
+            }
+            return loaded;
+        }
+
+        function tokenize(text) {
+            return text.toLowerCase().replace(/ё/g, 'е').match(/[\p{L}\p{N}_]+/gu) || [];
+        }
+
+        function postings(shard, i) {
+            let list = shard.decoded.get(i);
+            if (!list) {
+                list = [];
+                let n = 0;
+                for (const delta of shard.postings[i].split(',')) {
+                    n += parseInt(delta, 36);
+                    list.push(n);
+                }
+                shard.decoded.set(i, list);
+            }
+            return list;
+        }
+
+        function lookupPrefix(term) {
+            const found = new Set();
+            for (const number of shardsFor(term)) {
+                const shard = searchShards.get(number);
+                const tokens = shard.tokens;
+                let lo = 0;
+                let hi = tokens.length;
+                while (lo < hi) {
+                    const mid = (lo + hi) >> 1;
+                    if (tokens[mid] < term) lo = mid + 1; else hi = mid;
+                }
+                for (let i = lo; i < tokens.length && tokens[i].startsWith(term); i++) {
+                    for (const n of postings(shard, i)) found.add(n);
+                }
+            }
+            return found;
+        }
+
+        function findMatches(terms) {
+            const sets = terms.map(lookupPrefix).sort((a, b) => a.size - b.size);
+            let result = sets[0];
+            for (const other of sets.slice(1)) {
+                result = new Set([...result].filter(n => other.has(n)));
+            }
+            return result;
+        }
+
+        function escapeRegExp(text) {
+            return text.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
+        }
+
+        const highlightObserver = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (!entry.isIntersecting) return;
+                highlightObserver.unobserve(entry.target);
+                highlightText(entry.target.querySelector('.message-text'));
+            });
+        }, { root: messagesContainer });
+
+        function highlightText(el) {
+            if (!currentHighlight) return;
+            const walker = document.createTreeWalker(el, NodeFilter.SHOW_TEXT);
+            const nodes = [];
+            while (walker.nextNode()) nodes.push(walker.currentNode);
+            nodes.forEach(node => {
+                const parts = node.nodeValue.split(currentHighlight);
+                if (parts.length === 1) return;
+                const fragment = document.createDocumentFragment();
+                parts.forEach((part, i) => {
+                    if (!part) return;
+                    if (i % 2) {
+                        const span = document.createElement('span');
+                        span.className = 'highlight';
+                        span.textContent = part;
+                        fragment.appendChild(span);
+                    } else {
+                        fragment.appendChild(document.createTextNode(part));
+                    }
+                });
+                node.replaceWith(fragment);
+            });
+        }
+
+        function markMatch(message) {
+            message.classList.add('match');
+            markedMessages.push(message);
+            highlightObserver.observe(message);
+        }
+
+        function unmarkMatch(message) {
+            message.classList.remove('match');
+            highlightObserver.unobserve(message);
+            const el = message.querySelector('.message-text');
+            const spans = el.querySelectorAll('span.highlight');
+            if (!spans.length) return;
+            spans.forEach(span => span.replaceWith(document.createTextNode(span.textContent)));
+            el.normalize();
+        }
+
+        function applySearch() {
+            const terms = tokenize(searchInput.value);
+            // applySearch runs again as each missing shard arrives
+            if (!loadShards(terms.flatMap(shardsFor))) return;
+            markedMessages.forEach(unmarkMatch);
+            markedMessages = [];
+            currentMatches = terms.length ? findMatches(terms) : null;
+            currentHighlight = terms.length
+                ? new RegExp('(' + terms.map(t => escapeRegExp(t).replace(/е/g, '[её]')).join('|') + ')', 'giu')
+                : null;
+            messagesContainer.classList.toggle('searching', currentMatches !== null);
+            showMatches();
+        }
+
+        searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(applySearch, 150);
+        });
+"""
+
+SINGLE_PAGE_SCRIPT = r"""
+        let messageElements = null;
+
+        function showMatches() {
+            if (currentMatches) {
+                if (!messageElements) {
+                    messageElements = messagesContainer.querySelectorAll('.message');
+                }
+                currentMatches.forEach(n => markMatch(messageElements[n]));
+            }
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        }
+
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+"""
+
+PAGED_STYLE = """
+    <style>
+        .messages {
+            overflow-anchor: none;
+        }
+
+        .message {
+            animation: none;
+        }
+    </style>
+"""
+
+STATS_STYLE = """
+    <style>
+        .stats-details {
+            padding: 10px 20px;
+            border-bottom: 1px solid #e9ecef;
+            font-size: 13px;
+            color: #495057;
+        }
+
+        .stats-details summary {
+            cursor: pointer;
+            color: #4facfe;
+            font-weight: 600;
+        }
+
+        .stats-details h3 {
+            font-size: 13px;
+            margin: 15px 0 5px;
+        }
+
+        .stats-chart {
+            display: flex;
+            align-items: flex-end;
+            gap: 2px;
+            height: 80px;
+        }
+
+        .stats-bar {
+            flex: 1;
+            height: 100%;
+            display: flex;
+            flex-direction: column-reverse;
+        }
+
+        .stats-bar-me {
+            background: #4facfe;
+        }
+
+        .stats-bar-other {
+            background: #adb5bd;
+        }
+
+        .stats-axis {
+            display: flex;
+            justify-content: space-between;
+            font-size: 11px;
+            color: #6c757d;
+        }
+
+        .stats-details table {
+            border-collapse: collapse;
+            width: 100%;
+        }
+
+        .stats-details td, .stats-details th {
+            padding: 3px 6px;
+            text-align: right;
+            border-bottom: 1px solid #e9ecef;
+        }
+
+        .stats-details td:first-child, .stats-details th:first-child {
+            text-align: left;
+        }
+    </style>
+"""
+
+# Charts are plain divs sized in percent, built from DIALOG_STATS once the
+# panel is first opened
+STATS_SCRIPT = r"""
+        (function () {
+            const details = document.getElementById('statsDetails');
+            const panel = document.getElementById('statsPanel');
+            const WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'];
+            const BUCKETS = ['< 1 мин', '1–5 мин', '5–60 мин', '1–24 ч', '> 1 дня'];
+
+            function escapeHtml(text) {
+                return String(text).replace(/[&<>"]/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;' })[c]);
+            }
+
+            function duration(seconds) {
+                if (seconds < 60) return Math.round(seconds) + ' сек';
+                if (seconds < 3600) return Math.round(seconds / 60) + ' мин';
+                if (seconds < 86400) return (seconds / 3600).toFixed(1) + ' ч';
+                return (seconds / 86400).toFixed(1) + ' дн';
+            }
+
+            function chart(title, labels, series, axis) {
+                const totals = series.me.map((count, i) => count + series.other[i]);
+                const max = totals.reduce((a, b) => Math.max(a, b), 1);
+                const bars = labels.map((label, i) =>
+                    `<div class="stats-bar" title="${escapeHtml(label)}: ${series.me[i]} / ${series.other[i]}">` +
+                    `<div class="stats-bar-me" style="height:${series.me[i] / max * 100}%"></div>` +
+                    `<div class="stats-bar-other" style="height:${series.other[i] / max * 100}%"></div></div>`).join('');
+                const ticks = axis.map(label => `<span>${escapeHtml(label)}</span>`).join('');
+                return `<h3>${title}</h3><div class="stats-chart">${bars}</div><div class="stats-axis">${ticks}</div>`;
+            }
+
+            function responses(times) {
+                const rows = [['me', STATS_NAMES.me], ['other', STATS_NAMES.other]].map(([side, name]) => {
+                    const t = times[side];
+                    if (!t.count) return `<tr><td>${escapeHtml(name)}</td><td colspan="${BUCKETS.length + 2}">—</td></tr>`;
+                    return `<tr><td>${escapeHtml(name)}</td><td>${duration(t.median_seconds)}</td><td>${duration(t.p90_seconds)}</td>` +
+                        t.buckets.map(count => `<td>${Math.round(count / t.count * 100)}%</td>`).join('') + '</tr>';
+                }).join('');
+                return '<h3>Время ответа</h3><table><tr><th></th><th>медиана</th><th>90%</th>' +
+                    BUCKETS.map(label => `<th>${label}</th>`).join('') + `</tr>${rows}</table>`;
+            }
+
+            function media(counts) {
+                const rows = Object.entries(counts).map(([type, c]) =>
+                    `<tr><td>${escapeHtml(MEDIA_TYPE_NAMES[type] || type)}</td><td>${c.me}</td><td>${c.other}</td></tr>`).join('');
+                if (!rows) return '';
+                return `<h3>Медиа</h3><table><tr><th></th><th>${escapeHtml(STATS_NAMES.me)}</th>` +
+                    `<th>${escapeHtml(STATS_NAMES.other)}</th></tr>${rows}</table>`;
+            }
+
+            function render() {
+                const s = DIALOG_STATS;
+                const hours = Array.from({ length: 24 }, (_, h) => h + ':00');
+                const months = s.by_month.months;
+                const streaks = s.streaks;
+                let html = `<p>С ${s.first_date} по ${s.last_date}, активных дней: ${streaks.active_days}. ` +
+                    `Самая длинная серия: ${streaks.longest_streak_days} дн. подряд ` +
+                    `(${streaks.longest_streak_start} — ${streaks.longest_streak_end})`;
+                if (streaks.longest_silence_days) {
+                    html += `, самый долгий перерыв: ${streaks.longest_silence_days} дн. ` +
+                        `(${streaks.longest_silence_start} — ${streaks.longest_silence_end})`;
+                }
+                html += `.</p><p><span style="color:#4facfe">■</span> ${escapeHtml(STATS_NAMES.me)} ` +
+                    `<span style="color:#adb5bd">■</span> ${escapeHtml(STATS_NAMES.other)} (время UTC)</p>`;
+                html += chart('По часам', hours, s.by_hour, ['0:00', '6:00', '12:00', '18:00', '23:00']);
+                html += chart('По дням недели', WEEKDAYS, s.by_weekday, WEEKDAYS);
+                html += chart('По месяцам', months, s.by_month, [months[0], months[months.length - 1]]);
+                html += responses(s.response_times);
+                html += media(s.media);
+                panel.innerHTML = html;
+            }
+
+            details.hidden = false;
+            details.addEventListener('toggle', () => {
+                if (details.open && !panel.innerHTML) render();
+            });
+        })();
+"""
+
+# Virtual scrolling: every chunk gets a placeholder sized by an estimate, only
+# chunks near the viewport are loaded (as <script> so it works from file://)
+# and mounted, the rest keep just their measured height
+PAGED_SCRIPT = r"""
+        const ESTIMATED_MESSAGE_HEIGHT = 70;
+        const chunkState = DIALOG_CHUNKS.map(() => ({ html: null, loading: false, mounted: false, visible: false, height: 0 }));
+        let chunkMatches = null;
+        let stickToBottom = true;
+
+        const placeholders = DIALOG_CHUNKS.map((count, index) => {
+            const el = document.createElement('div');
+            el.className = 'chunk';
+            el.dataset.index = index;
+            el.style.minHeight = placeholderHeight(index) + 'px';
+            messagesContainer.appendChild(el);
+            return el;
+        });
+
+        function placeholderHeight(index) {
+            if (chunkMatches) return chunkMatches[index] * ESTIMATED_MESSAGE_HEIGHT;
+            return chunkState[index].height || DIALOG_CHUNKS[index] * ESTIMATED_MESSAGE_HEIGHT;
+        }
+
+        window.dialogChunkLoaded = function(index, html) {
+            chunkState[index].html = html;
+            chunkState[index].loading = false;
+            if (chunkState[index].visible) {
+                mountChunk(index);
+            }
+        };
+
+        function loadChunk(index) {
+            const state = chunkState[index];
+            if (state.html !== null || state.loading) return;
+            state.loading = true;
+            const script = document.createElement('script');
+            script.src = CHUNK_DIR + '/chunk_' + String(index).padStart(6, '0') + '.js';
+            script.onload = () => script.remove();
+            document.head.appendChild(script);
+        }
+
+        function markChunkMatches(index) {
+            if (!currentMatches || !chunkMatches[index]) return;
+            const start = index * CHUNK_SIZE;
+            placeholders[index].querySelectorAll('.message').forEach((message, i) => {
+                if (currentMatches.has(start + i)) markMatch(message);
+            });
+        }
+
+        function mountChunk(index) {
+            const state = chunkState[index];
+            if (state.mounted) return;
+            if (state.html === null) {
+                loadChunk(index);
+                return;
+            }
+            const el = placeholders[index];
+            const above = el.offsetTop + el.offsetHeight <= messagesContainer.scrollTop;
+            const before = el.offsetHeight;
+            el.innerHTML = state.html;
+            el.style.minHeight = '';
+            state.mounted = true;
+            markChunkMatches(index);
+            if (stickToBottom) {
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            } else if (above) {
+                messagesContainer.scrollTop += el.offsetHeight - before;
+            }
+        }
+
+        function unmountChunk(index) {
+            const state = chunkState[index];
+            if (!state.mounted) return;
+            const el = placeholders[index];
+            if (!chunkMatches) state.height = el.offsetHeight;
+            el.style.minHeight = el.offsetHeight + 'px';
+            el.innerHTML = '';
+            state.mounted = false;
+            state.html = null;
+            markedMessages = markedMessages.filter(message => message.isConnected);
+        }
+
+        function showMatches() {
+            chunkMatches = null;
+            if (currentMatches) {
+                chunkMatches = DIALOG_CHUNKS.map(() => 0);
+                currentMatches.forEach(n => { chunkMatches[Math.floor(n / CHUNK_SIZE)] += 1; });
+            }
+            placeholders.forEach((el, index) => {
+                el.classList.toggle('no-match', chunkMatches !== null && chunkMatches[index] === 0);
+                if (chunkState[index].mounted) {
+                    markChunkMatches(index);
+                } else {
+                    el.style.minHeight = placeholderHeight(index) + 'px';
+                }
+            });
+            stickToBottom = true;
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        }
+
+        const observer = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                const index = Number(entry.target.dataset.index);
+                chunkState[index].visible = entry.isIntersecting;
+                if (entry.isIntersecting) {
+                    mountChunk(index);
+                } else {
+                    unmountChunk(index);
+                }
+            });
+        }, { root: messagesContainer, rootMargin: '150% 0px' });
+
+        placeholders.forEach(el => observer.observe(el));
+
+        ['wheel', 'touchstart', 'keydown', 'mousedown'].forEach(type => {
+            messagesContainer.addEventListener(type, () => { stickToBottom = false; }, { passive: true });
+        });
+
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+"""
+
+PAGE_END = """
+</body>
+</html>"""
+
+
+# message dates are 'YYYY-MM-DD HH:MM:SS', so labels are cut out of the
+# string instead of parsing it; a day label is built once per day
+@lru_cache(maxsize=4096)
+def format_day(day):
+    return f'{day[8:10]} {MONTHS_RU[int(day[5:7]) - 1]} {day[:4]}'
+
+
+def render_message(message, n, media_href=None, show_sender=False):
+    message_text = html.escape(message['text']).replace('\n', '<br>')
+    time_str = message['date'][11:16]
+
+    media_info = ''
+    if message['media_type'] and message['media_type'] != 'NoneType':
+        media_name = MEDIA_TYPE_NAMES.get(message['media_type'], message['media_type'])
+        if message['file_name']:
+            media_name = f'{media_name}: {html.escape(message["file_name"])}'
+        if media_href and message['media_type'] == 'MessageMediaPhoto':
+            media_name = (f'<a href="{media_href}" target="_blank">{media_name}'
+                          f'<img class="media-photo" src="{media_href}" loading="lazy" alt=""></a>')
+        elif media_href:
+            media_name = f'<a href="{media_href}" target="_blank">{media_name}</a>'
+        media_info = f'<div class="media-info">{media_name}</div>'
+
+    # in groups and channels incoming messages are signed with the sender
+    sender_info = ''
+    if show_sender and not message['from_me']:
+        sender_info = f'<div class="sender-name">{html.escape(message["sender_name"])}</div>'
+
+    return MESSAGE.format(
+        message_class='from-me' if message['from_me'] else 'from-other',
+        n=n,
+        sender_info=sender_info,
+        forward_info=FORWARD_INFO if message['forward_from'] else '',
+        media_info=media_info,
+        text=message_text,
+        time=time_str
+    )
+
+
+class MediaResolver:
+    # stored media paths are relative to the directory the exporter ran in
+    # (media_base, the current directory if not given), links in the page
+    # must be relative to the page itself
+    def __init__(self, media_paths, base_dir, media_base=None):
+        self.media_paths = media_paths or {}
+        self.base_dir = base_dir
+        self.media_base = media_base
+
+    def path(self, message):
+        path = message.get('media_path') or self.media_paths.get(message.get('media_key'))
+        if not path:
+            return None
+        return os.path.abspath(os.path.join(self.media_base, path) if self.media_base else path)
+
+    def href(self, message):
+        path = self.path(message)
+        if not path:
+            return None
+        relative_path = os.path.relpath(path, self.base_dir).replace(os.sep, '/')
+        return html.escape(quote(relative_path))
+
+
+class SearchIndexBuilder:
+    # token -> ordinals of the messages containing it; the viewer script
+    # tokenizes queries the same way (lowercase, ё -> е, runs of \w).
+    # Beyond max_postings the postings are spilled to a sorted run file, so
+    # memory stays bounded however long the dialog is; write() merges the
+    # runs into shards of about shard_size bytes split by token, and the
+    # page loads only the shards a query's tokens fall into
+    _TOKEN_RE = re.compile(r'\w+')
+
+    def __init__(self, max_postings=1 << 21, shard_size=1 << 18):
+        self.max_postings = max_postings
+        self.shard_size = shard_size
+        self.postings = {}
+        self._count = 0
+        self._runs = []
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls._TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+    def add(self, n, message):
+        text = ' '.join(filter(None, (message['text'], message.get('media_caption'), message.get('file_name'))))
+        for token in set(self.tokenize(text)):
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = array('I')
+            postings.append(n)
+            self._count += 1
+        if self._count >= self.max_postings:
+            self._spill()
+
+    def _spill(self):
+        # one "token<TAB>ordinals" line per token, in index order
+        run = tempfile.TemporaryFile('w+', encoding='utf-8')
+        for token in sorted(self.postings, key=_utf16):
+            run.write(f"{token}\t{','.join(map(_base36, self.postings[token]))}\n")
+        run.seek(0)
+        self._runs.append(run)
+        self.postings = {}
+        self._count = 0
+
+    def _entries(self):
+        # (token, ordinals) in index order. Every run holds later messages
+        # than the one before, so the ordinals of a token merged in run order
+        # stay sorted
+        if not self._runs:
+            for token in sorted(self.postings, key=_utf16):
+                yield token, self.postings[token]
+            return
+        if self.postings:
+            self._spill()
+
+        def read_run(number, run):
+            for line in run:
+                token, ordinals = line.rstrip('\n').split('\t')
+                yield _utf16(token), number, token, ordinals
+
+        current, ordinals = None, []
+        for _, _, token, run_ordinals in heapq.merge(*(read_run(number, run) for number, run in enumerate(self._runs))):
+            if token != current:
+                if current is not None:
+                    yield current, ordinals
+                current, ordinals = token, []
+            ordinals.extend(int(n, 36) for n in run_ordinals.split(','))
+        if current is not None:
+            yield current, ordinals
+
+    def write(self, directory):
+        # shard_<n>.js files, postings delta-encoded in base36; returns the
+        # first token of every shard, sorted by UTF-16 code units to match
+        # JavaScript string comparison
+        os.makedirs(directory, exist_ok=True)
+        starts = []
+        tokens, encoded, size = [], [], 0
+
+        def write_shard():
+            with open(os.path.join(directory, f'shard_{len(starts):06d}.js'), 'w', encoding='utf-8') as f:
+                f.write(f'dialogSearchShardLoaded({len(starts)}, ')
+                json.dump({'tokens': tokens, 'postings': encoded}, f, ensure_ascii=False, separators=(',', ':'))
+                f.write(');\n')
+            starts.append(tokens[0])
+
+        try:
+            for token, ordinals in self._entries():
+                previous = 0
+                deltas = []
+                for n in ordinals:
+                    deltas.append(_base36(n - previous))
+                    previous = n
+                tokens.append(token)
+                encoded.append(','.join(deltas))
+                size += len(token) + len(encoded[-1]) + 6
+                if size >= self.shard_size:
+                    write_shard()
+                    tokens, encoded, size = [], [], 0
+            if tokens:
+                write_shard()
+        finally:
+            for run in self._runs:
+                run.close()
+            self._runs = []
+        return starts
+
+
+def _utf16(token):
+    return token.encode('utf-16-be')
+
+
+def _base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    if number == 0:
+        return '0'
+    result = ''
+    while number:
+        number, remainder = divmod(number, 36)
+        result = digits[remainder] + result
+    return result
+
+
+def render_html_page(export_info, messages, html_filename, stats=None, buffer_size=1 << 20,
+                     chunk_size=None, media_paths=None, media_base=None):
+    # messages may be any iterable (a list or ExportReader.iter_messages());
+    # fragments go straight to a buffered file so memory does not grow with the dialog.
+    # With chunk_size the messages go to separate chunk files for the paged viewer
+    other_user = next(p for p in export_info['dialog_participants'] if not p['is_me'])
+    me_user = next(p for p in export_info['dialog_participants'] if p['is_me'])
+    show_sender = export_info.get('dialog_type', 'private') != 'private'
+
+    # statistics come with the export when it was written in one go,
+    # otherwise they are collected while the messages are rendered
+    statistics = export_info.get('statistics') or (stats or {}).get('statistics')
+    if stats is None:
+        messages = list(messages)
+        if statistics is None:
+            statistics = compute_statistics(messages)
+        if statistics is not None:
+            stats = {key: statistics[key] for key in ('total_messages', 'messages_from_me', 'messages_from_other')}
+        else:
+            from_me = sum(1 for m in messages if m['from_me'])
+            stats = {
+                'total_messages': len(messages),
+                'messages_from_me': from_me,
+                'messages_from_other': len(messages) - from_me
+            }
+    collector = None
+    if statistics is None:
+        collector = StatsCollector()
+        messages = collector.collect(messages)
+
+    base_filename = os.path.splitext(html_filename)[0]
+    search_index = SearchIndexBuilder()
+    media_resolver = MediaResolver(media_paths, os.path.dirname(os.path.abspath(html_filename)), media_base)
+
+    with open(html_filename, 'w', encoding='utf-8', buffering=buffer_size) as f:
+        f.write(PAGE_HEAD.format(
+            other_name=html.escape(other_user['name']),
+            me_name=html.escape(me_user['name']),
+            exported_at=export_info['exported_at'],
+            total_messages=stats['total_messages'],
+            messages_from_me=stats['messages_from_me'],
+            messages_from_other=stats['messages_from_other'],
+            toolbar=SEARCH_BOX
+        ))
+
+        if chunk_size:
+            chunk_dir = base_filename + '_chunks'
+            chunk_counts = write_message_chunks(messages, chunk_dir, chunk_size, search_index, media_resolver,
+                                                show_sender)
+            f.write(PAGE_FOOT)
+            f.write(PAGED_STYLE)
+        else:
+            for fragment in render_messages(messages, search_index, media_resolver, show_sender):
+                f.write(fragment)
+            f.write(PAGE_FOOT)
+        if collector is not None:
+            statistics = collector.compute()
+        if statistics:
+            f.write(STATS_STYLE)
+
+        search_dir = base_filename + '_search'
+        search_shards = search_index.write(search_dir)
+        f.write('\n    <script>\n')
+        f.write(f'        const SEARCH_DIR = {json.dumps(os.path.basename(search_dir))};\n')
+        f.write(f'        const SEARCH_SHARDS = {script_json(search_shards)};\n')
+        if chunk_size:
+            f.write(f'        const DIALOG_CHUNKS = {json.dumps(chunk_counts)};\n')
+            f.write(f'        const CHUNK_DIR = {json.dumps(os.path.basename(chunk_dir))};\n')
+            f.write(f'        const CHUNK_SIZE = {chunk_size};\n')
+        f.write(SEARCH_SCRIPT)
+        f.write(PAGED_SCRIPT if chunk_size else SINGLE_PAGE_SCRIPT)
+        if statistics:
+            names = {'me': me_user['name'], 'other': other_user['name']}
+            f.write(f'        const DIALOG_STATS = {script_json(statistics)};\n')
+            f.write(f'        const STATS_NAMES = {script_json(names)};\n')
+            f.write(f'        const MEDIA_TYPE_NAMES = {script_json(MEDIA_TYPE_NAMES)};\n')
+            f.write(STATS_SCRIPT)
+        f.write('    </script>')
+        f.write(PAGE_END)
+
+    return html_filename
+
+
+def script_json(value):
+    # safe inside <script>: a "</script>" in a name cannot end the element
+    return json.dumps(value, ensure_ascii=False).replace('</', '<\\/')
+
+
+def render_export(export_filename, html_filename, chunk_size=None, paged_threshold=0, media_paths=None,
+                  media_base=None):
+    # export file -> HTML viewer, paged above paged_threshold messages. Takes
+    # and returns plain data so it can run in a worker process; returns the
+    # export header, its message counts and the seconds spent rendering.
+    # main.py writes exports into the directory it runs in, so relative media
+    # paths are resolved next to the export unless media_base says otherwise
+    if media_base is None:
+        media_base = os.path.dirname(os.path.abspath(export_filename))
+    reader = ExportReader(export_filename)
+    stats = reader.summary()
+    paths = dict(stats.get('media_paths') or {})
+    paths.update(media_paths or {})
+    header = reader.header()
+    started = time.perf_counter()
+    render_html_page(header, reader.iter_messages(), html_filename, stats=stats,
+                     chunk_size=chunk_size if stats['total_messages'] > paged_threshold else None,
+                     media_paths=paths, media_base=media_base)
+    return header, stats, time.perf_counter() - started
+
+
+def output_files(html_filename):
+    # everything render_html_page may write next to the page
+    base_filename = os.path.splitext(html_filename)[0]
+    return [html_filename, base_filename + '_search', base_filename + '_chunks']
+
+
+def render_messages(messages, search_index=None, media_resolver=None, show_sender=False, start=0):
+    # one fragment per message, prefixed by a date separator on a new day;
+    # start is the ordinal of the first message when rendering a slice
+    current_date = None
+    for n, message in enumerate(messages, start):
+        if search_index is not None:
+            search_index.add(n, message)
+        media_href = media_resolver.href(message) if media_resolver else None
+        fragment = render_message(message, n, media_href, show_sender)
+        message_date = message['date'][:10]
+        if current_date != message_date:
+            current_date = message_date
+            fragment = DATE_SEPARATOR.format(date=format_day(current_date)) + fragment
+        yield fragment
+
+
+def write_message_chunks(messages, chunk_dir, chunk_size, search_index=None, media_resolver=None,
+                         show_sender=False):
+    os.makedirs(chunk_dir, exist_ok=True)
+    chunk_counts = []
+    fragments = []
+    count = 0
+
+    def write_chunk():
+        chunk_filename = os.path.join(chunk_dir, f'chunk_{len(chunk_counts):06d}.js')
+        payload = json.dumps(''.join(fragments), ensure_ascii=False)
+        with open(chunk_filename, 'w', encoding='utf-8') as chunk_file:
+            chunk_file.write(f'dialogChunkLoaded({len(chunk_counts)}, {payload});\n')
+        chunk_counts.append(count)
+
+    for fragment in render_messages(messages, search_index, media_resolver, show_sender):
+        fragments.append(fragment)
+        count += 1
+        if count == chunk_size:
+            write_chunk()
+            fragments = []
+            count = 0
+
+    if fragments:
+        write_chunk()
+
+    return chunk_counts
@@ -1,24 +1,128 @@
-import asyncio
-import json
+import argparse
+import importlib
 import os
+import time
 from datetime import datetime
-from telethon import TelegramClient
-from telethon.errors import SessionPasswordNeededError
-from telethon.tl.types import User, Chat, Channel
+
+from archive_db import MessageArchive
+from checkpoints import CheckpointStore
+from columnar import ColumnarWriter
+from dialog_stats import StatsCollector
+from export_io import ExportReader, StreamingExportWriter, export_extension, export_stem, write_json_document
+from html_render import output_files, render_export, render_html_page
+from records import MessageRecord, as_dict
+
+# Telethon, asyncio and the modules built on them (dialog_cache, media,
+# metrics, pipeline, range_fetch, scheduler, senders) are imported inside the
+# methods that talk to Telegram: importing them takes longer than a whole
+# offline command, and render, stats, search and the other subcommands below
+# never connect
 
 # config file
 API_ID = 'YOUR_API_ID'
 API_HASH = 'YOUR_API_HASH'
 SESSION_NAME = 'account'
+# stream messages to disk while fetching instead of buffering the dialog
+STREAM_EXPORT = True
+# 'json' or 'ndjson' for export_dialog_stream
+EXPORT_FORMAT = 'json'
+# JSON without indentation and spaces, encoded with orjson when it is
+# installed (FAST_JSON_ENCODER = False keeps the json module)
+COMPACT_JSON = False
+FAST_JSON_ENCODER = True
+# None, 'gzip' or 'zstd' (needs the zstandard package): exports become
+# .json.gz / .ndjson.zst and are read back transparently; None level means
+# the codec default (gzip 6, zstd 3)
+EXPORT_COMPRESSION = None
+EXPORT_COMPRESSION_LEVEL = None
+CHECKPOINT_FILE = 'export_checkpoints.json'
+BATCH_CONCURRENCY = 4
+# larger dialogs get the paged viewer that loads messages in chunks
+PAGED_HTML_THRESHOLD = 20000
+HTML_CHUNK_SIZE = 1000
+# SQLite archive with full-text search filled during export, e.g. 'archive.sqlite3'
+ARCHIVE_DB = None
+# also write <export>.columns/ with typed .npy columns for analytics
+COLUMNAR_EXPORT = False
+# download photos and documents into a content-addressed store
+DOWNLOAD_MEDIA = False
+MEDIA_DIR = 'media'
+MEDIA_CONCURRENCY = 4
+# dialog list cache: reused as is within the TTL, then refreshed
+# incrementally; a full rescan catches deleted dialogs
+DIALOG_CACHE_FILE = 'dialogs_cache.json'
+DIALOG_CACHE_TTL = 300
+DIALOG_FULL_REFRESH_INTERVAL = 24 * 3600
+# per-stage timings, API requests and FloodWait totals are written here at
+# the end of a run: *.prom for the node_exporter textfile collector,
+# anything else as JSON; METRICS_LOG appends one JSON event per line
+METRICS_FILE = None
+METRICS_LOG = None
+# dialogs with at least PARALLEL_FETCH_MIN_MESSAGES messages to fetch are
+# downloaded as concurrent id segments of about PARALLEL_SEGMENT_MESSAGES
+PARALLEL_FETCH = True
+PARALLEL_FETCH_MIN_MESSAGES = 20000
+PARALLEL_FETCH_CONCURRENCY = 4
+PARALLEL_SEGMENT_MESSAGES = 2000
+# messages fetched ahead of the writer while it works (0: fetch and write in turns)
+PIPELINE_QUEUE_SIZE = 1000
+# processes rendering HTML from export files off the event loop (0: a thread);
+# with BATCH_HTML a batch renders each updated dialog while fetching the next
+RENDER_WORKERS = 2
+BATCH_HTML = False
+# also list groups, supergroups and channels; sender names come from an LRU
+# cache, groups with up to SENDER_PREFETCH_LIMIT members are loaded up front
+EXPORT_GROUPS = False
+SENDER_CACHE_SIZE = 50000
+SENDER_PREFETCH_LIMIT = 10000
+# activity, response time and media statistics (needs numpy): in export_info
+# of in-memory exports and in the footer of streamed exports started from
+# scratch; the HTML viewer collects them while rendering otherwise
+EXPORT_STATISTICS = True
+# bulk download for long histories: one cursor per dialog instead of the
+# parallel range fetch, with the request size and the interval between
+# requests learned from latency and FloodWait and kept in RATE_PROFILE_FILE
+# for the next run. TAKEOUT_EXPORT sends the history requests through a
+# takeout session with higher limits; Telegram may ask to confirm it in
+# another client first, the export then runs on the normal session
+BULK_DOWNLOAD = False
+TAKEOUT_EXPORT = False
+RATE_PROFILE_FILE = 'rate_profile.json'
 
 class TelegramDialogExporter:
-    def __init__(self):
-        self.client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+    def __init__(self, client=None):
+        from dialog_cache import DialogCache
+        from media import MediaDownloader, MediaStore
+        from metrics import MetricsRegistry
+        
+        if client is None:
+            from telethon import TelegramClient
+            client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+        self.client = client
         self.me = None
+        self.checkpoints = CheckpointStore(CHECKPOINT_FILE)
+        self.archive = MessageArchive(ARCHIVE_DB) if ARCHIVE_DB else None
+        self.metrics = MetricsRegistry(METRICS_LOG)
+        self.metrics.instrument(self.client)
+        self.dialog_cache = DialogCache(DIALOG_CACHE_FILE, DIALOG_CACHE_TTL, DIALOG_FULL_REFRESH_INTERVAL)
+        self.media = MediaDownloader(self.client, MediaStore(MEDIA_DIR), MEDIA_CONCURRENCY) if DOWNLOAD_MEDIA else None
+        self.render_pool = None
+        self.rate_profile = None
+        self.bulk_limiter = None
+        self.takeout = None
+        
+    async def authenticate(self, interactive=True):
+        from telethon.errors import SessionPasswordNeededError
         
-    async def authenticate(self):
         print("Подключение к Telegram...")
-        await self.client.start()
+        if not interactive:
+            # no prompts without a terminal: the session must already be signed in
+            await self.client.connect()
+            if not await self.client.is_user_authorized():
+                raise RuntimeError(f"Сессия {SESSION_NAME} не авторизована, "
+                                   f"войдите один раз интерактивно: python main.py")
+        else:
+            await self.client.start()
         
         if not await self.client.is_user_authorized():
             print("Необходима авторизация")
@@ -35,517 +139,647 @@ class TelegramDialogExporter:
         self.me = await self.client.get_me()
         print(f"✅ Авторизация успешна! Вы: {self.me.first_name} {self.me.last_name or ''}")
         
-    async def get_private_dialogs(self):
-        print("\n📋 Загрузка личных диалогов...")
-        dialogs = await self.client.get_dialogs()
-        
-        private_dialogs = []
-        for i, dialog in enumerate(dialogs):
-            if isinstance(dialog.entity, User) and not dialog.entity.bot:
-                dialog_info = {
-                    'number': len(private_dialogs) + 1,
-                    'entity': dialog.entity,
-                    'name': self.get_user_display_name(dialog.entity),
-                    'username': dialog.entity.username,
-                    'user_id': dialog.entity.id,
-                    'last_message_date': dialog.date,
-                    'unread_count': dialog.unread_count
-                }
-                private_dialogs.append(dialog_info)
-        
-        return private_dialogs
+    async def get_dialogs(self, force_refresh=False):
+        from telethon.tl.types import Channel, Chat, User
+        from senders import dialog_type
+        
+        cache = self.dialog_cache
+        cache.bind(self.me.id)
+        
+        if force_refresh or not cache.is_fresh():
+            full = force_refresh or cache.needs_full_refresh()
+            print("\n📋 Загрузка диалогов..." if full else "\n📋 Обновление списка диалогов...")
+            updated = []
+            # dialogs come newest first: on an incremental pass the first
+            # unchanged dialog means everything after it is cached. Groups are
+            # cached even when not exported, so EXPORT_GROUPS can change any time
+            async for dialog in self.client.iter_dialogs():
+                entity = dialog.entity
+                if not isinstance(entity, (User, Chat, Channel)) or getattr(entity, 'bot', False):
+                    continue
+                if not full and not getattr(dialog, 'pinned', False) and cache.is_unchanged(dialog):
+                    break
+                updated.append(cache.entry_from_dialog(dialog))
+            cache.merge(updated, full)
+            cache.save()
+        
+        dialogs = []
+        for entry in cache.dialogs:
+            entity = cache.entity_from_entry(entry)
+            kind = dialog_type(entity)
+            if kind != 'private' and not EXPORT_GROUPS:
+                continue
+            dialog_info = {
+                'number': len(dialogs) + 1,
+                'entity': entity,
+                'kind': kind,
+                'name': self.get_user_display_name(entity),
+                'username': entry['username'],
+                'dialog_id': entry['peer_id'],
+                'last_message_date': cache.entry_date(entry),
+                'unread_count': entry['unread_count']
+            }
+            dialogs.append(dialog_info)
+        
+        return dialogs
     
     def get_user_display_name(self, user):
-        if user.first_name and user.last_name:
-            return f"{user.first_name} {user.last_name}"
-        elif user.first_name:
-            return user.first_name
-        elif user.username:
-            return f"@{user.username}"
-        else:
-            return f"User {user.id}"
+        from senders import display_name
+        
+        # users by name, groups and channels by title
+        return display_name(user)
     
     def display_dialogs(self, dialogs):
         print("\n" + "="*80)
-        print("ЛИЧНЫЕ ДИАЛОГИ")
+        print("ДИАЛОГИ" if EXPORT_GROUPS else "ЛИЧНЫЕ ДИАЛОГИ")
         print("="*80)
         
         for dialog in dialogs:
             username_info = f"@{dialog['username']}" if dialog['username'] else "нет username"
             last_date = dialog['last_message_date'].strftime('%Y-%m-%d %H:%M')
             unread_info = f"({dialog['unread_count']} непрочитанных)" if dialog['unread_count'] > 0 else ""
+            name = {'group': '👥 ', 'channel': '📢 '}.get(dialog['kind'], '') + dialog['name']
             
-            print(f"{dialog['number']:3d}. {dialog['name'][:35]:<35} | {username_info:<20} | {last_date} {unread_info}")
+            print(f"{dialog['number']:3d}. {name[:35]:<35} | {username_info:<20} | {last_date} {unread_info}")
         
         print("="*80)
     
+    def build_message_record(self, message, user_name, me_name, senders=None):
+        if senders is None:
+            # private dialog: every message is either mine or theirs
+            is_from_me = message.from_id and message.from_id.user_id == self.me.id
+            sender_name = me_name if is_from_me else user_name
+        else:
+            is_from_me = bool(message.out)
+            sender_name = me_name if is_from_me else senders.name(message)
+        
+        media = message.media
+        message_info = MessageRecord(
+            id=message.id,
+            date_timestamp=message.date.timestamp(),
+            from_me=is_from_me,
+            sender_name=sender_name,
+            text=message.text or '',
+            media_type=type(media).__name__ if media else None,
+            media_caption=getattr(media, 'caption', '') if media else '',
+            reply_to=message.reply_to_msg_id if message.reply_to else None,
+            edit_timestamp=message.edit_date.timestamp() if message.edit_date else None
+        )
+        
+        if media and hasattr(media, 'document'):
+            doc = media.document
+            if hasattr(doc, 'attributes'):
+                for attr in doc.attributes:
+                    if hasattr(attr, 'file_name'):
+                        message_info.file_name = attr.file_name
+                        break
+            message_info.file_size = getattr(doc, 'size', None)
+        
+        if message.forward:
+            forward_info = {}
+            if hasattr(message.forward, 'from_name'):
+                forward_info['from_name'] = message.forward.from_name
+            if hasattr(message.forward, 'date'):
+                forward_info['date'] = message.forward.date.strftime('%Y-%m-%d %H:%M:%S')
+            message_info.forward_from = forward_info
+        
+        return message_info
+    
+    def attach_media(self, record, message, pending_media):
+        # downloads run in the background; records whose file is not stored
+        # yet get their path from the export footer / media index later
+        if not self.media or not message.media:
+            return
+        key, path = self.media.submit(message.media)
+        if key:
+            record.media_key = key
+            record.media_path = path
+            if not path:
+                pending_media.append(key)
+    
+    def build_export_info(self, user_entity, total_messages):
+        from telethon.utils import get_peer_id
+        from senders import dialog_type
+        
+        # for a group or channel the other participant is the chat itself
+        return {
+            'exported_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'total_messages': total_messages,
+            'dialog_type': dialog_type(user_entity),
+            'dialog_participants': [
+                {
+                    'name': self.get_user_display_name(self.me),
+                    'username': self.me.username,
+                    'user_id': self.me.id,
+                    'is_me': True
+                },
+                {
+                    'name': self.get_user_display_name(user_entity),
+                    'username': getattr(user_entity, 'username', None),
+                    'user_id': get_peer_id(user_entity),
+                    'is_me': False
+                }
+            ]
+        }
+    
+    def make_export_filename(self, export_info, extension='json'):
+        other_user = next(p for p in export_info['dialog_participants'] if not p['is_me'])
+        prefix = 'user' if export_info.get('dialog_type', 'private') == 'private' else 'chat'
+        user_name = other_user['username'] or f"{prefix}_{abs(other_user['user_id'])}"
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f"dialog_{user_name}_{timestamp}.{extension}"
+    
     async def export_dialog(self, user_entity):
+        from telethon.utils import get_peer_id
+        from pipeline import prefetch
+        
         user_name = self.get_user_display_name(user_entity)
+        me_name = self.get_user_display_name(self.me)
         print(f"\n📥 Экспорт диалога с: {user_name}")
         print("🔄 Загрузка сообщений...")
         
         messages_data = []
         message_count = 0
+        pending_media = []
+        dialog_metrics = self.metrics.dialog(get_peer_id(user_entity), user_name)
+        dialog_metrics.start()
+        await self.open_bulk_session()
+        fetcher = self.make_range_fetcher(user_entity)
+        
+        collector = StatsCollector() if EXPORT_STATISTICS else None
         
         try:
-            async for message in self.client.iter_messages(user_entity):
+            senders = await self.make_sender_cache(user_entity)
+            # oldest first, so the records need no sorting afterwards
+            if fetcher:
+                messages = fetcher.messages()
+            else:
+                messages = self.client.iter_messages(user_entity, reverse=True)
+            if PIPELINE_QUEUE_SIZE:
+                messages = prefetch(messages, PIPELINE_QUEUE_SIZE)
+            async for message in dialog_metrics.timed(messages):
                 message_count += 1
-                
-                is_from_me = message.from_id and message.from_id.user_id == self.me.id
-                sender_name = self.get_user_display_name(self.me) if is_from_me else user_name
-                
-                message_info = {
-                    'id': message.id,
-                    'date': message.date.strftime('%Y-%m-%d %H:%M:%S'),
-                    'date_timestamp': message.date.timestamp(),
-                    'from_me': is_from_me,
-                    'sender_name': sender_name,
-                    'text': message.text or '',
-                    'media_type': str(type(message.media).__name__) if message.media else None,
-                    'media_caption': getattr(message.media, 'caption', '') if message.media else '',
-                    'reply_to': message.reply_to_msg_id if message.reply_to else None,
-                    'forward_from': None,
-                    'edit_date': message.edit_date.strftime('%Y-%m-%d %H:%M:%S') if message.edit_date else None,
-                    'file_name': None,
-                    'file_size': None
-                }
-                
-                if message.media and hasattr(message.media, 'document'):
-                    doc = message.media.document
-                    if hasattr(doc, 'attributes'):
-                        for attr in doc.attributes:
-                            if hasattr(attr, 'file_name'):
-                                message_info['file_name'] = attr.file_name
-                                break
-                    message_info['file_size'] = getattr(doc, 'size', None)
-                
-                if message.forward:
-                    forward_info = {}
-                    if hasattr(message.forward, 'from_name'):
-                        forward_info['from_name'] = message.forward.from_name
-                    if hasattr(message.forward, 'date'):
-                        forward_info['date'] = message.forward.date.strftime('%Y-%m-%d %H:%M:%S')
-                    message_info['forward_from'] = forward_info
-                
-                messages_data.append(message_info)
+                started = time.perf_counter()
+                record = self.build_message_record(message, user_name, me_name, senders)
+                self.attach_media(record, message, pending_media)
+                if collector:
+                    collector.add(record)
+                dialog_metrics.add('transform', time.perf_counter() - started)
+                messages_data.append(record)
                 
                 if message_count % 500 == 0:
                     print(f"📊 Загружено сообщений: {message_count}")
+            
+            if pending_media:
+                print(f"🖼 Ожидание загрузки медиафайлов: {len(pending_media)}")
+                media_paths = await self.media.wait_for(pending_media)
+                for record in messages_data:
+                    if record.media_key and not record.media_path:
+                        record.media_path = media_paths.get(record.media_key)
         
         except Exception as e:
+            if fetcher:
+                await fetcher.close()
+            self.metrics.finish_dialog(dialog_metrics, 'failed')
             print(f"❌ Ошибка при загрузке сообщений: {e}")
             return None
         
-        messages_data.sort(key=lambda x: x['date_timestamp'])
+        self.report_range_fetch(fetcher)
+        self.report_senders(senders)
+        export_info = self.build_export_info(user_entity, message_count)
+        if collector:
+            with dialog_metrics.stage('transform'):
+                statistics = collector.compute()
+            if statistics:
+                export_info['statistics'] = statistics
+        dialog_metrics.messages += message_count
+        self.metrics.finish_dialog(dialog_metrics)
         
         print(f"✅ Всего загружено сообщений: {message_count}")
         
         return {
-            'export_info': {
-                'exported_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'total_messages': message_count,
-                'dialog_participants': [
-                    {
-                        'name': self.get_user_display_name(self.me),
-                        'username': self.me.username,
-                        'user_id': self.me.id,
-                        'is_me': True
-                    },
-                    {
-                        'name': user_name,
-                        'username': user_entity.username,
-                        'user_id': user_entity.id,
-                        'is_me': False
-                    }
-                ]
-            },
+            'export_info': export_info,
             'messages': messages_data
         }
     
+    async def export_dialog_stream(self, user_entity, filename=None, fmt=EXPORT_FORMAT, incremental=True,
+                                   rate_limiter=None):
+        from telethon.errors import FloodWaitError
+        from telethon.utils import get_peer_id
+        from pipeline import paced, prefetch
+        
+        user_name = self.get_user_display_name(user_entity)
+        me_name = self.get_user_display_name(self.me)
+        dialog_id = get_peer_id(user_entity)
+        
+        checkpoint = self.usable_checkpoint(dialog_id, fmt, filename) if incremental else None
+        
+        export_info = self.build_export_info(user_entity, 0)
+        dialog_metrics = self.metrics.dialog(dialog_id, user_name)
+        dialog_metrics.start()
+        
+        sinks = []
+        
+        def save_checkpoint(state):
+            # extra sinks must hold everything the checkpoint claims is saved
+            for sink in sinks:
+                sink.flush()
+            self.checkpoints.update(dialog_id, status='in_progress', **state)
+        
+        if checkpoint:
+            filename = checkpoint['filename']
+            min_id = checkpoint['last_id'] or 0
+            writer = self.make_export_writer(filename, fmt, save_checkpoint)
+            # resume cuts the old footer off, the media it lists are still referenced
+            previous_footer = ExportReader(filename).footer() or {}
+            action = "Продолжение" if checkpoint.get('status') == 'in_progress' else "Дозагрузка"
+            print(f"\n📥 {action} экспорта диалога с: {user_name} (после сообщения #{min_id})")
+        else:
+            if not filename:
+                filename = self.make_export_filename(export_info, export_extension(fmt, EXPORT_COMPRESSION))
+            min_id = 0
+            writer = self.make_export_writer(filename, fmt, save_checkpoint)
+            previous_footer = {}
+            print(f"\n📥 Потоковый экспорт диалога с: {user_name}")
+        print("🔄 Загрузка сообщений...")
+        
+        fetched = 0
+        await self.open_bulk_session()
+        fetcher = self.make_range_fetcher(user_entity, rate_limiter)
+        try:
+            if checkpoint:
+                writer.resume(checkpoint)
+            else:
+                writer.open(export_info)
+                # checkpoint right away so a retry reuses this file
+                writer.flush()
+            start_count = writer.count
+            start_offset = writer.state()['offset']
+            sinks.extend(self.open_export_sinks(export_info, filename, checkpoint))
+            pending_media = []
+            senders = await self.make_sender_cache(user_entity, rate_limiter)
+            # only a file written from scratch is seen whole by this pass
+            collector = StatsCollector() if EXPORT_STATISTICS and not checkpoint else None
+            
+            # reverse=True yields oldest first, so the file is already in date order
+            # and min_id lets an archived dialog fetch only what is new
+            if fetcher:
+                messages = fetcher.messages(min_id)
+            else:
+                messages = self.client.iter_messages(user_entity, reverse=True, min_id=min_id)
+                if rate_limiter:
+                    messages = paced(messages, rate_limiter)
+            # fetch time measured below is then only the time the writer waits for the network
+            if PIPELINE_QUEUE_SIZE:
+                messages = prefetch(messages, PIPELINE_QUEUE_SIZE)
+            async for message in dialog_metrics.timed(messages):
+                started = time.perf_counter()
+                record = self.build_message_record(message, user_name, me_name, senders)
+                self.attach_media(record, message, pending_media)
+                if collector:
+                    collector.add(record)
+                transformed = time.perf_counter()
+                writer.write_message(record)
+                for sink in sinks:
+                    sink.write_message(record)
+                dialog_metrics.add('transform', transformed - started)
+                dialog_metrics.add('write', time.perf_counter() - transformed)
+                fetched += 1
+                
+                if writer.count % 500 == 0:
+                    print(f"📊 Загружено сообщений: {writer.count}")
+            
+            extra_footer = {}
+            media_paths = dict(previous_footer.get('media_paths') or {})
+            if pending_media:
+                print(f"🖼 Ожидание загрузки медиафайлов: {len(pending_media)}")
+                downloaded = await self.media.wait_for(pending_media)
+                media_paths.update((key, path) for key, path in downloaded.items() if path)
+            if media_paths:
+                extra_footer['media_paths'] = media_paths
+            if collector:
+                with dialog_metrics.stage('transform'):
+                    statistics = collector.compute()
+                if statistics:
+                    extra_footer['statistics'] = statistics
+            
+            with dialog_metrics.stage('write'):
+                footer = writer.close(extra_footer)
+                for sink in sinks:
+                    sink.close()
+        except FloodWaitError as e:
+            if fetcher:
+                await fetcher.close()
+            writer.abort()
+            self.close_export_sinks(sinks)
+            self.finish_dialog_metrics(dialog_metrics, writer, fetched, 'failed')
+            if rate_limiter:
+                rate_limiter.report_flood(e.seconds)
+                raise
+            print(f"❌ Ошибка при загрузке сообщений: {e}")
+            return None
+        except Exception as e:
+            if fetcher:
+                await fetcher.close()
+            writer.abort()
+            self.close_export_sinks(sinks)
+            self.finish_dialog_metrics(dialog_metrics, writer, fetched, 'failed')
+            print(f"❌ Ошибка при загрузке сообщений: {e}")
+            if writer.count:
+                print("💡 Экспорт будет продолжен с последней сохраненной точки при следующем запуске")
+            return None
+        
+        self.checkpoints.update(dialog_id, status='complete', completed_at=footer['completed_at'])
+        self.report_range_fetch(fetcher)
+        self.report_senders(senders)
+        new_messages = footer['total_messages'] - start_count
+        dialog_metrics.bytes_written += os.path.getsize(filename) - start_offset
+        self.finish_dialog_metrics(dialog_metrics, writer, fetched)
+        
+        print(f"✅ Новых сообщений: {new_messages}, всего в архиве: {footer['total_messages']}")
+        print(f"💾 Диалог сохранен в {fmt.upper()}: {filename}")
+        
+        export_info['total_messages'] = footer['total_messages']
+        return {
+            'filename': filename,
+            'export_info': export_info,
+            'export_footer': footer,
+            'new_messages': new_messages
+        }
+    
+    def usable_checkpoint(self, dialog_id, fmt=EXPORT_FORMAT, filename=None):
+        checkpoint = self.checkpoints.get(dialog_id)
+        # a file is only continued in the encoding it was started with
+        if checkpoint and (checkpoint.get('format') != fmt or checkpoint.get('compact', False) != COMPACT_JSON
+                           or checkpoint.get('compression') != EXPORT_COMPRESSION
+                           or not os.path.exists(checkpoint['filename'])
+                           or (filename and filename != checkpoint['filename'])):
+            return None
+        return checkpoint
+    
+    def make_export_writer(self, filename, fmt, on_flush):
+        return StreamingExportWriter(filename, fmt, on_flush=on_flush, compact=COMPACT_JSON,
+                                     compression=EXPORT_COMPRESSION, level=EXPORT_COMPRESSION_LEVEL,
+                                     fast=FAST_JSON_ENCODER)
+    
+    def make_range_fetcher(self, user_entity, rate_limiter=None):
+        from bulk_fetch import BulkFetcher
+        from range_fetch import ParallelRangeFetcher
+        
+        if self.bulk_limiter:
+            # a batch passes the same limiter, floods of any dialog slow down all
+            return BulkFetcher(self.takeout or self.client, user_entity, self.bulk_limiter)
+        if not PARALLEL_FETCH:
+            return None
+        return ParallelRangeFetcher(self.client, user_entity, concurrency=PARALLEL_FETCH_CONCURRENCY,
+                                    segment_messages=PARALLEL_SEGMENT_MESSAGES,
+                                    min_messages=PARALLEL_FETCH_MIN_MESSAGES, rate_limiter=rate_limiter)
+    
+    async def open_bulk_session(self):
+        # once per run: the limiter starts from the pace learned before, and
+        # the takeout session stays open for every dialog until close()
+        if not BULK_DOWNLOAD or self.bulk_limiter:
+            return
+        from bulk_fetch import RateProfile
+        
+        if TAKEOUT_EXPORT:
+            from telethon.errors import TakeoutInitDelayError
+            
+            # an unfinished takeout of a previous run is continued as is
+            scopes = {} if self.client.session.takeout_id else {
+                'users': True, 'chats': True, 'megagroups': EXPORT_GROUPS, 'channels': EXPORT_GROUPS}
+            try:
+                self.takeout = await self.client.takeout(finalize=True, **scopes).__aenter__()
+                print("📦 Takeout-сессия открыта: история загружается с повышенными лимитами")
+            except TakeoutInitDelayError as e:
+                print(f"⚠️ Telegram разрешит takeout-сессию через {e.seconds} сек. (подтвердите запрос "
+                      f"на экспорт данных в другом клиенте), пока загрузка идет обычной сессией")
+            except Exception as e:
+                print(f"⚠️ Takeout-сессия недоступна ({e}), загрузка идет обычной сессией")
+        self.rate_profile = RateProfile(RATE_PROFILE_FILE)
+        self.bulk_limiter = self.rate_profile.limiter(self.rate_profile_key())
+        state = self.bulk_limiter.state()
+        print(f"⚙️ Пакетная загрузка: {state['request_size']} сообщений на запрос, "
+              f"интервал {state['interval'] * 1000:.0f} мс")
+    
+    def rate_profile_key(self):
+        return f"{SESSION_NAME}:{'takeout' if self.takeout else 'session'}"
+    
+    def save_rate_profile(self, report=False):
+        if not self.bulk_limiter or not self.bulk_limiter.requests:
+            return
+        try:
+            self.rate_profile.update(self.rate_profile_key(), self.bulk_limiter)
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить профиль скорости: {e}")
+            return
+        if not report:
+            return
+        summary = self.bulk_limiter.summary()
+        print(f"⚙️ Запросов истории: {summary['requests']}, FloodWait: {summary['flood_wait_events']} "
+              f"({summary['flood_wait_seconds']} сек), интервал {summary['interval'] * 1000:.0f} мс, "
+              f"{summary['request_size']} сообщений на запрос -> {RATE_PROFILE_FILE}")
+    
+    def report_range_fetch(self, fetcher):
+        if fetcher and fetcher.parallel:
+            summary = fetcher.summary()
+            print(f"⚡ Параллельная загрузка: {summary['segments']} сегментов "
+                  f"({PARALLEL_FETCH_CONCURRENCY} одновременно), повторов после FloodWait: {summary['retries']}")
+    
+    async def make_sender_cache(self, entity, rate_limiter=None):
+        from senders import SenderCache, dialog_type
+        
+        # private dialogs need no lookups: a message is either mine or theirs
+        if dialog_type(entity) == 'private':
+            return None
+        senders = SenderCache(self.client, entity, capacity=SENDER_CACHE_SIZE, rate_limiter=rate_limiter)
+        if SENDER_PREFETCH_LIMIT:
+            await senders.load_participants(SENDER_PREFETCH_LIMIT)
+        return senders
+    
+    def report_senders(self, senders):
+        # channel posts are signed by the channel and never reach the cache
+        if senders and senders.hits + senders.misses:
+            summary = senders.summary()
+            print(f"👥 Отправителей: {summary['senders']}, имена из кэша: {summary['hits']}, "
+                  f"из сообщений: {summary['misses']}")
+    
+    def finish_dialog_metrics(self, dialog_metrics, writer, fetched, status='complete'):
+        # the write stage timed in the export loop includes the writer's
+        # encoding time, which is reported as serialize instead
+        dialog_metrics.add('serialize', writer.serialize_seconds)
+        dialog_metrics.add('write', -writer.serialize_seconds)
+        dialog_metrics.messages += fetched
+        self.metrics.finish_dialog(dialog_metrics, status)
+    
+    def open_export_sinks(self, export_info, filename, checkpoint=None):
+        sinks = []
+        if self.archive:
+            sinks.append(self.archive.sink(export_info))
+        
+        if COLUMNAR_EXPORT:
+            columns_path = export_stem(filename) + '.columns'
+            if not checkpoint:
+                sinks.append(ColumnarWriter(columns_path).open(export_info))
+            elif not os.path.exists(os.path.join(columns_path, 'meta.json')):
+                print(f"⚠️ {columns_path} не найден, колоночный экспорт пропущен "
+                      f"(создайте его заново: python columnar.py {filename})")
+            else:
+                try:
+                    sinks.append(ColumnarWriter(columns_path).resume(checkpoint['count']))
+                except ValueError as e:
+                    print(f"⚠️ {e}, колоночный экспорт пропущен "
+                          f"(создайте его заново: python columnar.py {filename})")
+        return sinks
+    
+    def close_export_sinks(self, sinks):
+        # whatever they hold past the checkpoint is overwritten on resume
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"⚠️ Ошибка закрытия {type(sink).__name__}: {e}")
+    
+    async def export_dialogs_batch(self, dialogs, concurrency=BATCH_CONCURRENCY, fmt=EXPORT_FORMAT,
+                                   render_html=BATCH_HTML):
+        from scheduler import BatchExportScheduler, RateLimiter
+        
+        print(f"\n🚀 Пакетный экспорт {len(dialogs)} диалогов ({concurrency} параллельно)...")
+        # opened before the workers start, so they share one takeout session
+        await self.open_bulk_session()
+        rate_limiter = self.bulk_limiter or RateLimiter()
+        scheduler = BatchExportScheduler(self, concurrency=concurrency, rate_limiter=rate_limiter, fmt=fmt,
+                                         render_html=render_html)
+        if self.media:
+            # file downloads have limits of their own, their floods say
+            # nothing about the pace of history requests
+            self.media.rate_limiter = RateLimiter() if self.bulk_limiter else rate_limiter
+        try:
+            summary = await scheduler.run(dialogs)
+        finally:
+            if self.media:
+                self.media.rate_limiter = None
+        
+        print("\n📊 ПАКЕТНЫЙ ЭКСПОРТ ЗАВЕРШЕН:")
+        print(f"   Диалогов экспортировано: {summary['dialogs_exported']} из {summary['dialogs_total']}")
+        if summary['failed']:
+            print(f"   Не удалось: {', '.join(summary['failed'])}")
+        print(f"   Новых сообщений: {summary['messages_new']} (всего в архивах: {summary['messages_total']})")
+        print(f"   Время: {summary['elapsed_seconds']:.1f} сек, {summary['messages_per_second']:.0f} сообщ/с")
+        print(f"   FloodWait: {summary['flood_wait_events']} раз, {summary['flood_wait_seconds']} сек")
+        if render_html:
+            print(f"   HTML страниц: {summary['html_rendered']}")
+        stages = self.metrics.totals()['stages']
+        print("   Этапы: " + ", ".join(f"{stage} {seconds:.1f} сек" for stage, seconds in stages.items()))
+        self.save_rate_profile()
+        self.write_metrics()
+        return summary
+    
+    def export_metrics(self, export_info):
+        other_user = next(p for p in export_info['dialog_participants'] if not p['is_me'])
+        return self.metrics.dialog(other_user['user_id'], other_user['name'])
+    
+    def write_metrics(self):
+        if METRICS_FILE:
+            self.metrics.write(METRICS_FILE)
+            print(f"📈 Метрики сохранены: {METRICS_FILE}")
+    
     def save_to_json(self, data, filename=None):
         if not filename:
-            other_user = next(p for p in data['export_info']['dialog_participants'] if not p['is_me'])
-            user_name = other_user['username'] or f"user_{other_user['user_id']}"
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"dialog_{user_name}_{timestamp}.json"
+            filename = self.make_export_filename(data['export_info'], export_extension('json', EXPORT_COMPRESSION))
         
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            dialog_metrics = self.export_metrics(data['export_info'])
+            with dialog_metrics.stage('serialize'):
+                # plain dicts: json's default= hook is much slower than converting up front
+                data = dict(data, messages=[as_dict(message) for message in data['messages']])
+                write_json_document(filename, data, compact=COMPACT_JSON, compression=EXPORT_COMPRESSION,
+                                    level=EXPORT_COMPRESSION_LEVEL, fast=FAST_JSON_ENCODER)
+            dialog_metrics.bytes_written += os.path.getsize(filename)
             print(f"💾 Диалог сохранен в JSON: {filename}")
             return filename
         except Exception as e:
             print(f"❌ Ошибка сохранения JSON: {e}")
             return None
     
+    def save_to_archive(self, data):
+        try:
+            sink = self.archive.sink(data['export_info'])
+            for message in data['messages']:
+                sink.write_message(message)
+            count = sink.close()
+            print(f"🗄 Сообщений добавлено в архив {self.archive.path}: {count}")
+            return count
+        except Exception as e:
+            print(f"❌ Ошибка записи в архив: {e}")
+            return None
+    
     def create_html_page(self, data, json_filename):
-        other_user = next(p for p in data['export_info']['dialog_participants'] if not p['is_me'])
-        me_user = next(p for p in data['export_info']['dialog_participants'] if p['is_me'])
-        
-        html_filename = json_filename.replace('.json', '.html')
-        
-        html_content = f"""<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Диалог с {other_user['name']}</title>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }}
-        
-        .container {{
-            max-width: 800px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            overflow: hidden;
-        }}
-        
-        .header {{
-            background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
-            color: white;
-            padding: 25px;
-            text-align: center;
-        }}
-        
-        .header h1 {{
-            font-size: 28px;
-            margin-bottom: 10px;
-        }}
-        
-        .header .info {{
-            opacity: 0.9;
-            font-size: 14px;
-        }}
-        
-        .stats {{
-            background: #f8f9fa;
-            padding: 20px;
-            border-bottom: 1px solid #e9ecef;
-            display: flex;
-            justify-content: space-around;
-            text-align: center;
-        }}
-        
-        .stat-item {{
-            flex: 1;
-        }}
-        
-        .stat-number {{
-            font-size: 24px;
-            font-weight: bold;
-            color: #4facfe;
-        }}
-        
-        .stat-label {{
-            font-size: 12px;
-            color: #6c757d;
-            text-transform: uppercase;
-        }}
-        
-        .messages {{
-            height: 60vh;
-            overflow-y: auto;
-            padding: 20px;
-            background: #f8f9fa;
-        }}
-        
-        .message {{
-            margin-bottom: 15px;
-            display: flex;
-            animation: fadeIn 0.3s ease-in;
-        }}
-        
-        @keyframes fadeIn {{
-            from {{ opacity: 0; transform: translateY(10px); }}
-            to {{ opacity: 1; transform: translateY(0); }}
-        }}
-        
-        .message.from-me {{
-            justify-content: flex-end;
-        }}
-        
-        .message.from-other {{
-            justify-content: flex-start;
-        }}
-        
-        .message-bubble {{
-            max-width: 70%;
-            padding: 12px 16px;
-            border-radius: 18px;
-            word-wrap: break-word;
-            position: relative;
-        }}
-        
-        .message.from-me .message-bubble {{
-            background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
-            color: white;
-            border-bottom-right-radius: 4px;
-        }}
-        
-        .message.from-other .message-bubble {{
-            background: white;
-            color: #333;
-            border: 1px solid #e9ecef;
-            border-bottom-left-radius: 4px;
-        }}
-        
-        .message-text {{
-            line-height: 1.4;
-            margin-bottom: 5px;
-        }}
-        
-        .message-meta {{
-            font-size: 11px;
-            opacity: 0.7;
-            text-align: right;
-        }}
-        
-        .message.from-other .message-meta {{
-            color: #6c757d;
-        }}
-        
-        .media-info {{
-            font-style: italic;
-            color: #6c757d;
-            font-size: 12px;
-            margin-bottom: 5px;
-        }}
-        
-        .forward-info {{
-            font-size: 12px;
-            opacity: 0.8;
-            margin-bottom: 5px;
-            padding: 5px;
-            background: rgba(255,255,255,0.1);
-            border-radius: 5px;
-        }}
-        
-        .date-separator {{
-            text-align: center;
-            margin: 30px 0 20px 0;
-            position: relative;
-        }}
-        
-        .date-separator::before {{
-            content: '';
-            position: absolute;
-            top: 50%;
-            left: 0;
-            right: 0;
-            height: 1px;
-            background: #dee2e6;
-        }}
-        
-        .date-separator span {{
-            background: #f8f9fa;
-            padding: 5px 15px;
-            color: #6c757d;
-            font-size: 12px;
-            font-weight: bold;
-        }}
-        
-        .search-box {{
-            padding: 15px 20px;
-            border-bottom: 1px solid #e9ecef;
-            background: white;
-        }}
-        
-        .search-input {{
-            width: 100%;
-            padding: 10px 15px;
-            border: 2px solid #e9ecef;
-            border-radius: 25px;
-            font-size: 14px;
-            outline: none;
-            transition: border-color 0.3s;
-        }}
-        
-        .search-input:focus {{
-            border-color: #4facfe;
-        }}
-        
-        .highlight {{
-            background: yellow;
-            padding: 2px 4px;
-            border-radius: 3px;
-        }}
-        
-        ::-webkit-scrollbar {{
-            width: 6px;
-        }}
-        
-        ::-webkit-scrollbar-track {{
-            background: #f1f1f1;
-        }}
-        
-        ::-webkit-scrollbar-thumb {{
-            background: #4facfe;
-            border-radius: 3px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>💬 Диалог с {other_user['name']}</h1>
-            <div class="info">
-                Экспортировано: {data['export_info']['exported_at']} | 
-                Участники: {me_user['name']} ↔ {other_user['name']}
-            </div>
-        </div>
-        
-        <div class="stats">
-            <div class="stat-item">
-                <div class="stat-number">{data['export_info']['total_messages']}</div>
-                <div class="stat-label">Сообщений</div>
-            </div>
-            <div class="stat-item">
-                <div class="stat-number">{len([m for m in data['messages'] if m['from_me']])}</div>
-                <div class="stat-label">От меня</div>
-            </div>
-            <div class="stat-item">
-                <div class="stat-number">{len([m for m in data['messages'] if not m['from_me']])}</div>
-                <div class="stat-label">От собеседника</div>
-            </div>
-        </div>
-        
-        <div class="search-box">
-            <input type="text" class="search-input" placeholder="🔍 Поиск по сообщениям..." id="searchInput">
-        </div>
-        
-        <div class="messages" id="messagesContainer">
-"""
-        
-        current_date = None
-        for message in data['messages']:
-            message_date = datetime.strptime(message['date'], '%Y-%m-%d %H:%M:%S').date()
-            
-            if current_date != message_date:
-                current_date = message_date
-                date_str = current_date.strftime('%d %B %Y')
-                months = {
-                    'January': 'января', 'February': 'февраля', 'March': 'марта',
-                    'April': 'апреля', 'May': 'мая', 'June': 'июня',
-                    'July': 'июля', 'August': 'августа', 'September': 'сентября',
-                    'October': 'октября', 'November': 'ноября', 'December': 'декабря'
-                }
-                for eng, rus in months.items():
-                    date_str = date_str.replace(eng, rus)
-                
-                html_content += f'''
-            <div class="date-separator">
-                <span>{date_str}</span>
-            </div>
-'''
-            
-            message_text = message['text'].replace('<', '&lt;').replace('>', '&gt;')
-            message_text = message_text.replace('\n', '<br>')
-            
-            time_str = datetime.strptime(message['date'], '%Y-%m-%d %H:%M:%S').strftime('%H:%M')
-            
-            message_class = 'from-me' if message['from_me'] else 'from-other'
-            
-            media_info = ''
-            if message['media_type'] and message['media_type'] != 'NoneType':
-                media_type_names = {
-                    'MessageMediaPhoto': '📷 Фото',
-                    'MessageMediaDocument': '📎 Файл',
-                    'MessageMediaVideo': '🎥 Видео',
-                    'MessageMediaAudio': '🎵 Аудио',
-                    'MessageMediaVoice': '🎤 Голосовое сообщение',
-                    'MessageMediaSticker': '🏷 Стикер',
-                    'MessageMediaGif': '🎬 GIF'
-                }
-                media_name = media_type_names.get(message['media_type'], message['media_type'])
-                if message['file_name']:
-                    media_info = f'<div class="media-info">{media_name}: {message["file_name"]}</div>'
-                else:
-                    media_info = f'<div class="media-info">{media_name}</div>'
-            
-            forward_info = ''
-            if message['forward_from']:
-                forward_info = '<div class="forward-info">📤 Переслано</div>'
-            
-            html_content += f'''
-            <div class="message {message_class}" data-text="{message_text.lower()}">
-                <div class="message-bubble">
-                    {forward_info}
-                    {media_info}
-                    <div class="message-text">{message_text}</div>
-                    <div class="message-meta">{time_str}</div>
-                </div>
-            </div>
-'''
-        
-        html_content += '''
-        </div>
-    </div>
-    
-    <script>
-        const searchInput = document.getElementById('searchInput');
-        const messagesContainer = document.getElementById('messagesContainer');
-        
-        searchInput.addEventListener('input', function() {
-            const searchTerm = this.value.toLowerCase();
-            const messages = messagesContainer.querySelectorAll('.message');
-            
-            messages.forEach(message => {
-                const text = message.getAttribute('data-text');
-                if (searchTerm === '' || text.includes(searchTerm)) {
-                    message.style.display = 'flex';
-                    
-                    if (searchTerm !== '') {
-                        const messageText = message.querySelector('.message-text');
-                        let html = messageText.innerHTML;
-                        
-                        html = html.replace(/<span class="highlight">(.*?)<\\/span>/gi, '$1');
-                        
-                        if (searchTerm.length > 0) {
-                            const regex = new RegExp(`(${searchTerm})`, 'gi');
-                            html = html.replace(regex, '<span class="highlight">$1</span>');
-                        }
-                        
-                        messageText.innerHTML = html;
-                    }
-                } else {
-                    message.style.display = 'none';
-                }
-            });
-        });
+        from metrics import files_size
         
-        messagesContainer.scrollTop = messagesContainer.scrollHeight;
-    </script>
-</body>
-</html>'''
+        html_filename = export_stem(json_filename) + '.html'
         
         try:
-            with open(html_filename, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+            chunk_size = HTML_CHUNK_SIZE if len(data['messages']) > PAGED_HTML_THRESHOLD else None
+            dialog_metrics = self.export_metrics(data['export_info'])
+            with dialog_metrics.stage('render'):
+                render_html_page(data['export_info'], data['messages'], html_filename, chunk_size=chunk_size,
+                                 media_paths=self.media.store.paths() if self.media else None)
+            dialog_metrics.bytes_written += files_size(output_files(html_filename))
             print(f"🌐 HTML страница создана: {html_filename}")
             return html_filename
         except Exception as e:
             print(f"❌ Ошибка создания HTML: {e}")
             return None
     
+    def create_html_from_export(self, export_filename):
+        html_filename = export_stem(export_filename) + '.html'
+        
+        try:
+            # media paths in the footer are relative to this process's directory
+            header, _, seconds = render_export(export_filename, html_filename, HTML_CHUNK_SIZE,
+                                               PAGED_HTML_THRESHOLD, self.media.store.paths() if self.media else None,
+                                               os.getcwd())
+            return self.finish_html(header, seconds, html_filename)
+        except Exception as e:
+            print(f"❌ Ошибка создания HTML: {e}")
+            return None
+    
+    async def render_html(self, export_filename):
+        import asyncio
+        from pipeline import render_pool
+        
+        # create_html_from_export in a worker, the event loop keeps fetching meanwhile
+        html_filename = export_stem(export_filename) + '.html'
+        
+        try:
+            if self.render_pool is None:
+                self.render_pool = render_pool(RENDER_WORKERS)
+            header, _, seconds = await asyncio.get_running_loop().run_in_executor(
+                self.render_pool, render_export, export_filename, html_filename, HTML_CHUNK_SIZE,
+                PAGED_HTML_THRESHOLD, self.media.store.paths() if self.media else None, os.getcwd())
+            return self.finish_html(header, seconds, html_filename)
+        except Exception as e:
+            print(f"❌ Ошибка создания HTML: {e}")
+            return None
+    
+    def finish_html(self, header, seconds, html_filename):
+        from metrics import files_size
+        
+        dialog_metrics = self.export_metrics(header)
+        dialog_metrics.add('render', seconds)
+        dialog_metrics.bytes_written += files_size(output_files(html_filename))
+        print(f"🌐 HTML страница создана: {html_filename}")
+        return html_filename
+    
     async def run(self):
         try:
             await self.authenticate()
             
+            force_refresh = False
             while True:
-                dialogs = await self.get_private_dialogs()
+                dialogs = await self.get_dialogs(force_refresh)
+                force_refresh = False
                 
                 if not dialogs:
                     print("❌ Личные диалоги не найдены!")
@@ -554,10 +788,22 @@ class TelegramDialogExporter:
                 self.display_dialogs(dialogs)
                 
                 try:
-                    choice = input("\nВведите номер диалога (или 'exit' для выхода): ").strip()
+                    choice = input("\nВведите номер диалога ('all' - экспорт всех, 'r' - обновить список, "
+                                   "'exit' - выход): ").strip()
                     if choice.lower() == 'exit':
                         break
                     
+                    if choice.lower() == 'r':
+                        force_refresh = True
+                        continue
+                    
+                    if choice.lower() == 'all':
+                        await self.export_dialogs_batch(dialogs)
+                        continue_choice = input("\nПродолжить работу? (y/n): ").strip().lower()
+                        if continue_choice != 'y':
+                            break
+                        continue
+                    
                     dialog_number = int(choice)
                     if 1 <= dialog_number <= len(dialogs):
                         selected_dialog = dialogs[dialog_number - 1]
@@ -571,21 +817,27 @@ class TelegramDialogExporter:
                     continue
                 
                 print("\n🚀 Начинаем экспорт диалога...")
-                dialog_data = await self.export_dialog(selected_dialog['entity'])
+                if STREAM_EXPORT:
+                    result = await self.export_dialog_stream(selected_dialog['entity'])
+                    json_filename = result['filename'] if result else None
+                    html_filename = await self.render_html(json_filename) if json_filename else None
+                    total_messages = result['export_info']['total_messages'] if result else 0
+                else:
+                    dialog_data = await self.export_dialog(selected_dialog['entity'])
+                    json_filename = self.save_to_json(dialog_data) if dialog_data else None
+                    if dialog_data and self.archive:
+                        self.save_to_archive(dialog_data)
+                    html_filename = self.create_html_page(dialog_data, json_filename) if json_filename else None
+                    total_messages = dialog_data['export_info']['total_messages'] if dialog_data else 0
                 
-                if dialog_data:
-                    json_filename = self.save_to_json(dialog_data)
-                    
-                    if json_filename:
-                        html_filename = self.create_html_page(dialog_data, json_filename)
-                        
-                        print(f"\n📊 ЭКСПОРТ ЗАВЕРШЕН:")
-                        print(f"   Диалог с: {selected_dialog['name']}")
-                        print(f"   Сообщений: {dialog_data['export_info']['total_messages']}")
-                        print(f"   JSON файл: {json_filename}")
-                        if html_filename:
-                            print(f"   HTML страница: {html_filename}")
-                            print(f"   🌐 Откройте {html_filename} в браузере для просмотра")
+                if json_filename:
+                    print("\n📊 ЭКСПОРТ ЗАВЕРШЕН:")
+                    print(f"   Диалог с: {selected_dialog['name']}")
+                    print(f"   Сообщений: {total_messages}")
+                    print(f"   {EXPORT_FORMAT.upper() if STREAM_EXPORT else 'JSON'} файл: {json_filename}")
+                    if html_filename:
+                        print(f"   HTML страница: {html_filename}")
+                        print(f"   🌐 Откройте {html_filename} в браузере для просмотра")
                 
                 continue_choice = input("\nЭкспортировать еще один диалог? (y/n): ").strip().lower()
                 if continue_choice != 'y':
@@ -596,8 +848,75 @@ class TelegramDialogExporter:
         except Exception as e:
             print(f"\n❌ Неожиданная ошибка: {e}")
         finally:
-            await self.client.disconnect()
-            print("👋 Отключение от Telegram")
+            await self.close()
+    
+    async def close(self):
+        if self.archive:
+            self.archive.close()
+        if self.media:
+            await self.media.close()
+            summary = self.media.summary()
+            print(f"🖼 Медиафайлов скачано: {summary['downloaded']}, "
+                  f"повторов пропущено: {summary['deduplicated']}, ошибок: {summary['failed']}")
+        if self.render_pool:
+            self.render_pool.shutdown()
+            self.render_pool = None
+        self.save_rate_profile(report=True)
+        if self.takeout:
+            try:
+                await self.takeout.__aexit__(None, None, None)
+            except Exception as e:
+                print(f"⚠️ Ошибка завершения takeout-сессии: {e}")
+            self.takeout = None
+        self.write_metrics()
+        self.metrics.close()
+        await self.client.disconnect()
+        print("👋 Отключение от Telegram")
+
+# python main.py <command> [arguments]: export (the default) and headless
+# connect to Telegram, the rest only read export files
+COMMANDS = {
+    'headless': ('headless', 'main_cli', 'неинтерактивный архиватор (cron, сервис)'),
+    'render': ('rerender', 'main', 'пересоздать HTML из готовых экспортов'),
+    'stats': ('dialog_stats', 'main', 'статистика переписки по экспортам'),
+    'search': ('archive_db', 'main', 'полнотекстовый поиск по архиву ARCHIVE_DB'),
+    'archive': ('archive_db', 'main', 'импорт экспортов в архив SQLite и его размер'),
+    'merge': ('merge', 'main', 'объединить пересекающиеся экспорты одного диалога'),
+    'serve': ('viewer', 'main', 'просмотр экспортов в браузере'),
+    'columns': ('columnar', 'main', 'колоночные .npy файлы из экспортов')
+}
+
+def command_arguments(command, arguments):
+    if command == 'search':
+        return ['--db', ARCHIVE_DB or 'archive.sqlite3', 'search', *arguments]
+    if command == 'archive' and ARCHIVE_DB:
+        # an explicit --db comes later and wins
+        return ['--db', ARCHIVE_DB, *arguments]
+    return arguments
+
+def cli(argv=None):
+    commands = "\n".join(f"  {name:<10} {help}" for name, (_, _, help) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description='Экспорт диалогов Telegram',
+        epilog=f"команды:\n  {'export':<10} интерактивный экспорт (по умолчанию)\n{commands}\n\n"
+               f"аргументы команды: python main.py <команда> --help",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('command', nargs='?', default='export', choices=['export', *COMMANDS],
+                        metavar='команда')
+    parser.add_argument('arguments', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    
+    if args.command == 'export':
+        if args.arguments:
+            parser.error(f"у export нет аргументов: {' '.join(args.arguments)}")
+        import asyncio
+        asyncio.run(main())
+        return
+    module_name, function, _ = COMMANDS[args.command]
+    # only the module of the command is imported, Telethon only by headless
+    module = importlib.import_module(module_name)
+    getattr(module, function)(command_arguments(args.command, args.arguments))
 
 async def main():
     print("🚀 TELEGRAM DIALOG EXPORTER")
@@ -613,4 +932,4 @@ async def main():
     await exporter.run()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    cli()
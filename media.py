@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+
+from telethon.errors import FloodWaitError
+
+# Telegram serves files in blocks aligned to 4 KB, so a partial download is
+# resumed from the last aligned offset
+_ALIGNMENT = 4096
+
+
+class MediaStore:
+    # content-addressed: objects/<sha256[:2]>/<sha256><ext>, plus an index from
+    # Telegram media key ('photo:<id>' / 'document:<id>') to the stored object
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.json')
+        self.index = {}
+        os.makedirs(os.path.join(root, 'partial'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+
+    def lookup(self, key):
+        entry = self.index.get(key)
+        return os.path.join(self.root, entry['path']) if entry else None
+
+    def paths(self):
+        return {key: os.path.join(self.root, entry['path']) for key, entry in self.index.items()}
+
+    def partial_path(self, key):
+        return os.path.join(self.root, 'partial', key.replace(':', '_') + '.part')
+
+    def add(self, key, partial_path, sha256, extension):
+        relative_path = os.path.join('objects', sha256[:2], sha256 + extension)
+        object_path = os.path.join(self.root, relative_path)
+        if os.path.exists(object_path):
+            # same bytes already stored under another Telegram id
+            os.remove(partial_path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(partial_path, object_path)
+        self.index[key] = {'path': relative_path, 'sha256': sha256, 'size': os.path.getsize(object_path)}
+        return object_path
+
+    def save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+
+def media_file(media):
+    # the Photo/Document object that iter_download accepts, or None for
+    # media without a file (geo, contacts, polls, web pages...)
+    if media is None:
+        return None
+    for attr in ('photo', 'document'):
+        file = getattr(media, attr, None)
+        if file is not None and getattr(file, 'id', None) is not None:
+            return file
+    return None
+
+
+def media_key(media):
+    file = media_file(media)
+    if file is None:
+        return None
+    kind = 'photo' if getattr(media, 'photo', None) is file else 'document'
+    return f'{kind}:{file.id}'
+
+
+def media_extension(media):
+    file = media_file(media)
+    if getattr(media, 'photo', None) is file:
+        return '.jpg'
+    for attr in getattr(file, 'attributes', None) or []:
+        file_name = getattr(attr, 'file_name', None)
+        if file_name and os.path.splitext(file_name)[1]:
+            return os.path.splitext(file_name)[1].lower()
+    mime_type = getattr(file, 'mime_type', None)
+    return (mimetypes.guess_extension(mime_type) if mime_type else None) or '.bin'
+
+
+class MediaDownloader:
+    def __init__(self, client, store, concurrency=4, rate_limiter=None, max_retries=5,
+                 request_size=512 * 1024):
+        self.client = client
+        self.store = store
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.request_size = request_size
+        self.downloaded = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.bytes_downloaded = 0
+        self._futures = {}
+        self._queue = None
+        self._workers = []
+
+    def submit(self, media):
+        # returns (key, path); path is None while the file is still queued
+        key = media_key(media)
+        if key is None:
+            return None, None
+        path = self.store.lookup(key)
+        if path:
+            self.deduplicated += 1
+            return key, path
+        if key in self._futures:
+            self.deduplicated += 1
+            return key, None
+
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._futures[key] = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((key, media))
+        return key, None
+
+    async def wait_for(self, keys):
+        # {key: stored path or None if the download failed}
+        futures = {key: self._futures[key] for key in keys if key in self._futures}
+        if futures:
+            await asyncio.gather(*futures.values())
+        return {key: future.result() for key, future in futures.items()}
+
+    async def close(self):
+        if self._queue is not None:
+            await self._queue.join()
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._queue = None
+            self._workers = []
+        self.store.save()
+
+    async def _worker(self):
+        while True:
+            key, media = await self._queue.get()
+            try:
+                path = await self._download(key, media)
+            except Exception as e:
+                self.failed += 1
+                print(f"⚠️ Не удалось скачать {key}: {e}")
+                path = None
+            finally:
+                self._queue.task_done()
+            self._futures[key].set_result(path)
+            if path and self.downloaded % 50 == 0:
+                self.store.save()
+
+    async def _download(self, key, media):
+        file = media_file(media)
+        partial_path = self.store.partial_path(key)
+
+        for attempt in range(self.max_retries + 1):
+            offset = 0
+            hasher = hashlib.sha256()
+            if os.path.exists(partial_path):
+                offset = os.path.getsize(partial_path) // _ALIGNMENT * _ALIGNMENT
+                with open(partial_path, 'r+b') as f:
+                    f.truncate(offset)
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        hasher.update(block)
+
+            try:
+                with open(partial_path, 'ab') as f:
+                    if self.rate_limiter:
+                        await self.rate_limiter.acquire()
+                    async for chunk in self.client.iter_download(file, offset=offset,
+                                                                 request_size=self.request_size):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        self.bytes_downloaded += len(chunk)
+                        if self.rate_limiter:
+                            await self.rate_limiter.acquire()
+            except FloodWaitError as e:
+                # keep the partial file, the next attempt continues from it
+                if self.rate_limiter:
+                    self.rate_limiter.report_flood(e.seconds)
+                else:
+                    await asyncio.sleep(e.seconds)
+                continue
+
+            self.downloaded += 1
+            return self.store.add(key, partial_path, hasher.hexdigest(), media_extension(media))
+
+        raise RuntimeError(f"превышено число попыток ({self.max_retries}) из-за FloodWait")
+
+    def summary(self):
+        return {
+            'downloaded': self.downloaded,
+            'deduplicated': self.deduplicated,
+            'failed': self.failed,
+            'bytes_downloaded': self.bytes_downloaded
+        }
@@ -0,0 +1,247 @@
+import argparse
+import heapq
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+from checkpoints import CheckpointStore
+from export_io import COMPRESSIONS, EXPORT_FORMATS, ExportReader, StreamingExportWriter, export_extension
+from rerender import find_exports
+
+# Merges overlapping exports of the same dialog into one canonical archive:
+#   python merge.py exports/ --remove-inputs
+# Every export is already ordered by message id, so the files are k-way
+# merged as streams: memory holds one message per input, not the dialogs.
+# Of the copies of a message the one with the latest edit_date wins, ties
+# go to the most recent export.
+
+_TIMESTAMP_RE = re.compile(r'_\d{8}_\d{6}$')
+
+
+class MergeInput:
+    def __init__(self, filename):
+        self.filename = filename
+        self.reader = ExportReader(filename)
+        self.header = self.reader.header()
+        if self.header is None:
+            raise ValueError(f"{filename}: не найден заголовок export_info")
+        self.footer = self.reader.footer() or {}
+        self.size = os.path.getsize(filename)
+        other_user = next(p for p in self.header['dialog_participants'] if not p['is_me'])
+        self.dialog_id = other_user['user_id']
+        self.exported_at = self.header['exported_at']
+        # a topped-up export keeps the header of its first run, the footer
+        # says when it last got new messages
+        self.completed_at = self.footer.get('completed_at') or self.exported_at
+
+    def messages(self, rank):
+        # (id, edit_date, rank, position) sorts the copies of a message so
+        # that the last one of a run is the version to keep
+        previous_id = None
+        for position, message in enumerate(self.reader.iter_messages()):
+            message_id = message['id']
+            if previous_id is not None and message_id < previous_id:
+                raise ValueError(f"{self.filename}: сообщения не упорядочены по id "
+                                 f"(#{message_id} после #{previous_id})")
+            previous_id = message_id
+            yield message_id, message.get('edit_date') or '', rank, position, message
+
+
+class MergeStats:
+    def __init__(self):
+        self.files = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.messages_read = 0
+        self.messages_written = 0
+        self.edited_versions = 0
+
+    @property
+    def duplicates(self):
+        return self.messages_read - self.messages_written
+
+    @property
+    def reclaimed_bytes(self):
+        return self.input_bytes - self.output_bytes
+
+
+def merged_messages(inputs, stats):
+    # oldest export gets the lowest rank, so on equal edit dates the newest copy wins
+    streams = [merge_input.messages(rank) for rank, merge_input in enumerate(inputs)]
+    current = None
+    for item in heapq.merge(*streams):
+        stats.messages_read += 1
+        if current is not None and item[0] != current[0]:
+            yield current[-1]
+            current = None
+        if current is not None and item[1] != current[1]:
+            stats.edited_versions += 1
+        current = item
+    if current is not None:
+        yield current[-1]
+
+
+def output_filename(inputs, fmt, compression, output_dir=None):
+    # dialog_<name>_<time>.<ext> like main.py, named after the newest export
+    newest = inputs[-1].filename
+    stem = os.path.basename(newest).split('.', 1)[0]
+    stem = _TIMESTAMP_RE.sub('', stem)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"{stem}_{timestamp}.{export_extension(fmt, compression)}"
+    return os.path.join(output_dir or os.path.dirname(newest), filename)
+
+
+def rebased_media_paths(merge_input, filename):
+    # media paths are relative to the directory of their export; the merged
+    # archive may be written elsewhere (--output-dir)
+    input_dir = os.path.dirname(os.path.abspath(merge_input.filename))
+    output_dir = os.path.dirname(os.path.abspath(filename))
+    media_paths = {}
+    for key, path in (merge_input.footer.get('media_paths') or {}).items():
+        if not os.path.isabs(path):
+            path = os.path.join(input_dir, path)
+            try:
+                path = os.path.relpath(path, output_dir)
+            except ValueError:
+                # another drive on Windows: only an absolute path reaches it
+                pass
+        media_paths[key] = path
+    return media_paths
+
+
+def merge_exports(inputs, filename, fmt, compact=False, compression=None, level=None, checkpoints=None):
+    # inputs are ordered oldest export first
+    stats = MergeStats()
+    stats.files = len(inputs)
+    stats.input_bytes = sum(merge_input.size for merge_input in inputs)
+
+    # the newest export has the current names, media paths override older ones
+    export_info = dict(inputs[-1].header)
+    export_info['total_messages'] = 0
+    # statistics of one input do not describe the merged archive
+    export_info.pop('statistics', None)
+    media_paths = {}
+    for merge_input in inputs:
+        media_paths.update(rebased_media_paths(merge_input, filename))
+
+    last_state = {}
+    writer = StreamingExportWriter(filename, fmt, on_flush=last_state.update, compact=compact,
+                                   compression=compression, level=level)
+    with writer:
+        writer.open(export_info)
+        for message in merged_messages(inputs, stats):
+            writer.write_message(message)
+        extra_footer = {'merged_from': [os.path.basename(merge_input.filename) for merge_input in inputs]}
+        if media_paths:
+            extra_footer['media_paths'] = media_paths
+        footer = writer.close(extra_footer)
+
+    stats.messages_written = footer['total_messages']
+    stats.output_bytes = os.path.getsize(filename)
+    if checkpoints is not None:
+        # the next incremental export continues the canonical archive
+        checkpoints.update(inputs[-1].dialog_id, status='complete', completed_at=footer['completed_at'],
+                           **last_state)
+    return stats
+
+
+def group_by_dialog(filenames):
+    groups = {}
+    for filename in filenames:
+        try:
+            merge_input = MergeInput(filename)
+        except Exception as e:
+            print(f"⚠️ {filename} пропущен: {e}")
+            continue
+        groups.setdefault(merge_input.dialog_id, []).append(merge_input)
+    for inputs in groups.values():
+        inputs.sort(key=lambda merge_input: merge_input.completed_at)
+    return groups
+
+
+def format_size(size):
+    return f"{size / (1024 * 1024):.1f} МБ"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Объединить пересекающиеся экспорты одного диалога в один архив')
+    parser.add_argument('paths', nargs='+', help='файлы экспорта или каталоги с ними')
+    parser.add_argument('--dialog', type=int, help='только диалог с этим id')
+    parser.add_argument('--output', help='имя итогового файла (если диалог один)')
+    parser.add_argument('--output-dir', help='каталог для итоговых файлов (по умолчанию рядом с новейшим экспортом)')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help='формат архива (по умолчанию как у новейшего экспорта)')
+    parser.add_argument('--compact', action='store_true', help='JSON без отступов')
+    parser.add_argument('--compression', choices=['none', *COMPRESSIONS],
+                        help='сжатие архива (по умолчанию как у новейшего экспорта)')
+    parser.add_argument('--level', type=int, help='уровень сжатия')
+    parser.add_argument('--checkpoints', help='файл контрольных точек main.py: продолжать экспорт в новый архив')
+    parser.add_argument('--remove-inputs', action='store_true', help='удалить исходные файлы после объединения')
+    args = parser.parse_args(argv)
+
+    groups = group_by_dialog(find_exports(args.paths))
+    if args.dialog is not None:
+        groups = {dialog_id: inputs for dialog_id, inputs in groups.items() if dialog_id == args.dialog}
+    if not groups:
+        print("❌ Экспорты не найдены")
+        sys.exit(1)
+    if args.output and len(groups) > 1:
+        print(f"❌ --output задан, но найдено диалогов: {len(groups)} (укажите --dialog)")
+        sys.exit(1)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    checkpoints = CheckpointStore(args.checkpoints) if args.checkpoints else None
+
+    total = MergeStats()
+    failed = []
+    for dialog_id, inputs in groups.items():
+        if len(inputs) < 2:
+            continue
+        newest = inputs[-1]
+        fmt = args.format or newest.reader.fmt
+        compression = newest.reader.compression if args.compression is None else \
+            (None if args.compression == 'none' else args.compression)
+        filename = args.output or output_filename(inputs, fmt, compression, args.output_dir)
+        name = next(p for p in newest.header['dialog_participants'] if not p['is_me'])['name']
+
+        print(f"\n🔀 {name}: объединение {len(inputs)} экспортов -> {filename}")
+        started = time.perf_counter()
+        try:
+            stats = merge_exports(inputs, filename, fmt, args.compact, compression, args.level, checkpoints)
+        except Exception as e:
+            print(f"❌ Ошибка объединения: {e}")
+            if os.path.exists(filename):
+                os.remove(filename)
+            failed.append(dialog_id)
+            continue
+
+        print(f"✅ Сообщений: {stats.messages_written} (прочитано {stats.messages_read}, "
+              f"дубликатов {stats.duplicates}, из них с другой версией правки {stats.edited_versions})")
+        print(f"💾 {format_size(stats.input_bytes)} -> {format_size(stats.output_bytes)} "
+              f"за {time.perf_counter() - started:.1f} сек")
+        if args.remove_inputs:
+            for merge_input in inputs:
+                if os.path.abspath(merge_input.filename) != os.path.abspath(filename):
+                    os.remove(merge_input.filename)
+
+        total.files += stats.files
+        total.input_bytes += stats.input_bytes
+        total.output_bytes += stats.output_bytes
+        total.messages_read += stats.messages_read
+        total.messages_written += stats.messages_written
+        total.edited_versions += stats.edited_versions
+
+    if not total.files and not failed:
+        print("✅ Пересекающихся экспортов нет, объединять нечего")
+        return
+    action = "Освобождено" if args.remove_inputs else "Можно освободить, удалив исходные файлы"
+    print(f"\n📊 Объединено файлов: {total.files}, дубликатов удалено: {total.duplicates}")
+    print(f"🧹 {action}: {format_size(total.reclaimed_bytes)} "
+          f"({total.reclaimed_bytes / total.input_bytes * 100 if total.input_bytes else 0:.0f}%)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
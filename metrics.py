@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from telethon.errors import FloodWaitError
+
+STAGES = ('fetch', 'transform', 'serialize', 'render', 'write')
+
+# Telethon sleeps through short flood waits itself and only logs them
+_TELETHON_FLOOD_LOGGER = 'telethon.client.users'
+
+
+def _read_status(field):
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss():
+    return _read_status('VmRSS')
+
+
+def reset_peak_rss():
+    # Linux lets a process reset its own high-water mark; without that the
+    # peak of a stage also covers every stage before it
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    peak = _read_status('VmHWM')
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def files_size(paths):
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+class DialogMetrics:
+    def __init__(self, dialog_id, name=None):
+        self.dialog_id = dialog_id
+        self.name = name
+        self.stages = dict.fromkeys(STAGES, 0.0)
+        self.messages = 0
+        self.bytes_written = 0
+        self.status = 'running'
+        self.elapsed = 0.0
+        self._started = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self.status = 'running'
+
+    def add(self, stage, seconds):
+        self.stages[stage] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.stages[name] += time.perf_counter() - started
+
+    async def timed(self, iterable, stage='fetch'):
+        # time spent waiting for the next item of an async iterator, i.e.
+        # the network part of iter_messages without the loop body
+        iterator = iterable.__aiter__()
+        while True:
+            started = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.stages[stage] += time.perf_counter() - started
+                return
+            self.stages[stage] += time.perf_counter() - started
+            yield item
+
+    def messages_per_second(self):
+        return self.messages / self.elapsed if self.elapsed else None
+
+    def as_dict(self):
+        return {
+            'dialog_id': self.dialog_id,
+            'name': self.name,
+            'status': self.status,
+            'messages': self.messages,
+            'bytes_written': self.bytes_written,
+            'elapsed_seconds': round(self.elapsed, 4),
+            'messages_per_second': round(self.messages_per_second() or 0, 1),
+            'stages': {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+        }
+
+
+class _FloodLogHandler(logging.Handler):
+    def __init__(self, metrics):
+        super().__init__(logging.INFO)
+        self.metrics = metrics
+
+    def emit(self, record):
+        if isinstance(record.msg, str) and record.msg.startswith('Sleeping') and 'flood wait' in record.msg:
+            self.metrics.record_flood(record.args[1], slept=True)
+
+
+class MetricsRegistry:
+    def __init__(self, log_path=None):
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.dialogs = {}
+        self.api_requests = 0
+        self.api_errors = 0
+        self.api_seconds = 0.0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+        self.peak_rss_bytes = peak_rss()
+        self._started = time.perf_counter()
+        self._log = open(log_path, 'a', encoding='utf-8') if log_path else None
+        self._log_handler = None
+
+    def dialog(self, dialog_id, name=None):
+        # retries of the same dialog keep adding to one entry
+        entry = self.dialogs.get(dialog_id)
+        if entry is None:
+            entry = self.dialogs[dialog_id] = DialogMetrics(dialog_id, name)
+        return entry
+
+    def finish_dialog(self, entry, status='complete'):
+        if entry._started is not None:
+            entry.elapsed += time.perf_counter() - entry._started
+            entry._started = None
+        entry.status = status
+        self.peak_rss_bytes = max(self.peak_rss_bytes or 0, peak_rss() or 0)
+        self.log_event('dialog_finished', **entry.as_dict())
+
+    def record_flood(self, seconds, slept=False):
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+        self.log_event('flood_wait', seconds=seconds, slept=slept)
+
+    def instrument(self, client):
+        # count every API call: Telethon routes all requests through
+        # client._call, the offline fake client through client._request
+        attr = '_call' if hasattr(client, '_call') else '_request'
+        call = getattr(client, attr)
+
+        async def counted_call(*args, **kwargs):
+            self.api_requests += 1
+            started = time.perf_counter()
+            try:
+                return await call(*args, **kwargs)
+            except FloodWaitError as e:
+                self.api_errors += 1
+                self.record_flood(e.seconds)
+                raise
+            except Exception:
+                self.api_errors += 1
+                raise
+            finally:
+                self.api_seconds += time.perf_counter() - started
+
+        setattr(client, attr, counted_call)
+
+        if self._log_handler is None:
+            self._log_handler = _FloodLogHandler(self)
+            logger = logging.getLogger(_TELETHON_FLOOD_LOGGER)
+            logger.addHandler(self._log_handler)
+            if logger.getEffectiveLevel() > logging.INFO:
+                logger.setLevel(logging.INFO)
+        return client
+
+    def log_event(self, event, **fields):
+        if self._log:
+            fields = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'event': event, **fields}
+            self._log.write(json.dumps(fields, ensure_ascii=False) + '\n')
+            self._log.flush()
+
+    def totals(self):
+        stages = dict.fromkeys(STAGES, 0.0)
+        for entry in self.dialogs.values():
+            for stage, seconds in entry.stages.items():
+                stages[stage] += seconds
+        messages = sum(entry.messages for entry in self.dialogs.values())
+        elapsed = time.perf_counter() - self._started
+        return {
+            'dialogs': len(self.dialogs),
+            'dialogs_failed': sum(1 for entry in self.dialogs.values() if entry.status == 'failed'),
+            'messages': messages,
+            'bytes_written': sum(entry.bytes_written for entry in self.dialogs.values()),
+            'elapsed_seconds': round(elapsed, 4),
+            'messages_per_second': round(messages / elapsed, 1) if elapsed else None,
+            'api_requests': self.api_requests,
+            'api_errors': self.api_errors,
+            'api_seconds': round(self.api_seconds, 4),
+            'flood_waits': self.flood_waits,
+            'flood_wait_seconds': self.flood_wait_seconds,
+            'peak_rss_bytes': max(self.peak_rss_bytes or 0, peak_rss() or 0),
+            'stages': {stage: round(seconds, 4) for stage, seconds in stages.items()}
+        }
+
+    def snapshot(self):
+        return {
+            'started_at': self.started_at,
+            'written_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'totals': self.totals(),
+            'dialogs': [entry.as_dict() for entry in self.dialogs.values()]
+        }
+
+    def write(self, path):
+        # *.prom goes to the node_exporter textfile collector, anything else is JSON
+        if path.endswith('.prom'):
+            content = self.prometheus_text()
+        else:
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return path
+
+    def prometheus_text(self):
+        totals = self.totals()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP dialog_export_{name} {help_text}')
+            lines.append(f'# TYPE dialog_export_{name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'dialog_export_{name}{{{label_text}}} {value}' if label_text
+                             else f'dialog_export_{name} {value}')
+
+        metric('stage_seconds_total', 'counter', 'Time spent in each export stage.',
+               [({'stage': stage}, seconds) for stage, seconds in totals['stages'].items()])
+        metric('messages_total', 'counter', 'Messages processed, including ones fetched again after a retry.',
+               [({}, totals['messages'])])
+        metric('bytes_written_total', 'counter', 'Bytes written to export files.', [({}, totals['bytes_written'])])
+        metric('api_requests_total', 'counter', 'Telegram API requests.', [({}, totals['api_requests'])])
+        metric('api_errors_total', 'counter', 'Telegram API requests that failed.', [({}, totals['api_errors'])])
+        metric('api_seconds_total', 'counter', 'Time spent in Telegram API requests.', [({}, totals['api_seconds'])])
+        metric('flood_waits_total', 'counter', 'FloodWait errors received.', [({}, totals['flood_waits'])])
+        metric('flood_wait_seconds_total', 'counter', 'FloodWait seconds imposed by the server.',
+               [({}, totals['flood_wait_seconds'])])
+        metric('messages_per_second', 'gauge', 'Export throughput over the whole run.',
+               [({}, totals['messages_per_second'] or 0)])
+        metric('peak_rss_bytes', 'gauge', 'Resident memory high-water mark.', [({}, totals['peak_rss_bytes'])])
+        metric('dialogs_failed', 'gauge', 'Dialogs whose export failed.', [({}, totals['dialogs_failed'])])
+        metric('dialog_stage_seconds', 'gauge', 'Time spent in each stage per dialog.',
+               [({'dialog_id': entry.dialog_id, 'stage': stage}, round(seconds, 4))
+                for entry in self.dialogs.values() for stage, seconds in entry.stages.items()])
+        metric('dialog_messages', 'gauge', 'Messages exported per dialog.',
+               [({'dialog_id': entry.dialog_id}, entry.messages) for entry in self.dialogs.values()])
+        metric('dialog_bytes_written', 'gauge', 'Bytes written per dialog.',
+               [({'dialog_id': entry.dialog_id}, entry.bytes_written) for entry in self.dialogs.values()])
+        metric('last_run_timestamp_seconds', 'gauge', 'When these metrics were written.', [({}, int(time.time()))])
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        self.log_event('run_finished', **self.totals())
+        if self._log_handler is not None:
+            logging.getLogger(_TELETHON_FLOOD_LOGGER).removeHandler(self._log_handler)
+            self._log_handler = None
+        if self._log:
+            self._log.close()
+            self._log = None
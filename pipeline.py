@@ -0,0 +1,63 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+_DONE = object()
+
+
+class _Failure:
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+async def prefetch(iterable, maxsize=1000):
+    # Runs an async iterable in its own task up to maxsize items ahead of the
+    # consumer, so the next history request is already in flight while the
+    # previous chunk is being transformed and written. Items keep their
+    # order; an error of the source is raised at the point it occurred.
+    queue = asyncio.Queue(maxsize)
+
+    async def produce():
+        try:
+            async for item in iterable:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(_Failure(e))
+        else:
+            await queue.put(_DONE)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if type(item) is _Failure:
+                raise item.error
+            yield item
+    finally:
+        # a consumer that stops early also stops the source (and its finally)
+        producer.cancel()
+
+
+async def paced(iterable, rate_limiter, every=100):
+    # one limiter slot per history request: iter_messages fetches 100 per request
+    await rate_limiter.acquire()
+    count = 0
+    async for item in iterable:
+        yield item
+        count += 1
+        if count % every == 0:
+            await rate_limiter.acquire()
+
+
+def render_pool(workers):
+    # CPU-bound rendering goes to other processes; forkserver children only
+    # import what the task needs instead of inheriting the client's state
+    if not workers:
+        return None
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver') if 'forkserver' in methods else None
+    return ProcessPoolExecutor(workers, mp_context=context)
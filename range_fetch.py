@@ -0,0 +1,130 @@
+import asyncio
+from collections import deque
+
+from telethon.errors import FloodWaitError
+
+from scheduler import RateLimiter
+
+# iter_messages requests history in chunks of 100
+_CHUNK_SIZE = 100
+
+
+class ParallelRangeFetcher:
+    # Fetches one long dialog as consecutive id segments (min_id, max_id]
+    # downloaded concurrently over the same client and yielded oldest first,
+    # exactly like iter_messages(reverse=True, min_id=...) would.
+    #
+    # Message ids of private chats come from a per-account counter, so a
+    # dialog only owns a fraction of its id range. Segment spans are sized
+    # from the observed density to hold about segment_messages each.
+    def __init__(self, client, entity, concurrency=4, segment_messages=2000, min_messages=20000,
+                 rate_limiter=None, max_retries=5):
+        self.client = client
+        self.entity = entity
+        self.concurrency = concurrency
+        self.segment_messages = segment_messages
+        self.min_messages = min_messages
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.density = 1.0
+        self.segments = 0
+        self.retries = 0
+        self.parallel = False
+        self._pending = deque()
+        self._old_threshold = None
+
+    async def messages(self, min_id=0):
+        latest = await self.client.get_messages(self.entity, limit=1)
+        if not latest or latest[0].id <= min_id:
+            return
+        top_id = latest[0].id
+        total = getattr(latest, 'total', None)
+        if total:
+            self.density = min(1.0, max(total / top_id, 1e-6))
+
+        self.parallel = self.density * (top_id - min_id) >= self.min_messages
+        if not self.parallel:
+            # not worth splitting: one cursor, no upper bound
+            fetched = 0
+            await self.rate_limiter.acquire()
+            async for message in self.client.iter_messages(self.entity, reverse=True, min_id=min_id):
+                yield message
+                fetched += 1
+                if fetched % _CHUNK_SIZE == 0:
+                    await self.rate_limiter.acquire()
+            return
+
+        # floods go to the shared limiter, which pauses every segment,
+        # instead of each request sleeping on its own
+        self._old_threshold = self.client.flood_sleep_threshold
+        self.client.flood_sleep_threshold = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending = self._pending
+        lower = min_id
+        try:
+            while lower is not None or pending:
+                # segments complete out of order but are yielded in order; the
+                # window bounds how many finished ones wait in memory
+                while lower is not None and len(pending) < self.concurrency * 2:
+                    span = max(_CHUNK_SIZE, int(self.segment_messages / self.density))
+                    # the last segment is open-ended so messages sent during
+                    # the export are not missed
+                    upper = lower + span if lower + span < top_id else None
+                    pending.append(asyncio.create_task(self._fetch_segment(lower, upper, semaphore)))
+                    lower = upper
+                for message in await pending[0]:
+                    yield message
+                pending.popleft()
+        finally:
+            await self.close()
+
+    async def close(self):
+        # for a consumer that stops early: an abandoned generator would keep
+        # its segment tasks running until it is garbage collected
+        pending = list(self._pending)
+        self._pending.clear()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if self._old_threshold is not None:
+            self.client.flood_sleep_threshold = self._old_threshold
+            self._old_threshold = None
+
+    async def _fetch_segment(self, lower, upper, semaphore):
+        messages = []
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                # a retry continues after the last message already received
+                start = messages[-1].id if messages else lower
+                try:
+                    await self.rate_limiter.acquire()
+                    # wait_time=0: pacing is the rate limiter's job, Telethon
+                    # would otherwise sleep a second per chunk on long ranges
+                    async for message in self.client.iter_messages(
+                            self.entity, reverse=True, min_id=start, max_id=upper + 1 if upper else 0,
+                            wait_time=0):
+                        messages.append(message)
+                        if len(messages) % _CHUNK_SIZE == 0:
+                            await self.rate_limiter.acquire()
+                except FloodWaitError as e:
+                    self.retries += 1
+                    self.rate_limiter.report_flood(e.seconds)
+                    continue
+                break
+            else:
+                raise RuntimeError(f"превышено число попыток ({self.max_retries}) для сообщений "
+                                   f"#{lower}..{upper or 'конец'} из-за FloodWait")
+
+        self.segments += 1
+        if upper:
+            observed = max(len(messages), 1) / (upper - lower)
+            self.density = min(1.0, (self.density + observed) / 2)
+        return messages
+
+    def summary(self):
+        return {
+            'parallel': self.parallel,
+            'segments': self.segments,
+            'retries': self.retries,
+            'density': round(self.density, 6)
+        }
@@ -0,0 +1,109 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+
+# A fetched message keeps its native UTC timestamp; the 'YYYY-MM-DD HH:MM:SS'
+# strings of the export format are produced on demand from a memoized date
+# part and precomputed time parts instead of a strftime call per message.
+
+_DAY_SECONDS = 86400
+_MINUTES = tuple(f'{minute // 60:02d}:{minute % 60:02d}:' for minute in range(1440))
+_SECONDS = tuple(f'{second:02d}' for second in range(60))
+
+
+@lru_cache(maxsize=8192)
+def _day_prefix(day_number):
+    return datetime.fromtimestamp(day_number * _DAY_SECONDS, timezone.utc).strftime('%Y-%m-%d ')
+
+
+def format_timestamp(timestamp):
+    day_number, second_of_day = divmod(int(timestamp), _DAY_SECONDS)
+    minute, second = divmod(second_of_day, 60)
+    return _day_prefix(day_number) + _MINUTES[minute] + _SECONDS[second]
+
+
+class MessageRecord:
+    # behaves like the record dict for everything that reads it (record['text'],
+    # record.get('edit_date'), 'media_key' in record) and serializes to exactly
+    # the same JSON object through as_dict()
+    __slots__ = ('id', 'date_timestamp', 'from_me', 'sender_name', 'text', 'media_type', 'media_caption',
+                 'reply_to', 'forward_from', 'edit_timestamp', 'file_name', 'file_size', 'media_key',
+                 'media_path', '_date')
+
+    def __init__(self, id, date_timestamp, from_me, sender_name, text, media_type=None, media_caption='',
+                 reply_to=None, forward_from=None, edit_timestamp=None, file_name=None, file_size=None):
+        self.id = id
+        self.date_timestamp = date_timestamp
+        self.from_me = from_me
+        self.sender_name = sender_name
+        self.text = text
+        self.media_type = media_type
+        self.media_caption = media_caption
+        self.reply_to = reply_to
+        self.forward_from = forward_from
+        self.edit_timestamp = edit_timestamp
+        self.file_name = file_name
+        self.file_size = file_size
+        self.media_key = None
+        self.media_path = None
+        self._date = None
+
+    @property
+    def date(self):
+        if self._date is None:
+            self._date = format_timestamp(self.date_timestamp)
+        return self._date
+
+    @property
+    def edit_date(self):
+        return format_timestamp(self.edit_timestamp) if self.edit_timestamp is not None else None
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        if key in ('media_key', 'media_path'):
+            return self.media_key is not None
+        return key in _FIELDS
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return getattr(self, key, default)
+
+    def as_dict(self):
+        record = {
+            'id': self.id,
+            'date': self.date,
+            'date_timestamp': self.date_timestamp,
+            'from_me': self.from_me,
+            'sender_name': self.sender_name,
+            'text': self.text,
+            'media_type': self.media_type,
+            'media_caption': self.media_caption,
+            'reply_to': self.reply_to,
+            'forward_from': self.forward_from,
+            'edit_date': self.edit_date,
+            'file_name': self.file_name,
+            'file_size': self.file_size
+        }
+        if self.media_key is not None:
+            record['media_key'] = self.media_key
+            record['media_path'] = self.media_path
+        return record
+
+
+_FIELDS = frozenset(('id', 'date', 'date_timestamp', 'from_me', 'sender_name', 'text', 'media_type',
+                     'media_caption', 'reply_to', 'forward_from', 'edit_date', 'edit_timestamp',
+                     'file_name', 'file_size'))
+
+
+def as_dict(record):
+    # what json can serialize: MessageRecords are converted, dicts read back
+    # from an export pass through
+    return record.as_dict() if isinstance(record, MessageRecord) else record
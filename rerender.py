@@ -0,0 +1,120 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+
+from export_io import COMPRESSIONS, export_stem
+from html_render import render_export
+from main import HTML_CHUNK_SIZE, PAGED_HTML_THRESHOLD
+
+# Offline HTML re-render of existing exports, e.g. after a template change:
+#   python rerender.py exports/ dialog_alice_20240101_120000.json.gz --jobs 4
+# Exports are parsed incrementally by ExportReader, so memory stays bounded
+# per file, and files are rendered in parallel worker processes. Nothing
+# here imports Telethon: main.py is only read for its config.
+
+# directories are searched for what main.py writes: dialog_<name>_<time>.<ext>
+_EXPORT_EXTENSIONS = tuple(f'.{fmt}{suffix}' for fmt in ('json', 'ndjson')
+                           for suffix in ('', *(suffix for suffix, _ in COMPRESSIONS.values())))
+
+
+def find_exports(paths):
+    exports = []
+    for path in paths:
+        if not os.path.isdir(path):
+            exports.append(path)
+            continue
+        for root, _, files in os.walk(path):
+            exports.extend(os.path.join(root, name) for name in sorted(files)
+                           if name.startswith('dialog_') and name.endswith(_EXPORT_EXTENSIONS))
+    return exports
+
+
+def html_path(export_filename, output_dir=None):
+    html_filename = export_stem(export_filename) + '.html'
+    if output_dir:
+        html_filename = os.path.join(output_dir, os.path.basename(html_filename))
+    return html_filename
+
+
+def render_file(export_filename, html_filename, chunk_size, paged_threshold):
+    _, stats, seconds = render_export(export_filename, html_filename, chunk_size, paged_threshold)
+    return stats['total_messages'], seconds
+
+
+class _InlineExecutor:
+    # --jobs 1: same interface, no worker process
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пересоздать HTML из готовых экспортов без подключения к Telegram')
+    parser.add_argument('paths', nargs='+', help='файлы экспорта или каталоги с ними')
+    parser.add_argument('--output-dir', help='куда писать HTML (по умолчанию рядом с экспортом)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='параллельных процессов')
+    parser.add_argument('--changed', action='store_true', help='только если экспорт новее HTML')
+    parser.add_argument('--paged-threshold', type=int, default=PAGED_HTML_THRESHOLD,
+                        help='постраничный просмотр для диалогов больше этого числа сообщений')
+    parser.add_argument('--chunk-size', type=int, default=HTML_CHUNK_SIZE, help='сообщений на страницу')
+    args = parser.parse_args(argv)
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    exports = find_exports(args.paths)
+    if not exports:
+        print("❌ Экспорты не найдены")
+        sys.exit(1)
+    jobs = []
+    for export_filename in exports:
+        html_filename = html_path(export_filename, args.output_dir)
+        if args.changed and os.path.exists(html_filename) and \
+                os.path.getmtime(html_filename) >= os.path.getmtime(export_filename):
+            continue
+        jobs.append((export_filename, html_filename))
+    if not jobs:
+        print(f"✅ Все HTML актуальны ({len(exports)} экспортов)")
+        return
+    # largest first, so one big dialog does not finish alone at the end
+    jobs.sort(key=lambda job: os.path.getsize(job[0]), reverse=True)
+
+    print(f"🌐 Перерисовка {len(jobs)} файлов ({min(args.jobs, len(jobs))} процессов)...")
+    started = time.perf_counter()
+    messages = 0
+    failed = []
+    workers = min(args.jobs, len(jobs))
+    with ProcessPoolExecutor(workers) if workers > 1 else _InlineExecutor() as pool:
+        futures = {pool.submit(render_file, export_filename, html_filename, args.chunk_size, args.paged_threshold):
+                   (export_filename, html_filename) for export_filename, html_filename in jobs}
+        for future in as_completed(futures):
+            export_filename, html_filename = futures[future]
+            try:
+                count, seconds = future.result()
+            except Exception as e:
+                failed.append(export_filename)
+                print(f"❌ {export_filename}: {e}")
+                continue
+            messages += count
+            print(f"✅ {export_filename} -> {html_filename} ({count} сообщений, {seconds:.1f} сек)")
+
+    elapsed = time.perf_counter() - started
+    print(f"📊 Готово: {len(jobs) - len(failed)} из {len(jobs)}, {messages} сообщений за {elapsed:.1f} сек "
+          f"({messages / elapsed if elapsed else 0:.0f} сообщ/сек)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
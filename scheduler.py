@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+from telethon.errors import FloodWaitError
+
+
+class RateLimiter:
+    def __init__(self, min_interval=0.0, max_interval=5.0):
+        self.base_interval = min_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.flood_events = 0
+        self.flood_wait_total = 0
+        self.requests = 0
+        self._resume_at = 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # one gate shared by every worker: a FloodWait seen by any of them
+        # pauses all requests until the server-imposed wait has passed
+        async with self._lock:
+            wait = max(self._resume_at, self._next_slot) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.requests += 1
+            self._next_slot = time.monotonic() + self.min_interval
+            self.min_interval = max(self.base_interval, self.min_interval * 0.98)
+
+    def report_flood(self, seconds):
+        self.flood_events += 1
+        self.flood_wait_total += seconds
+        now = time.monotonic()
+        # workers that were already in flight hit the same flood one after
+        # another; only the first of them should slow the pace down
+        if now >= self._resume_at:
+            self.min_interval = min(self.max_interval, max(self.min_interval * 2, 0.05))
+            print(f"⏳ FloodWait: пауза всех загрузок на {seconds} сек.")
+        self._resume_at = max(self._resume_at, now + seconds)
+
+
+class BatchReport:
+    def __init__(self, dialogs_total):
+        self.dialogs_total = dialogs_total
+        self.exported = 0
+        self.failed = []
+        self.messages = 0
+        self.new_messages = 0
+        self.updated_files = []
+        self.html_rendered = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def throughput(self):
+        elapsed = self.elapsed()
+        return self.new_messages / elapsed if elapsed > 0 else 0.0
+
+    def summary(self, rate_limiter=None):
+        summary = {
+            'dialogs_total': self.dialogs_total,
+            'dialogs_exported': self.exported,
+            'dialogs_failed': len(self.failed),
+            'failed': self.failed,
+            'messages_total': self.messages,
+            'messages_new': self.new_messages,
+            'elapsed_seconds': round(self.elapsed(), 3),
+            'messages_per_second': round(self.throughput(), 1),
+            'updated_files': self.updated_files,
+            'html_rendered': self.html_rendered
+        }
+        if rate_limiter:
+            summary['api_requests'] = rate_limiter.requests
+            summary['flood_wait_events'] = rate_limiter.flood_events
+            summary['flood_wait_seconds'] = rate_limiter.flood_wait_total
+        return summary
+
+
+class BatchExportScheduler:
+    def __init__(self, exporter, concurrency=4, rate_limiter=None, max_retries=5, fmt=None, render_html=False):
+        self.exporter = exporter
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.fmt = fmt
+        self.render_html = render_html
+        self.report = None
+        self._renders = []
+
+    async def run(self, dialogs):
+        self.report = BatchReport(len(dialogs))
+        queue = asyncio.Queue()
+        for dialog in dialogs:
+            queue.put_nowait(dialog)
+
+        # let FloodWaitError reach the shared limiter instead of every
+        # request sleeping on its own while the others keep hammering
+        client = self.exporter.client
+        old_threshold = client.flood_sleep_threshold
+        client.flood_sleep_threshold = 0
+        try:
+            workers = min(self.concurrency, len(dialogs))
+            await asyncio.gather(*(self._worker(queue) for _ in range(workers)))
+            rendered = await asyncio.gather(*self._renders)
+            self.report.html_rendered = sum(1 for html_filename in rendered if html_filename)
+        finally:
+            client.flood_sleep_threshold = old_threshold
+            self.report.finished = time.monotonic()
+
+        return self.report.summary(self.rate_limiter)
+
+    async def _worker(self, queue):
+        while True:
+            try:
+                dialog = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._export_one(dialog)
+
+    async def _export_one(self, dialog):
+        kwargs = {'rate_limiter': self.rate_limiter}
+        if self.fmt:
+            kwargs['fmt'] = self.fmt
+
+        checkpoints = self.exporter.checkpoints
+        dialog_id = dialog['dialog_id']
+        resumed_messages = 0
+        for attempt in range(self.max_retries + 1):
+            before = (checkpoints.get(dialog_id) or {}).get('count', 0)
+            try:
+                result = await self.exporter.export_dialog_stream(dialog['entity'], **kwargs)
+            except FloodWaitError:
+                # the limiter is already paused; the checkpoint makes the retry resume
+                after = (checkpoints.get(dialog_id) or {}).get('count', 0)
+                resumed_messages += max(0, after - before)
+                continue
+            break
+        else:
+            result = None
+
+        report = self.report
+        if not result:
+            report.failed.append(dialog['name'])
+            print(f"❌ [{report.exported + len(report.failed)}/{report.dialogs_total}] {dialog['name']}: экспорт не удался")
+            return
+
+        report.exported += 1
+        report.messages += result['export_footer']['total_messages']
+        new_messages = result['new_messages'] + resumed_messages
+        report.new_messages += new_messages
+        if new_messages:
+            report.updated_files.append(result['filename'])
+            if self.render_html:
+                # renders in a worker process while this worker fetches the next dialog
+                self._renders.append(asyncio.ensure_future(self.exporter.render_html(result['filename'])))
+        print(f"✅ [{report.exported + len(report.failed)}/{report.dialogs_total}] {dialog['name']}: "
+              f"{new_messages} новых | всего {report.new_messages} сообщ., "
+              f"{report.throughput():.0f} сообщ/с")
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+
+from telethon.errors import FloodWaitError, RPCError
+from telethon.tl.types import Channel, Chat
+
+from pipeline import paced
+
+
+def display_name(entity):
+    if isinstance(entity, (Chat, Channel)):
+        return entity.title
+    if entity.first_name and entity.last_name:
+        return f"{entity.first_name} {entity.last_name}"
+    elif entity.first_name:
+        return entity.first_name
+    elif entity.username:
+        return f"@{entity.username}"
+    else:
+        return f"User {entity.id}"
+
+
+def dialog_type(entity):
+    if isinstance(entity, Channel):
+        return 'group' if entity.megagroup else 'channel'
+    if isinstance(entity, Chat):
+        return 'group'
+    return 'private'
+
+
+class SenderCache:
+    # Display names of group message senders by marked peer id, so that
+    # attributing a message is one dictionary lookup. Telethon delivers the
+    # sender entities of every history chunk together with it, so a miss
+    # is filled from message.sender without a request; small groups are
+    # loaded up front in pages of 200 participants, each page taking a slot
+    # of the batch's rate_limiter. Least recently seen senders are evicted
+    # beyond capacity.
+    def __init__(self, client, chat, capacity=50000, rate_limiter=None):
+        self.client = client
+        self.chat = chat
+        self.rate_limiter = rate_limiter
+        self.chat_name = display_name(chat)
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._names = OrderedDict()
+
+    def add(self, peer_id, entity):
+        self._names[peer_id] = display_name(entity)
+        self._names.move_to_end(peer_id)
+        if len(self._names) > self.capacity:
+            self._names.popitem(last=False)
+            self.evictions += 1
+
+    async def load_participants(self, limit):
+        # broadcast channels only list participants to admins, and their
+        # posts are signed by the channel itself anyway
+        if isinstance(self.chat, Channel) and not self.chat.megagroup:
+            return 0
+        count = 0
+        try:
+            # limit=0 only asks for the member count; larger groups fill the
+            # cache from the history chunks instead of listing members that
+            # may never have written anything
+            if self.rate_limiter:
+                await self.rate_limiter.acquire()
+            total = (await self.client.get_participants(self.chat, limit=0)).total
+            if total > min(limit, self.capacity):
+                return 0
+            participants = self.client.iter_participants(self.chat)
+            if self.rate_limiter:
+                participants = paced(participants, self.rate_limiter, every=200)
+            async for user in participants:
+                self.add(user.id, user)
+                count += 1
+        except FloodWaitError:
+            # the caller reports it to the limiter and retries the dialog
+            raise
+        except RPCError as e:
+            print(f"⚠️ Участники {self.chat_name} недоступны ({e}), имена берутся из сообщений")
+        return count
+
+    def name(self, message):
+        sender_id = message.sender_id
+        if sender_id is None or sender_id == getattr(message, 'chat_id', None):
+            # channel posts: the author signature when the channel shows one
+            return getattr(message, 'post_author', None) or self.chat_name
+        name = self._names.get(sender_id)
+        if name is not None:
+            self.hits += 1
+            self._names.move_to_end(sender_id)
+            return name
+        self.misses += 1
+        sender = message.sender
+        if sender is None:
+            # deleted accounts and senders the server did not include
+            return f"User {sender_id}"
+        self.add(sender_id, sender)
+        return self._names[sender_id]
+
+    def summary(self):
+        return {
+            'senders': len(self._names),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from export_io import ExportReader, StreamingExportWriter, export_extension, write_json_document, zstandard
+
+COMPRESSIONS = [None, 'gzip', pytest.param('zstd', marks=pytest.mark.skipif(
+    zstandard is None, reason="zstandard не установлен"))]
+# (format, compact)
+LAYOUTS = [('json', True), ('json', False), ('ndjson', False)]
+EXPORT_INFO = {'dialog_name': 'Тест', 'dialog_id': 42, 'exported_at': '2024-01-01 00:00:00', 'total_messages': 0}
+
+
+def make_messages(count):
+    return [{'id': i, 'date': '2024-01-01 00:00:00', 'date_timestamp': 1704067200 + i, 'from_me': i % 3 == 0,
+             'text': f"сообщение {i}"} for i in range(1, count + 1)]
+
+
+def check_export(filename, fmt, messages):
+    reader = ExportReader(filename)
+    assert reader.fmt == fmt
+    assert reader.header()['dialog_id'] == EXPORT_INFO['dialog_id']
+    assert list(reader.iter_messages()) == messages
+    footer = reader.footer()
+    assert footer['total_messages'] == len(messages)
+    assert footer['last_message_id'] == messages[-1]['id']
+    return reader
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+@pytest.mark.parametrize('fmt,compact', LAYOUTS)
+@pytest.mark.parametrize('count', [1, 50, 1200])
+def test_streaming_round_trip(tmp_path, fmt, compact, compression, count):
+    filename = str(tmp_path / f"dialog.{export_extension(fmt, compression)}")
+    messages = make_messages(count)
+    writer = StreamingExportWriter(filename, fmt=fmt, flush_every=500, compact=compact, compression=compression)
+    writer.open(EXPORT_INFO)
+    for message in messages:
+        writer.write_message(message)
+    writer.close()
+
+    reader = check_export(filename, fmt, messages)
+    assert reader.compression == compression
+    if compression is None:
+        assert [offset[2] for offset in reader.message_offsets()] == [m['id'] for m in messages]
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+@pytest.mark.parametrize('compact', [True, False])
+def test_buffered_round_trip(tmp_path, compact, compression):
+    filename = str(tmp_path / f"dialog.{export_extension('json', compression)}")
+    messages = make_messages(50)
+    footer = {'total_messages': len(messages), 'last_message_id': messages[-1]['id']}
+    write_json_document(filename, {'export_info': EXPORT_INFO, 'messages': messages, 'export_footer': footer},
+                        compact=compact, compression=compression)
+    check_export(filename, 'json', messages)
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+def test_ndjson_detected_without_suffix(tmp_path, compression):
+    filename = str(tmp_path / 'dialog.export')
+    messages = make_messages(10)
+    writer = StreamingExportWriter(filename, fmt='ndjson', compression=compression)
+    writer.open(EXPORT_INFO)
+    for message in messages:
+        writer.write_message(message)
+    writer.close()
+    check_export(filename, 'ndjson', messages)
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+@pytest.mark.parametrize('fmt,compact', LAYOUTS)
+def test_resume_appends_after_footer(tmp_path, fmt, compact, compression):
+    filename = str(tmp_path / f"dialog.{export_extension(fmt, compression)}")
+    messages = make_messages(120)
+    states = []
+    writer = StreamingExportWriter(filename, fmt=fmt, flush_every=50, on_flush=states.append, compact=compact,
+                                   compression=compression)
+    writer.open(EXPORT_INFO)
+    for message in messages[:100]:
+        writer.write_message(message)
+    writer.close()
+    finished = open(filename, 'rb').read()
+
+    # a top-up that fails before its first record leaves the file as it was
+    writer = StreamingExportWriter(filename, fmt=fmt, compact=compact, compression=compression)
+    writer.resume(states[-1])
+    writer.abort()
+    assert open(filename, 'rb').read() == finished
+
+    writer = StreamingExportWriter(filename, fmt=fmt, compact=compact, compression=compression)
+    writer.resume(states[-1])
+    for message in messages[100:]:
+        writer.write_message(message)
+    writer.close()
+    check_export(filename, fmt, messages)
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+@pytest.mark.parametrize('fmt,compact', LAYOUTS)
+def test_footer_larger_than_tail(tmp_path, fmt, compact, compression):
+    filename = str(tmp_path / f"dialog.{export_extension(fmt, compression)}")
+    messages = make_messages(600)
+    media_paths = {f'photo:{i}': f"media/objects/{hashlib.sha256(str(i).encode()).hexdigest()}.jpg"
+                   for i in range(5000)}
+    writer = StreamingExportWriter(filename, fmt=fmt, compact=compact, compression=compression)
+    writer.open(EXPORT_INFO)
+    for message in messages:
+        writer.write_message(message)
+    writer.close({'media_paths': media_paths})
+
+    footer = check_export(filename, fmt, messages).footer()
+    assert footer['media_paths'] == media_paths
+
+
+@pytest.mark.parametrize('compression', COMPRESSIONS)
+@pytest.mark.parametrize('fmt,compact', LAYOUTS)
+def test_interrupted_export_has_no_footer(tmp_path, fmt, compact, compression):
+    filename = str(tmp_path / f"dialog.{export_extension(fmt, compression)}")
+    writer = StreamingExportWriter(filename, fmt=fmt, flush_every=500, compact=compact, compression=compression)
+    writer.open(EXPORT_INFO)
+    for message in make_messages(5200):
+        writer.write_message(message)
+    writer.abort()
+    assert ExportReader(filename).footer() is None
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telethon.errors import FloodWaitError
+
+import main
+import scheduler
+from export_io import ExportReader
+from fake_client import FakeTelegramClient
+
+MESSAGES = 1200
+
+
+class FloodingClient(FakeTelegramClient):
+    # raises FloodWaitError once before each message id of flood_at, in
+    # every dialog: after the checkpoint at 500 messages, then after the one
+    # at 1000 of the resumed run
+    def __init__(self, flood_at=(700, 1100), **kwargs):
+        super().__init__(**kwargs)
+        self.pending_floods = {}
+        self.flood_at = flood_at
+
+    async def iter_messages(self, entity, *args, **kwargs):
+        pending = self.pending_floods.setdefault(entity.id, set(self.flood_at))
+        async for message in super().iter_messages(entity, *args, **kwargs):
+            if message.id in pending:
+                pending.discard(message.id)
+                self.floods += 1
+                raise FloodWaitError(request=None, capture=0)
+            yield message
+
+
+class QuickRateLimiter(scheduler.RateLimiter):
+    # still slows down on every flood, but not for seconds
+    def __init__(self):
+        super().__init__(max_interval=0.01)
+
+
+@pytest.fixture
+def batch_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scheduler, 'RateLimiter', QuickRateLimiter)
+    return tmp_path
+
+
+def run_batch(client, concurrency):
+    async def batch():
+        exporter = main.TelegramDialogExporter(client=client)
+        await exporter.authenticate()
+        dialogs = await exporter.get_dialogs()
+        # checkpointed message count at the start of every attempt
+        starts = {}
+        export_dialog_stream = exporter.export_dialog_stream
+
+        async def recorded(entity, **kwargs):
+            dialog_id = next(d['dialog_id'] for d in dialogs if d['entity'] is entity)
+            checkpoint = exporter.checkpoints.get(dialog_id) or {}
+            starts.setdefault(dialog_id, []).append(checkpoint.get('count', 0))
+            return await export_dialog_stream(entity, **kwargs)
+
+        exporter.export_dialog_stream = recorded
+        summary = await exporter.export_dialogs_batch(dialogs, concurrency=concurrency)
+        return exporter, dialogs, starts, summary
+
+    return asyncio.run(batch())
+
+
+def test_floods_are_retried_from_checkpoint(batch_dir):
+    client = FloodingClient(dialogs=3, messages_per_dialog=MESSAGES, seed=1)
+    exporter, dialogs, starts, summary = run_batch(client, concurrency=2)
+
+    assert len(dialogs) == 3
+    assert summary['dialogs_exported'] == 3
+    assert summary['dialogs_failed'] == 0
+    assert summary['flood_wait_events'] == client.floods == 6
+    assert summary['messages_new'] == 3 * MESSAGES
+    for dialog in dialogs:
+        # the first attempt starts from scratch, each retry from the last checkpoint
+        assert starts[dialog['dialog_id']] == [0, 500, 1000]
+        checkpoint = exporter.checkpoints.get(dialog['dialog_id'])
+        assert checkpoint['status'] == 'complete'
+        reader = ExportReader(checkpoint['filename'])
+        ids = [message['id'] for message in reader.iter_messages()]
+        assert ids == list(range(1, MESSAGES + 1))
+        assert reader.footer()['total_messages'] == MESSAGES
+
+
+def test_dialog_fails_after_max_retries(batch_dir):
+    # more floods than the scheduler retries: the dialog is given up, its
+    # checkpoint stays for the next run
+    client = FloodingClient(dialogs=2, messages_per_dialog=MESSAGES, seed=1, flood_at=range(600, 1200, 100))
+    exporter, dialogs, starts, summary = run_batch(client, concurrency=1)
+
+    assert summary['dialogs_exported'] == 0
+    assert summary['dialogs_failed'] == 2
+    for dialog in dialogs:
+        assert len(starts[dialog['dialog_id']]) == 6
+        assert exporter.checkpoints.get(dialog['dialog_id'])['status'] == 'in_progress'
@@ -0,0 +1,420 @@
+import argparse
+import html
+import json
+import mimetypes
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+from export_io import ExportReader
+from html_render import (MEDIA_TYPE_NAMES, PAGE_END, PAGE_FOOT, PAGE_HEAD, STATS_SCRIPT, STATS_STYLE,
+                         MediaResolver, render_messages, script_json)
+from rerender import find_exports
+
+# Local viewer for exports too large for a static page:
+#   python viewer.py exports/ --port 8000
+# Each export gets a sidecar <export>.idx with the id, timestamp, side and
+# byte span of every message. The export itself is memory-mapped, and a page,
+# a date or the neighbourhood of a message id is answered by decoding only
+# the spans it covers. Only uncompressed exports can be served this way.
+
+_INDEX_MAGIC = b'TGIDX001'
+# magic, export size, export mtime_ns, message count
+_INDEX_HEADER = struct.Struct('<8sqqq')
+_INDEX_COLUMNS = (('ids', 'q'), ('timestamps', 'd'), ('starts', 'q'), ('ends', 'q'), ('from_me', 'B'))
+
+VIEWER_TOOLBAR = """<div class="search-box viewer-toolbar">
+            <button id="firstPage">⏮</button>
+            <button id="prevPage">◀</button>
+            <span id="pageInfo"></span>
+            <button id="nextPage">▶</button>
+            <button id="lastPage">⏭</button>
+            <input type="date" id="jumpDate" title="Перейти к дате">
+            <input type="number" id="jumpId" placeholder="id сообщения" title="Сообщения вокруг id">
+        </div>"""
+
+VIEWER_STYLE = """
+    <style>
+        .viewer-toolbar {
+            display: flex;
+            gap: 8px;
+            align-items: center;
+            justify-content: center;
+        }
+
+        .viewer-toolbar button, .viewer-toolbar input {
+            padding: 6px 10px;
+            border: 2px solid #e9ecef;
+            border-radius: 15px;
+            background: white;
+            font-size: 14px;
+        }
+
+        .viewer-toolbar input[type=number] {
+            width: 140px;
+        }
+
+        .message.target .message-bubble {
+            box-shadow: 0 0 0 3px #ffc107;
+        }
+    </style>
+"""
+
+# The page keeps one window of messages; every navigation asks the server
+# for the next window as pre-rendered fragments
+VIEWER_SCRIPT = r"""
+        const messagesContainer = document.getElementById('messagesContainer');
+        const pageInfo = document.getElementById('pageInfo');
+        let current = null;
+
+        async function load(query) {
+            const response = await fetch('messages?' + new URLSearchParams(query));
+            if (!response.ok) {
+                pageInfo.textContent = 'Ошибка: ' + (await response.text());
+                return;
+            }
+            current = await response.json();
+            messagesContainer.innerHTML = current.html;
+            pageInfo.textContent = current.total ?
+                `${current.start + 1}–${current.end} из ${current.total} (стр. ${current.page + 1} из ${current.pages})` :
+                'Нет сообщений';
+            const target = current.target === null ? null :
+                messagesContainer.querySelector(`[data-n="${current.target}"]`);
+            if (target) {
+                target.classList.add('target');
+                target.scrollIntoView({ block: 'center' });
+            } else {
+                messagesContainer.scrollTop = query.page === undefined || query.page === 'last' ? messagesContainer.scrollHeight : 0;
+            }
+        }
+
+        document.getElementById('firstPage').onclick = () => load({ page: 0 });
+        document.getElementById('prevPage').onclick = () => current && load({ page: Math.max(0, current.page - 1) });
+        document.getElementById('nextPage').onclick = () => current && load({ page: Math.min(current.pages - 1, current.page + 1) });
+        document.getElementById('lastPage').onclick = () => load({ page: 'last' });
+        document.getElementById('jumpDate').onchange = event => event.target.value && load({ date: event.target.value });
+        document.getElementById('jumpId').onchange = event => event.target.value && load({ id: event.target.value });
+        load({ page: 'last' });
+"""
+
+INDEX_PAGE = """<!DOCTYPE html>
+<html lang="ru">
+<head>
+    <meta charset="UTF-8">
+    <title>Архив диалогов</title>
+    <style>
+        body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; padding: 20px; }}
+        li {{ margin: 6px 0; }}
+        .info {{ color: #6c757d; font-size: 13px; }}
+    </style>
+</head>
+<body>
+    <h1>💬 Архив диалогов</h1>
+    <ul>
+{items}
+    </ul>
+</body>
+</html>"""
+
+
+class MessageIndex:
+    # Columns of the sidecar file: ids, timestamps, byte spans and sides of
+    # all messages in file order. It is rebuilt when the export changes
+    # size or mtime, e.g. after an incremental export appended to it
+    def __init__(self, filename):
+        self.filename = filename
+        self.path = filename + '.idx'
+        self.stat = None
+        for name, typecode in _INDEX_COLUMNS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_current(self):
+        stat = os.stat(self.filename)
+        return self.stat == (stat.st_size, stat.st_mtime_ns)
+
+    def load_or_build(self):
+        stat = os.stat(self.filename)
+        self.stat = (stat.st_size, stat.st_mtime_ns)
+        if not self._load():
+            self._build()
+        return self
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                magic, size, mtime_ns, count = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+                if magic != _INDEX_MAGIC or (size, mtime_ns) != self.stat:
+                    return False
+                for name, typecode in _INDEX_COLUMNS:
+                    column = array(typecode)
+                    column.fromfile(f, count)
+                    setattr(self, name, column)
+        except (OSError, EOFError, struct.error):
+            return False
+        return True
+
+    def _build(self):
+        print(f"🔎 Индексирование {self.filename}...")
+        columns = [array(typecode) for _, typecode in _INDEX_COLUMNS]
+        ids, timestamps, starts, ends, from_me = columns
+        for start, end, message_id, timestamp, is_from_me in ExportReader(self.filename).message_offsets():
+            ids.append(message_id)
+            timestamps.append(timestamp)
+            starts.append(start)
+            ends.append(end)
+            from_me.append(is_from_me)
+        for (name, _), column in zip(_INDEX_COLUMNS, columns):
+            setattr(self, name, column)
+
+        # a temp file first, so a reader never sees a half-written index
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, *self.stat, len(self.ids)))
+            for column in columns:
+                column.tofile(f)
+        os.replace(tmp_path, self.path)
+        print(f"✅ {self.filename}: {len(self.ids)} сообщений в индексе")
+
+    def find_id(self, message_id):
+        # ordinal of the message, or of the first one after it if it is missing
+        return min(bisect_left(self.ids, message_id), len(self.ids) - 1)
+
+    def find_timestamp(self, timestamp):
+        return min(bisect_left(self.timestamps, timestamp), len(self.ids) - 1)
+
+
+class DialogView:
+    def __init__(self, filename, page_size):
+        self.filename = filename
+        self.page_size = page_size
+        self.lock = threading.Lock()
+        self.media_files = set()
+        self.index = None
+        self._file = None
+        self._map = None
+        self._open()
+
+    def _open(self):
+        self.close()
+        # a topped-up export also has a new footer: its statistics and media
+        # paths are read again with the index
+        reader = ExportReader(self.filename)
+        if reader.compression:
+            raise ValueError("сжатые экспорты не поддерживаются, распакуйте файл")
+        self.export_info = reader.header()
+        footer = reader.footer() or {}
+        self.statistics = self.export_info.get('statistics') or footer.get('statistics')
+        self.other_user = next(p for p in self.export_info['dialog_participants'] if not p['is_me'])
+        self.me_user = next(p for p in self.export_info['dialog_participants'] if p['is_me'])
+        self.show_sender = self.export_info.get('dialog_type', 'private') != 'private'
+        self.media = _ServedMedia(footer.get('media_paths'), self.media_files,
+                                  os.path.dirname(os.path.abspath(self.filename)))
+        self.index = MessageIndex(self.filename).load_or_build()
+        self._file = open(self.filename, 'rb')
+        # an empty file cannot be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.index.stat[0] else None
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def window(self, query):
+        with self.lock:
+            if not self.index.is_current():
+                self._open()
+            index, media, show_sender = self.index, self.media, self.show_sender
+            total = len(index)
+            size = self.page_size
+            pages = max(1, (total + size - 1) // size)
+            target = None
+            if not total:
+                start = 0
+            elif 'id' in query:
+                target = index.find_id(int(query['id']))
+                start = max(0, target - size // 2)
+            elif 'date' in query:
+                day = datetime.strptime(query['date'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                target = index.find_timestamp(day.timestamp())
+                start = target // size * size
+            else:
+                page = pages - 1 if query.get('page', 'last') == 'last' else int(query['page'])
+                start = min(max(page, 0), pages - 1) * size
+            end = min(start + size, total)
+            # only the bytes of this window are read from the mapping
+            messages = [json.loads(self._map[index.starts[i]:index.ends[i]]) for i in range(start, end)]
+
+        fragments = render_messages(messages, media_resolver=media, show_sender=show_sender, start=start)
+        return {
+            'start': start,
+            'end': end,
+            'total': total,
+            'page': start // size,
+            'pages': pages,
+            'target': target,
+            'html': ''.join(fragments)
+        }
+
+    def page(self):
+        with self.lock:
+            if not self.index.is_current():
+                self._open()
+            # _open() replaces these together, the page is built from one export
+            index, export_info, statistics = self.index, self.export_info, self.statistics
+            other_user, me_user = self.other_user, self.me_user
+        from_me = index.from_me.count(1)
+        head = PAGE_HEAD.format(
+            other_name=html.escape(other_user['name']),
+            me_name=html.escape(me_user['name']),
+            exported_at=export_info['exported_at'],
+            total_messages=len(index),
+            messages_from_me=from_me,
+            messages_from_other=len(index) - from_me,
+            toolbar=VIEWER_TOOLBAR
+        )
+        parts = [head, PAGE_FOOT, VIEWER_STYLE]
+        if statistics:
+            parts.append(STATS_STYLE)
+        parts.append('\n    <script>\n')
+        parts.append(VIEWER_SCRIPT)
+        if statistics:
+            names = {'me': me_user['name'], 'other': other_user['name']}
+            parts.append(f'        const DIALOG_STATS = {script_json(statistics)};\n')
+            parts.append(f'        const STATS_NAMES = {script_json(names)};\n')
+            parts.append(f'        const MEDIA_TYPE_NAMES = {script_json(MEDIA_TYPE_NAMES)};\n')
+            parts.append(STATS_SCRIPT)
+        parts.append('    </script>')
+        parts.append(PAGE_END)
+        return ''.join(parts)
+
+
+class _ServedMedia(MediaResolver):
+    # media links point back at the server, which only hands out files
+    # that some rendered message referenced
+    def __init__(self, media_paths, files, media_base=None):
+        super().__init__(media_paths, None, media_base)
+        self.files = files
+
+    def href(self, message):
+        path = self.path(message)
+        if not path:
+            return None
+        self.files.add(path)
+        return html.escape('/media?path=' + quote(path))
+
+
+class ViewerHandler(BaseHTTPRequestHandler):
+    # set by serve(): list of DialogView
+    dialogs = []
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split('/') if part]
+        try:
+            if not parts:
+                if len(self.dialogs) == 1:
+                    return self._redirect('/dialog/0/')
+                return self._send(200, self._index_page(), 'text/html; charset=utf-8')
+            if parts[0] == 'media':
+                return self._send_media(query.get('path', ''))
+            if parts[0] == 'dialog' and len(parts) >= 2 and parts[1].isdigit() and int(parts[1]) < len(self.dialogs):
+                dialog = self.dialogs[int(parts[1])]
+                if len(parts) == 2:
+                    if not url.path.endswith('/'):
+                        return self._redirect(url.path + '/')
+                    return self._send(200, dialog.page(), 'text/html; charset=utf-8')
+                if parts[2:] == ['messages']:
+                    body = json.dumps(dialog.window(query), ensure_ascii=False)
+                    return self._send(200, body, 'application/json; charset=utf-8')
+            self._send(404, 'Не найдено', 'text/plain; charset=utf-8')
+        except ValueError as e:
+            self._send(400, str(e), 'text/plain; charset=utf-8')
+
+    def _index_page(self):
+        items = []
+        for number, dialog in enumerate(self.dialogs):
+            with dialog.lock:
+                name, total = dialog.other_user['name'], len(dialog.index)
+            items.append(f'        <li><a href="/dialog/{number}/">{html.escape(name)}</a> '
+                         f'<span class="info">{total} сообщений, '
+                         f'{html.escape(os.path.basename(dialog.filename))}</span></li>')
+        return INDEX_PAGE.format(items='\n'.join(items))
+
+    def _send_media(self, path):
+        if not any(path in dialog.media_files for dialog in self.dialogs) or not os.path.isfile(path):
+            return self._send(404, 'Не найдено', 'text/plain; charset=utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def _redirect(self, location):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.end_headers()
+
+    def _send(self, status, body, content_type):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(dialogs, host='127.0.0.1', port=8000):
+    ViewerHandler.dialogs = dialogs
+    server = ThreadingHTTPServer((host, port), ViewerHandler)
+    print(f"🌐 Просмотр архива: http://{host}:{server.server_port}/ (Ctrl+C для выхода)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Сервер остановлен")
+    finally:
+        server.server_close()
+        for dialog in dialogs:
+            dialog.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Локальный просмотр больших экспортов в браузере')
+    parser.add_argument('paths', nargs='+', help='файлы экспорта или каталоги с ними')
+    parser.add_argument('--host', default='127.0.0.1', help='адрес (по умолчанию только этот компьютер)')
+    parser.add_argument('--port', type=int, default=8000, help='порт')
+    parser.add_argument('--page-size', type=int, default=200, help='сообщений на страницу')
+    args = parser.parse_args(argv)
+
+    dialogs = []
+    for filename in find_exports(args.paths):
+        try:
+            dialogs.append(DialogView(filename, args.page_size))
+        except Exception as e:
+            print(f"⚠️ {filename} пропущен: {e}")
+    if not dialogs:
+        print("❌ Экспорты не найдены")
+        sys.exit(1)
+    serve(dialogs, args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()